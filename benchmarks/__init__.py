@@ -0,0 +1,3 @@
+"""
+Бенчмарки photo_editor. Запуск: ``python -m benchmarks.<модуль> --help``.
+"""
@@ -0,0 +1,179 @@
+"""
+Общие функции бенчмарков: синтетические изображения, замер времени, статистика,
+сохранение результатов в JSON и сравнение с базовыми результатами.
+"""
+import json
+import os
+import platform
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+# Имя размера -> (ширина, высота)
+SIZES = {
+    'vga': (640, 480),
+    'hd': (1280, 720),
+    'fullhd': (1920, 1080),
+    '12mp': (4000, 3000),
+    '24mp': (6000, 4000),
+    '50mp': (8192, 6144),
+}
+
+
+def parse_sizes(spec):
+    """
+    Разбирает список размеров: имена из SIZES или ШИРИНАxВЫСОТА через запятую.
+
+    :param spec: Например ``vga,fullhd,3000x2000``.
+    :type spec: str
+    :return: Список кортежей (имя, ширина, высота).
+    :rtype: list
+    :raises ValueError: Если размер не распознан.
+    """
+    sizes = []
+    for item in filter(None, (part.strip().lower() for part in spec.split(','))):
+        if item in SIZES:
+            sizes.append((item,) + SIZES[item])
+            continue
+        try:
+            width, height = (int(value) for value in item.split('x'))
+        except ValueError:
+            raise ValueError("Неизвестный размер: {}".format(item))
+        sizes.append((item, width, height))
+    return sizes
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Строит детерминированное изображение: плавные градиенты с небольшим шумом. Сжимается
+    примерно как фотография, а не как белый шум.
+
+    :rtype: numpy.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.dstack([(x * 255 // max(1, width - 1)), (y * 255 // max(1, height - 1)), ((x + y) // 8 % 256)])
+    return (image + rng.integers(0, 8, image.shape)).clip(0, 255).astype(np.uint8)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(function, warmup=2, repeat=10, budget=None, setup=None):
+    """
+    Замеряет время выполнения функции.
+
+    :param function: Функция без аргументов.
+    :type function: callable
+    :param warmup: Количество прогревочных запусков, не входящих в результат.
+    :type warmup: int
+    :param repeat: Количество замеров.
+    :type repeat: int
+    :param budget: Ограничение суммарного времени замеров в секундах; после трех замеров
+        измерение прекращается, если оно превышено. None - без ограничения.
+    :type budget: float
+    :param setup: Функция без аргументов, вызываемая перед каждым запуском вне замера.
+    :type setup: callable
+    :return: Список времен в секундах.
+    :rtype: list
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        function()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+        if budget is not None and len(times) >= 3 and sum(times) > budget:
+            break
+    return times
+
+
+def summarize(times, nbytes=None):
+    """
+    :param times: Времена в секундах.
+    :type times: list
+    :param nbytes: Объем обработанных данных за один запуск для расчета MB/s.
+    :type nbytes: int
+    :return: Словарь: runs, median_ms, p95_ms, min_ms, mb_per_s (по медиане).
+    :rtype: dict
+    """
+    median = statistics.median(times)
+    return {
+        'runs': len(times),
+        'median_ms': 1000 * median,
+        'p95_ms': 1000 * percentile(times, 0.95),
+        'min_ms': 1000 * min(times),
+        'mb_per_s': nbytes / 1024 / 1024 / median if nbytes and median > 0 else None,
+    }
+
+
+def environment():
+    """
+    :return: Описание окружения, в котором получены результаты.
+    :rtype: dict
+    """
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def save_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(payload, file, indent=2, ensure_ascii=False)
+
+
+def load_json(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(results, baseline, threshold=0.1, key=('case', 'size'), metric='median_ms'):
+    """
+    Сравнивает результаты с базовыми.
+
+    :param results: Текущие результаты, список словарей.
+    :type results: list
+    :param baseline: Базовые результаты, список словарей.
+    :type baseline: list
+    :param threshold: Допустимое относительное замедление (0.1 - на 10%).
+    :type threshold: float
+    :param key: Поля, по которым сопоставляются результаты.
+    :type key: tuple
+    :param metric: Сравниваемая метрика (больше - хуже).
+    :type metric: str
+    :return: Список словарей с полями key, baseline, current, ratio и status:
+        'regression', 'improvement' или 'ok'. Результаты без пары не включаются.
+    :rtype: list
+    """
+    reference = {tuple(item[field] for field in key): item for item in baseline}
+    rows = []
+    for item in results:
+        base = reference.get(tuple(item[field] for field in key))
+        if base is None or not base.get(metric):
+            continue
+        ratio = item[metric] / base[metric]
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        row = {field: item[field] for field in key}
+        row.update(baseline=base[metric], current=item[metric], ratio=ratio, status=status)
+        rows.append(row)
+    return rows
@@ -0,0 +1,154 @@
+"""
+Бенчмарк режимов истории изменений.
+
+Сравнивает хранение полных снимков в collections.deque (как было в MainWindow) с режимами
+модуля photo_editor.History: сжатые разности, выгрузка на диск и журнал операций с разными
+интервалами контрольных точек. Для каждого режима проигрывается одна и та же
+детерминированная сессия правок, затем все действия отменяются и повторяются.
+
+Запуск: ``python -m benchmarks.history --width 4000 --height 3000 --steps 50``
+"""
+import argparse
+from collections import deque
+import random
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.common import percentile, save_json, synthetic_image
+from photo_editor import Chain
+from photo_editor.History import create_history
+
+MODES = ('snapshot', 'compressed', 'disk', 'commands:1', 'commands:4', 'commands:8', 'commands:16')
+
+
+class SnapshotHistory:
+    """
+    Исходная схема MainWindow: две очереди полных снимков без ограничений.
+    """
+
+    def __init__(self):
+        self.history = deque()
+        self.future = deque()
+
+    @property
+    def nbytes(self):
+        return sum(image.nbytes for image in self.history) + sum(image.nbytes for image in self.future)
+
+    def push(self, image, action=None):
+        self.history.append(image)
+        self.future.clear()
+
+    def undo(self):
+        if len(self.history) > 1:
+            self.future.append(self.history.pop())
+            return self.history[-1]
+        return None
+
+    def redo(self):
+        if self.future:
+            image = self.future.pop()
+            self.history.append(image)
+            return image
+        return None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_session(width, height, steps, seed=0):
+    """
+    Строит детерминированную сессию: исходное изображение и список операций.
+
+    :return: Кортеж (изображение, список кортежей (имя операции, аргументы)).
+    :rtype: tuple
+    """
+    image = synthetic_image(width, height, seed)
+    chooser = random.Random(seed)
+    actions = []
+    for _ in range(steps):
+        name = chooser.choice(('red', 'green', 'blue', 'negative', 'brighten', 'brighten', 'circle', 'circle'))
+        if name == 'brighten':
+            args = (chooser.randint(1, 40),)
+        elif name == 'circle':
+            args = (chooser.randrange(width), chooser.randrange(height), chooser.randint(10, width // 4),
+                    chooser.randint(1, 10))
+        else:
+            args = ()
+        actions.append((name, args))
+    return image, actions
+
+
+def run_mode(mode, image, actions):
+    """
+    Проигрывает сессию в заданном режиме истории.
+
+    :return: Словарь с результатами.
+    :rtype: dict
+    """
+    history = SnapshotHistory() if mode == 'snapshot' else create_history(mode)
+    states = [image]
+    for name, args in actions:
+        states.append(Chain.run(states[-1], [(name, args)]))
+
+    started = time.perf_counter()
+    history.push(states[0])
+    for state, action in zip(states[1:], actions):
+        history.push(state, action)
+    history.flush()
+    push_seconds = time.perf_counter() - started
+    nbytes = history.nbytes
+
+    undo_times = []
+    for index in range(len(states) - 2, -1, -1):
+        started = time.perf_counter()
+        restored = history.undo()
+        undo_times.append(time.perf_counter() - started)
+        assert np.array_equal(restored, states[index]), "{}: undo вернул другие пиксели".format(mode)
+    redo_times = []
+    for index in range(1, len(states)):
+        started = time.perf_counter()
+        restored = history.redo()
+        redo_times.append(time.perf_counter() - started)
+        assert np.array_equal(restored, states[index]), "{}: redo вернул другие пиксели".format(mode)
+    history.close()
+
+    return {
+        'mode': mode,
+        'memory_mb': nbytes / 1024 / 1024,
+        'push_ms_per_step': 1000 * push_seconds / len(states),
+        'undo_ms_median': 1000 * statistics.median(undo_times),
+        'undo_ms_p95': 1000 * percentile(undo_times, 0.95),
+        'redo_ms_median': 1000 * statistics.median(redo_times),
+        'redo_ms_p95': 1000 * percentile(redo_times, 0.95),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов истории изменений")
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--modes', default=','.join(MODES), help="режимы через запятую")
+    parser.add_argument('--json', default=None, help="путь для сохранения результатов в JSON")
+    args = parser.parse_args(argv)
+
+    image, actions = make_session(args.width, args.height, args.steps)
+    results = []
+    print("{:<12} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        'mode', 'RAM, MB', 'push, ms', 'undo p50', 'undo p95', 'redo p50', 'redo p95'))
+    for mode in args.modes.split(','):
+        result = run_mode(mode, image, actions)
+        results.append(result)
+        print("{mode:<12} {memory_mb:>10.1f} {push_ms_per_step:>10.2f} {undo_ms_median:>10.2f} "
+              "{undo_ms_p95:>10.2f} {redo_ms_median:>10.2f} {redo_ms_p95:>10.2f}".format(**result))
+    if args.json:
+        save_json(args.json, {'width': args.width, 'height': args.height, 'steps': args.steps, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Бенчмарк операций класса Picture на изображениях разного размера.
+
+Для каждого размера (от VGA до 50 Мп) строится детерминированное синтетическое изображение
+и замеряются операции Picture (выделение каналов, негатив, яркость, круг, свернутая цепочка),
+преобразование в QPixmap/QImage, загрузка (полное декодирование и декодирование JPEG
+с уменьшением в 2, 4 и 8 раз) и сохранение (кодирование в памяти и атомарная запись) PNG,
+JPEG и WebP с разными параметрами кодировщиков; для сохранения выводится и размер файла.
+Для каждого случая выполняются прогревочные запуски и серия замеров; выводятся медиана,
+95-й процентиль и пропускная способность в MB/s (по объему пикселей изображения).
+
+Результаты можно сохранить в JSON и сравнить с базовыми; при замедлении больше порога
+бенчмарк завершается с кодом 1.
+
+Запуск: ``python -m benchmarks.operations --sizes vga,fullhd,12mp --json results.json``,
+сравнение: ``python -m benchmarks.operations --baseline results.json --threshold 0.1``
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.common import SIZES, compare, environment, load_json, measure, parse_sizes, save_json, \
+    summarize, synthetic_image
+
+# Бенчмарк работает без дисплея
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from photo_editor.Encoder import EncoderSettings, save_image  # noqa: E402
+from photo_editor.Picture import Picture  # noqa: E402
+
+
+def _picture_case(*steps):
+    """
+    Строит случай из последовательности вызовов методов Picture с материализацией результата.
+
+    :param steps: Кортежи (имя метода, функция image -> аргументы).
+    """
+    def case(picture, image, directory):
+        calls = [(method, arguments(image)) for method, arguments in steps]
+
+        def setup():
+            picture.picture = image
+
+        def run():
+            for method, arguments in calls:
+                getattr(picture, method)(*arguments)
+            return picture.picture
+        return setup, run
+    return case
+
+
+def _no_args(image):
+    return ()
+
+
+def _circle_args(image):
+    height, width = image.shape[:2]
+    return width // 2, height // 2, min(width, height) // 4, 5
+
+
+def _convert(function):
+    def case(picture, image, directory):
+        return None, lambda: function(image)
+    return case
+
+
+def _load(extension):
+    def case(picture, image, directory):
+        path = os.path.join(directory, 'load' + extension)
+        picture.picture = image
+        picture.save_picture(path)
+        return None, lambda: Picture().load_file(path)
+    return case
+
+
+def _decode_reduced(reduction):
+    """
+    Случай декодирования JPEG с уменьшением (быстрый показ большого изображения при загрузке).
+    """
+    def case(picture, image, directory):
+        path = os.path.join(directory, 'reduced.jpg')
+        save_image(image, path)
+        data = Picture.read_file(path)
+        return None, lambda: Picture.decode_image(data, reduction)
+    return case
+
+
+def _save(extension, **settings):
+    """
+    Случай сохранения; run.output - путь к файлу для замера его размера.
+    """
+    def case(picture, image, directory):
+        path = os.path.join(directory, 'save' + extension)
+        encoder_settings = EncoderSettings(**settings)
+
+        def run():
+            return save_image(image, path, encoder_settings)
+        run.output = path
+        return None, run
+    return case
+
+
+# Имя случая -> функция (picture, изображение, временный каталог) -> (setup или None, run)
+CASES = {
+    'show_red': _picture_case(('show_red', _no_args)),
+    'show_green': _picture_case(('show_green', _no_args)),
+    'show_blue': _picture_case(('show_blue', _no_args)),
+    'show_negative': _picture_case(('show_negative', _no_args)),
+    'brighten': _picture_case(('brighten', lambda image: (40,))),
+    'draw_circle': _picture_case(('draw_circle', _circle_args)),
+    'chain': _picture_case(('show_negative', _no_args), ('brighten', lambda image: (40,)),
+                           ('show_red', _no_args), ('draw_circle', _circle_args)),
+    'convert_cv_qt': _convert(Picture.convert_cv_qt),
+    'convert_cv_qimage': _convert(Picture.convert_cv_qimage),
+    'load_png': _load('.png'),
+    'load_jpg': _load('.jpg'),
+    'decode_jpg_reduced_2': _decode_reduced(2),
+    'decode_jpg_reduced_4': _decode_reduced(4),
+    'decode_jpg_reduced_8': _decode_reduced(8),
+    'save_png': _save('.png'),
+    'save_png_6': _save('.png', png_compression=6),
+    'save_jpg': _save('.jpg'),
+    'save_jpg_q85_progressive': _save('.jpg', jpeg_quality=85, jpeg_progressive=True),
+    'save_webp': _save('.webp', webp_quality=90),
+}
+
+
+def run_case(name, label, image, warmup, repeat, budget, directory):
+    """
+    Замеряет один случай на одном изображении.
+
+    :return: Словарь с результатами.
+    :rtype: dict
+    """
+    setup, run = CASES[name](Picture(), image, directory)
+    times = measure(run, warmup=warmup, repeat=repeat, budget=budget, setup=setup)
+    height, width = image.shape[:2]
+    result = {'case': name, 'size': label, 'width': width, 'height': height,
+              'megapixels': width * height / 1e6}
+    result.update(summarize(times, image.nbytes))
+    output = getattr(run, 'output', None)
+    if output is not None:
+        result['file_mb'] = os.path.getsize(output) / 1024 / 1024
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк операций Picture на изображениях разного размера")
+    parser.add_argument('--sizes', default=','.join(SIZES),
+                        help="размеры через запятую: {} или ШИРИНАxВЫСОТА".format(', '.join(SIZES)))
+    parser.add_argument('--cases', default=','.join(CASES), help="случаи через запятую")
+    parser.add_argument('--warmup', type=int, default=2, help="количество прогревочных запусков")
+    parser.add_argument('--repeat', type=int, default=10, help="количество замеров")
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help="ограничение времени замеров одного случая в секундах (не меньше трех замеров)")
+    parser.add_argument('--json', default=None, help="путь для сохранения результатов в JSON")
+    parser.add_argument('--baseline', default=None, help="JSON с базовыми результатами для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="допустимое замедление медианы относительно базовых результатов (0.1 - 10%%)")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = parse_sizes(args.sizes)
+    except ValueError as error:
+        parser.error(str(error))
+    cases = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        parser.error("неизвестные случаи: {}".format(', '.join(unknown)))
+
+    # QPixmap можно создавать только при существующем приложении Qt
+    app = QApplication.instance() or QApplication([])
+    results = []
+    print("{:<26} {:>8} {:>5} {:>10} {:>10} {:>10} {:>8}".format('case', 'size', 'runs', 'p50, ms', 'p95, ms', 'MB/s',
+                                                                  'file, MB'))
+    with tempfile.TemporaryDirectory(prefix='photo_editor_bench_') as directory:
+        for label, width, height in sizes:
+            image = synthetic_image(width, height)
+            for name in cases:
+                result = run_case(name, label, image, args.warmup, args.repeat, args.budget, directory)
+                results.append(result)
+                print("{case:<26} {size:>8} {runs:>5} {median_ms:>10.2f} {p95_ms:>10.2f} {mb_per_s:>10.1f} {:>8}".format(
+                    '{:.2f}'.format(result['file_mb']) if 'file_mb' in result else '', **result))
+            del image
+
+    if args.json:
+        save_json(args.json, {'environment': environment(), 'warmup': args.warmup, 'repeat': args.repeat,
+                              'results': results})
+    if args.baseline:
+        rows = compare(results, load_json(args.baseline)['results'], args.threshold)
+        regressions = [row for row in rows if row['status'] == 'regression']
+        print("\nСравнение с {} (порог {:.0%}):".format(args.baseline, args.threshold))
+        for row in rows:
+            if row['status'] != 'ok':
+                print("{status:<12} {case:<26} {size:>8} {baseline:>10.2f} -> {current:>10.2f} ms "
+                      "(x{ratio:.2f})".format(**row))
+        print("Сравнено: {}, замедлений: {}, ускорений: {}".format(
+            len(rows), len(regressions), sum(row['status'] == 'improvement' for row in rows)))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
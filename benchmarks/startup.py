@@ -0,0 +1,111 @@
+"""
+Бенчмарк холодного запуска: время от запуска процесса до первого показа главного окна.
+
+Каждый замер - отдельный процесс Python, который импортирует PyQt5 и photo_editor.mainWindow,
+создает MainWindow, показывает его и завершается после первого прохода цикла событий.
+Выводятся медиана и p95 полного времени (включая запуск интерпретатора) и его этапов,
+а также какие тяжелые модули (cv2, numpy, модули камеры и галереи) загружены к показу окна.
+
+Запуск: ``python -m benchmarks.startup --runs 10``; без дисплея - ``QT_QPA_PLATFORM=offscreen``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import percentile, save_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, загрузка которых при запуске отслеживается
+WATCHED_MODULES = ('numpy', 'cv2', 'photo_editor.CameraWindow', 'photo_editor.Capture',
+                   'photo_editor.FrameSource', 'photo_editor.GalleryPanel', 'photo_editor.Thumbnails',
+                   'photo_editor.FormBrightness', 'photo_editor.FormCircle')
+
+STAGES = ('import_qt', 'import_window', 'application', 'window', 'show')
+
+# Код дочернего процесса: печатает JSON с временами этапов в секундах и загруженными модулями
+CHILD = """
+import time
+started = time.perf_counter()
+import json, sys
+from PyQt5 import QtCore, QtWidgets
+imported_qt = time.perf_counter()
+from photo_editor.mainWindow import MainWindow
+imported_window = time.perf_counter()
+app = QtWidgets.QApplication(sys.argv)
+created_application = time.perf_counter()
+window = MainWindow()
+created_window = time.perf_counter()
+window.show()
+
+
+def shown():
+    finished = time.perf_counter()
+    print(json.dumps({
+        'import_qt': imported_qt - started,
+        'import_window': imported_window - imported_qt,
+        'application': created_application - imported_window,
+        'window': created_window - created_application,
+        'show': finished - created_window,
+        'modules': [name for name in %r if name in sys.modules],
+    }))
+    app.quit()
+
+
+QtCore.QTimer.singleShot(0, shown)
+app.exec_()
+""" % (WATCHED_MODULES,)
+
+
+def run_once(python=sys.executable):
+    """
+    Запускает приложение в отдельном процессе до первого показа окна.
+
+    :return: Словарь: total (с), времена этапов STAGES (с) и modules - загруженные отслеживаемые модули.
+    :rtype: dict
+    :raises RuntimeError: Если процесс завершился с ошибкой.
+    """
+    started = time.perf_counter()
+    completed = subprocess.run([python, '-c', CHILD], cwd=ROOT, capture_output=True, text=True)
+    total = time.perf_counter() - started
+    lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError("Запуск завершился с ошибкой:\n{}".format(completed.stderr.strip()))
+    result = json.loads(lines[-1])
+    result['total'] = total
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного запуска до первого показа окна")
+    parser.add_argument('--runs', type=int, default=10, help="количество запусков")
+    parser.add_argument('--json', default=None, help="путь для сохранения результатов в JSON")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(args.runs):
+        try:
+            runs.append(run_once())
+        except RuntimeError as error:
+            print(error, file=sys.stderr)
+            return 1
+    print("{:<14} {:>10} {:>10}".format('stage', 'p50, ms', 'p95, ms'))
+    summary = {}
+    for stage in ('total',) + STAGES:
+        times = [run[stage] for run in runs]
+        summary[stage] = {'median_ms': 1000 * statistics.median(times), 'p95_ms': 1000 * percentile(times, 0.95)}
+        print("{:<14} {median_ms:>10.1f} {p95_ms:>10.1f}".format(stage, **summary[stage]))
+    modules = runs[-1]['modules']
+    print("Загружено к показу окна: {}".format(', '.join(modules) if modules else 'нет'))
+    print("Не загружено: {}".format(', '.join(name for name in WATCHED_MODULES if name not in modules) or 'нет'))
+    if args.json:
+        save_json(args.json, {'runs': args.runs, 'summary': summary, 'modules': modules})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
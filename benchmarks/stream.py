@@ -0,0 +1,114 @@
+"""
+Бенчмарк потоковой обработки кадров (``python -m photo_editor stream``).
+
+Для каждой цепочки операций запускается отдельный процесс stream с одним потоком OpenCV:
+поток-писатель подает в его stdin кадры raw bgr24 (синтетическое изображение), а
+основной поток читает результат из stdout в переиспользуемый буфер. Замеряется
+пропускная способность всего канала в кадрах в секунду и сравнивается с целевой частотой
+(по умолчанию 60 к/с - воспроизведение в реальном времени); выводится и разбивка времени
+на кадр, которую процесс stream печатает в stderr.
+
+Запуск: ``python -m benchmarks.stream --size fullhd --frames 600``
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import environment, parse_sizes, save_json, synthetic_image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Цепочки операций: поточечные (в том числе свернутые в одну таблицу) и круг
+DEFAULT_CHAINS = ('', 'negative', 'brighten:40', 'negative,brighten:40,red', 'blue,negative',
+                  'circle:500:500:200:5')
+
+
+def run_chain(chain, image, frames, python=sys.executable):
+    """
+    Пропускает кадры через процесс stream.
+
+    :param chain: Цепочка операций (--ops).
+    :type chain: str
+    :param image: Кадр, подаваемый на вход.
+    :type image: numpy.ndarray
+    :param frames: Количество кадров.
+    :type frames: int
+    :return: Словарь: frames, seconds, fps и строка статистики процесса (stats).
+    :rtype: dict
+    :raises RuntimeError: Если процесс завершился с ошибкой или вернул не все кадры.
+    """
+    height, width = image.shape[:2]
+    command = [python, '-m', 'photo_editor', 'stream', '--size', '{}x{}'.format(width, height), '--ops', chain]
+    process = subprocess.Popen(command, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    frame = memoryview(image.tobytes())
+    output = memoryview(bytearray(len(frame)))
+
+    def feed():
+        try:
+            for _ in range(frames):
+                process.stdin.write(frame)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    started = time.perf_counter()
+    writer.start()
+    received = 0
+    while received < frames:
+        filled = 0
+        while filled < len(output):
+            count = process.stdout.readinto(output[filled:])
+            if not count:
+                break
+            filled += count
+        if filled < len(output):
+            break
+        received += 1
+    seconds = time.perf_counter() - started
+    writer.join()
+    stderr = process.stderr.read().decode('utf-8', 'replace').strip()
+    process.wait()
+    if process.returncode != 0 or received != frames:
+        raise RuntimeError("Процесс stream завершился с ошибкой ({} из {} кадров):\n{}".format(
+            received, frames, stderr))
+    return {'frames': frames, 'seconds': seconds, 'fps': frames / seconds, 'stats': stderr}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк потоковой обработки кадров через stdin/stdout")
+    parser.add_argument('--size', default='fullhd', help="размер кадра: имя из benchmarks.common.SIZES или ШИРИНАxВЫСОТА")
+    parser.add_argument('--frames', type=int, default=600, help="количество кадров на цепочку")
+    parser.add_argument('--chains', default=';'.join(DEFAULT_CHAINS),
+                        help="цепочки операций через точку с запятой (пустая - без операций)")
+    parser.add_argument('--target-fps', type=float, default=60.0, help="целевая частота кадров")
+    parser.add_argument('--json', default=None, help="путь для сохранения результатов в JSON")
+    args = parser.parse_args(argv)
+
+    (name, width, height), = parse_sizes(args.size)
+    image = synthetic_image(width, height)
+    print("Кадр {} ({}x{}), кадров: {}, цель: {:.0f} к/с".format(name, width, height, args.frames, args.target_fps))
+    print("{:<28} {:>8} {:>10}  {}".format('ops', 'fps', 'realtime', 'stream'))
+    results = []
+    for chain in args.chains.split(';'):
+        try:
+            result = run_chain(chain, image, args.frames)
+        except RuntimeError as error:
+            print(error, file=sys.stderr)
+            return 1
+        realtime = result['fps'] / args.target_fps
+        print("{:<28} {:>8.1f} {:>9.2f}x  {}".format(chain or '(нет)', result['fps'], realtime, result['stats']))
+        results.append(dict(result, ops=chain, realtime=realtime))
+    if args.json:
+        save_json(args.json, {'environment': environment(), 'size': [width, height], 'target_fps': args.target_fps,
+                              'results': results})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
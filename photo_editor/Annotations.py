@@ -0,0 +1,164 @@
+"""
+Модуль списков кругов для пакетной разметки изображений.
+
+Списки кругов (например, результаты детектора) читаются из CSV или JSON и рисуются операцией
+circles (модуль Operations) за один проход по одной копии изображения - как одно действие
+в истории изменений. Модуль не зависит от PyQt5.
+
+CSV - таблица с заголовком и столбцами ``x``, ``y``, ``radius`` и необязательными ``thickness``
+и ``color``. JSON - список объектов с теми же полями или объект ``{"circles": [...]}``.
+Координаты и радиус могут быть дробными (округляются), толщина -1 означает заливку, цвет -
+``#RRGGBB`` или список ``[r, g, b]``.
+
+Круг в операции circles - кортеж целых чисел (x, y, радиус, толщина, b, g, r).
+"""
+import csv
+import json
+import os
+
+# Толщина и цвет (BGR), как у операции circle
+DEFAULT_THICKNESS = 2
+DEFAULT_COLOR = (0, 0, 255)
+# cv2.circle принимает толщину не больше этого значения
+MAX_THICKNESS = 32767
+
+FIELDS = ('x', 'y', 'radius', 'thickness', 'color')
+EXTENSIONS = ('.csv', '.json')
+
+
+def parse_color(value):
+    """
+    :param value: ``#RRGGBB``, ``RRGGBB`` или последовательность (r, g, b).
+    :return: Цвет (b, g, r) для OpenCV.
+    :rtype: tuple
+    :raises ValueError: Если цвет некорректен.
+    """
+    if isinstance(value, str):
+        text = value.strip().lstrip('#')
+        if len(text) != 6:
+            raise ValueError("Цвет должен быть задан как #RRGGBB: {}".format(value))
+        try:
+            red, green, blue = (int(text[index:index + 2], 16) for index in (0, 2, 4))
+        except ValueError:
+            raise ValueError("Цвет должен быть задан как #RRGGBB: {}".format(value))
+    else:
+        try:
+            red, green, blue = (int(component) for component in value)
+        except (TypeError, ValueError):
+            raise ValueError("Цвет должен быть списком [r, g, b]: {}".format(value))
+        if not all(0 <= component <= 255 for component in (red, green, blue)):
+            raise ValueError("Компоненты цвета должны быть от 0 до 255: {}".format(value))
+    return blue, green, red
+
+
+def make_circle(x, y, radius, thickness=DEFAULT_THICKNESS, color=None):
+    """
+    Проверяет параметры круга и приводит их к аргументу операции circles.
+
+    :param color: Цвет (``#RRGGBB`` или (r, g, b)), по умолчанию красный.
+    :return: Кортеж (x, y, радиус, толщина, b, g, r).
+    :rtype: tuple
+    :raises ValueError: Если параметры некорректны.
+    """
+    try:
+        x, y, radius, thickness = (int(round(float(value))) for value in (x, y, radius, thickness))
+    except (TypeError, ValueError):
+        raise ValueError("Координаты, радиус и толщина должны быть числами")
+    if radius < 0:
+        raise ValueError("Радиус должен быть неотрицательным: {}".format(radius))
+    if thickness == 0 or thickness < -1 or thickness > MAX_THICKNESS:
+        raise ValueError("Толщина должна быть от 1 до {} или -1 (заливка): {}".format(MAX_THICKNESS, thickness))
+    blue, green, red = DEFAULT_COLOR if color is None else parse_color(color)
+    return x, y, radius, thickness, blue, green, red
+
+
+def _from_record(record, where):
+    missing = [name for name in ('x', 'y', 'radius') if record.get(name) in (None, '')]
+    if missing:
+        raise ValueError("{}: нет значения {}".format(where, ', '.join(missing)))
+    thickness = record.get('thickness')
+    color = record.get('color')
+    try:
+        return make_circle(record['x'], record['y'], record['radius'],
+                           DEFAULT_THICKNESS if thickness in (None, '') else thickness,
+                           None if color in (None, '') else color)
+    except ValueError as error:
+        raise ValueError("{}: {}".format(where, error))
+
+
+def parse_csv(text):
+    """
+    :param text: Содержимое CSV с заголовком.
+    :type text: str
+    :return: Круги.
+    :rtype: tuple
+    :raises ValueError: Если нет обязательных столбцов или значение некорректно.
+    """
+    reader = csv.DictReader(text.splitlines())
+    header = [name.strip().lower() for name in reader.fieldnames or ()]
+    missing = [name for name in ('x', 'y', 'radius') if name not in header]
+    if missing:
+        raise ValueError("В CSV нет столбцов: {}".format(', '.join(missing)))
+    reader.fieldnames = header
+    return tuple(_from_record(row, "Строка {}".format(reader.line_num)) for row in reader)
+
+
+def parse_json(text):
+    """
+    :param text: Содержимое JSON: список кругов или объект с ключом ``circles``.
+    :type text: str
+    :return: Круги.
+    :rtype: tuple
+    :raises ValueError: Если структура или значение некорректны.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as error:
+        raise ValueError("Некорректный JSON: {}".format(error))
+    if isinstance(data, dict):
+        data = data.get('circles')
+    if not isinstance(data, list):
+        raise ValueError("JSON должен содержать список кругов")
+    circles = []
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError("Круг {}: ожидается объект".format(index))
+        circles.append(_from_record({name.lower(): value for name, value in item.items()}, "Круг {}".format(index)))
+    return tuple(circles)
+
+
+def load_circles(path):
+    """
+    Читает список кругов из файла CSV или JSON (формат определяется расширением).
+
+    :param path: Путь к файлу.
+    :type path: str
+    :return: Круги - кортежи (x, y, радиус, толщина, b, g, r).
+    :rtype: tuple
+    :raises ValueError: Если формат не поддерживается или данные некорректны.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError("Поддерживаются файлы кругов CSV и JSON: {}".format(path))
+    with open(path, encoding='utf-8-sig') as file:
+        text = file.read()
+    return parse_csv(text) if extension == '.csv' else parse_json(text)
+
+
+def find_circles(directory, relative):
+    """
+    Ищет файл кругов для изображения в каталоге разметки: файл с тем же относительным путем
+    и расширением .json или .csv.
+
+    :param directory: Каталог разметки.
+    :type directory: str
+    :param relative: Путь изображения относительно общего каталога входных файлов.
+    :type relative: str
+    :return: Путь к файлу кругов или None.
+    :rtype: str
+    """
+    stem = os.path.join(directory, os.path.splitext(relative)[0])
+    for extension in EXTENSIONS:
+        if os.path.isfile(stem + extension):
+            return stem + extension
+    return None
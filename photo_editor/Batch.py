@@ -0,0 +1,216 @@
+"""
+Модуль пакетной обработки изображений без графического интерфейса.
+
+Изображения из каталога или по шаблону glob распределяются между процессами пула,
+к каждому применяется оптимизированная цепочка операций (модуль Chain), результат сохраняется
+в выходной каталог с сохранением относительных путей. К цепочке можно добавить разметку -
+список кругов (модуль Annotations), общий для всех изображений или свой для каждого. PyQt5
+не используется.
+"""
+import functools
+import glob
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from photo_editor import Annotations, Chain
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def collect_images(source):
+    """
+    Собирает список изображений из каталога (рекурсивно) или по шаблону glob.
+
+    :param source: Путь к каталогу или шаблон glob.
+    :type source: str
+    :return: Отсортированный список путей к изображениям.
+    :rtype: list
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                paths.append(os.path.join(root, name))
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths
+                  if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def common_root(paths):
+    """
+    Возвращает общий каталог для списка файлов, относительно которого строятся выходные пути.
+
+    :param paths: Список путей к файлам.
+    :type paths: list
+    :return: Общий каталог.
+    :rtype: str
+    """
+    if not paths:
+        return ''
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+
+def read_image(path, flags=cv2.IMREAD_COLOR):
+    """
+    Читает изображение с диска. Работает и с путями, содержащими не-ASCII символы.
+
+    :param path: Путь к файлу.
+    :type path: str
+    :param flags: Флаги cv2.imdecode.
+    :type flags: int
+    :return: Изображение OpenCV или None, если файл не удалось декодировать.
+    :rtype: numpy.ndarray
+    """
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+
+
+def write_image(path, image, params=()):
+    """
+    Кодирует изображение по расширению пути и записывает его на диск.
+
+    :param path: Путь к файлу.
+    :type path: str
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param params: Параметры кодировщика cv2.imencode.
+    :type params: tuple
+    :raises ValueError: Если изображение не удалось закодировать.
+    """
+    ok, encoded = cv2.imencode(os.path.splitext(path)[1], image, list(params))
+    if not ok:
+        raise ValueError("Не удалось закодировать изображение: {}".format(path))
+    encoded.tofile(path)
+
+
+# Общий файл кругов читается процессом пула один раз, а не для каждого изображения
+_load_circles = functools.lru_cache(maxsize=16)(Annotations.load_circles)
+
+
+def process_image(task):
+    """
+    Обрабатывает одно изображение. Выполняется в процессе пула.
+
+    :param task: Кортеж (входной путь, выходной путь, цепочка операций, путь к файлу кругов или None).
+    :type task: tuple
+    :return: Кортеж (входной путь, текст ошибки или None).
+    :rtype: tuple
+    """
+    source, target, chain, circles = task
+    try:
+        if circles is not None:
+            chain = list(chain) + [('circles', _load_circles(circles))]
+        image = read_image(source)
+        if image is None:
+            return source, "не удалось декодировать изображение"
+        image = Chain.run(image, chain)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        write_image(target, image)
+    except Exception as error:  # ошибка одного файла не должна останавливать весь пакет
+        return source, str(error)
+    return source, None
+
+
+def _init_worker():
+    """
+    Инициализирует процесс пула: OpenCV работает в одном потоке, параллелизм дает пул.
+    """
+    cv2.setNumThreads(1)
+
+
+def build_tasks(paths, chain, output_dir, extension=None, circles=None):
+    """
+    Строит список заданий для пула.
+
+    :param paths: Список входных файлов.
+    :type paths: list
+    :param chain: Цепочка операций.
+    :type chain: list
+    :param output_dir: Выходной каталог.
+    :type output_dir: str
+    :param extension: Расширение выходных файлов (например, ".png"), None - как у входного.
+    :type extension: str
+    :param circles: Файл кругов для всех изображений или каталог разметки, в котором для
+        изображения ищется файл с тем же относительным путем и расширением .json или .csv
+        (Annotations.find_circles). None - без разметки.
+    :type circles: str
+    :return: Список кортежей для process_image.
+    :rtype: list
+    """
+    root = common_root(paths)
+    tasks = []
+    for path in paths:
+        relative = os.path.relpath(os.path.abspath(path), root)
+        annotation = circles
+        if circles is not None and os.path.isdir(circles):
+            annotation = Annotations.find_circles(circles, relative)
+        if extension:
+            relative = os.path.splitext(relative)[0] + extension
+        tasks.append((path, os.path.join(output_dir, relative), chain, annotation))
+    return tasks
+
+
+def run_batch(paths, chain, output_dir, workers=None, chunksize=None, extension=None, progress=None,
+              circles=None):
+    """
+    Обрабатывает список изображений в пуле процессов.
+
+    :param paths: Список входных файлов.
+    :type paths: list
+    :param chain: Цепочка операций (см. Operations.parse_chain).
+    :type chain: list
+    :param output_dir: Выходной каталог.
+    :type output_dir: str
+    :param workers: Количество процессов, по умолчанию - число ядер. При 1 пул не создается.
+    :type workers: int
+    :param chunksize: Количество изображений, передаваемых процессу за раз.
+    :type chunksize: int
+    :param extension: Расширение выходных файлов, None - как у входного.
+    :type extension: str
+    :param progress: Функция progress(готово, всего, путь, ошибка), вызываемая после каждого файла.
+    :type progress: callable
+    :param circles: Файл кругов или каталог разметки (см. build_tasks), None - без разметки.
+    :type circles: str
+    :return: Словарь со статистикой: images, failed, errors, workers, chunksize (None без пула),
+        seconds, images_per_second (только успешно обработанные изображения).
+    :rtype: dict
+    """
+    tasks = build_tasks(paths, chain, output_dir, extension, circles)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks) or 1))
+    if workers == 1:
+        chunksize = None
+    elif chunksize is None:
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+    errors = []
+
+    def consume(results):
+        for done, (source, error) in enumerate(results, 1):
+            if error is not None:
+                errors.append((source, error))
+            if progress is not None:
+                progress(done, len(tasks), source, error)
+
+    started = time.perf_counter()
+    if workers == 1:
+        consume(map(process_image, tasks))
+    else:
+        # При выходе из with пул завершается, в том числе при прерывании с клавиатуры
+        with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            consume(pool.imap_unordered(process_image, tasks, chunksize))
+    seconds = time.perf_counter() - started
+
+    return {
+        'images': len(tasks),
+        'failed': len(errors),
+        'errors': errors,
+        'workers': workers,
+        'chunksize': chunksize,
+        'seconds': seconds,
+        'images_per_second': (len(tasks) - len(errors)) / seconds if seconds > 0 else 0.0,
+    }
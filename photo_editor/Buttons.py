@@ -4,10 +4,12 @@
 Этот модуль предоставляет классы для создания кнопок с различными иконками и состояниями
 (по умолчанию и при наведении), а также специализированные кнопки для галереи, камеры,
 регулировки яркости, рисования круга и негативного эффекта.
+Иконки берутся из общего реестра (модуль Icons) и не читаются с диска при каждом наведении.
 """
 
 from PyQt5 import QtWidgets, QtCore
-from PyQt5.QtGui import QIcon
+
+from photo_editor.Icons import icon
 
 class Button(QtWidgets.QPushButton):
     """
@@ -24,7 +26,7 @@ class Button(QtWidgets.QPushButton):
         super().__init__(*args, **kwargs)
         self.default_icon_path = None
         self.hover_icon_path = None
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
 
     def enterEvent(self, event):
         """
@@ -33,7 +35,7 @@ class Button(QtWidgets.QPushButton):
         :param event: Событие наведения курсора.
         :type event: QtCore.QEvent
         """
-        self.setIcon(QIcon(self.hover_icon_path))
+        self.setIcon(icon(self.hover_icon_path))
         super().enterEvent(event)
 
     def leaveEvent(self, event):
@@ -43,7 +45,7 @@ class Button(QtWidgets.QPushButton):
         :param event: Событие ухода курсора.
         :type event: QtCore.QEvent
         """
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         super().leaveEvent(event)
 
 class GalleryButton(Button):
@@ -58,7 +60,7 @@ class GalleryButton(Button):
         super().__init__(*args, **kwargs)
         self.default_icon_path = "icons/icon_gallery_64.png"
         self.hover_icon_path = "icons/pressed_gallery_icon.png"
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         self.setIconSize(QtCore.QSize(64, 64))
 
 class CameraButton(Button):
@@ -74,7 +76,7 @@ class CameraButton(Button):
         super().__init__(*args, **kwargs)
         self.default_icon_path = "icons/camera_icon.png"
         self.hover_icon_path = "icons/pressed_camera_icon.png"
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         self.setIconSize(QtCore.QSize(64, 64))
 
 class BrightnessButton(Button):
@@ -89,7 +91,7 @@ class BrightnessButton(Button):
         super().__init__(*args, **kwargs)
         self.default_icon_path = "icons/icon-brightness.png"
         self.hover_icon_path = "icons/pressed-icon-brightness-12411189.png"
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         self.setIconSize(QtCore.QSize(64, 64))
 
 class CircleButton(Button):
@@ -104,7 +106,7 @@ class CircleButton(Button):
         super().__init__(*args, **kwargs)
         self.default_icon_path = "icons/znacok.krug..png"
         self.hover_icon_path = "icons/pressed_znacok.krug_.png"
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         self.setIconSize(QtCore.QSize(130, 130))
 
 class NegativeButton(Button):
@@ -119,5 +121,5 @@ class NegativeButton(Button):
         super().__init__(*args, **kwargs)
         self.default_icon_path = "icons/znacok.negativ..png"
         self.hover_icon_path = "icons/hover_znacok.negativ_.png"
-        self.setIcon(QIcon(self.default_icon_path))
+        self.setIcon(icon(self.default_icon_path))
         self.setIconSize(QtCore.QSize(180, 90))
@@ -3,17 +3,43 @@
 
 Этот модуль предоставляет класс CameraWindow, который позволяет подключаться к веб-камере,
 отображать видеопоток в реальном времени, делать снимки и обрабатывать их.
+
+Кадры читаются в отдельном потоке (модуль Capture) в кольцевой буфер; окно показывает
+только самый свежий кадр, уменьшенный до размера области отображения, а снимок берется
+из буфера без повторного чтения с камеры.
+
+К каждому кадру предпросмотра применяется выбранная цепочка операций (фильтр) в разрешении
+предпросмотра, в заранее выделенный буфер; та же цепочка применяется к снимку в полном
+разрешении. Поверх кадра показываются частота захвата, время обработки кадра и количество
+пропущенных кадров.
 """
 
 import os
 import sys
-from PyQt5.QtCore import pyqtSignal, QTimer, Qt
+import time
+from PyQt5.QtCore import pyqtSignal, Qt
 from PyQt5.QtGui import QPixmap
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QPushButton, QMessageBox
-import cv2
+from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox,
+                             QComboBox, QLineEdit)
+from photo_editor import Chain, Operations
+from photo_editor.Capture import CaptureThread, FpsMeter, FrameRing, PreviewProcessor
+from photo_editor.FrameSource import open_source
 from photo_editor.Picture import Picture
 import numpy as np
 
+# Готовые фильтры: (название, цепочка операций)
+FILTER_PRESETS = (
+    ('Без фильтра', ''),
+    ('Красный канал', 'red'),
+    ('Зеленый канал', 'green'),
+    ('Синий канал', 'blue'),
+    ('Негатив', 'negative'),
+    ('Яркость +40', 'brighten:40'),
+)
+
+# Период обновления показателей поверх кадра, в секундах
+OVERLAY_INTERVAL = 0.25
+
 
 class CameraWindow(QWidget):
     """
@@ -21,22 +47,48 @@ class CameraWindow(QWidget):
 
     Сигналы:
         image_captured (pyqtSignal): Сигнал, испускаемый при захвате изображения.
+        frame_ready (pyqtSignal): Внутренний сигнал потока захвата о новом кадре.
+
+    Атрибуты:
+        cap (FrameSource): Источник кадров: камера, видеофайл, каталог изображений или генератор.
+        capture (CaptureThread): Поток захвата кадров, None, если камера не подключена.
+        preview_meter (FpsMeter): Частота показа кадров.
+        shutter_latency (float): Возраст кадра последнего снимка в момент нажатия кнопки, в секундах.
+        processor (PreviewProcessor): Обработка кадров предпросмотра; processor.chain - цепочка
+            операций фильтра в координатах кадра камеры.
     """
     image_captured = pyqtSignal(QPixmap, np.ndarray)
+    frame_ready = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, source=None):
         """
-        Инициализирует объект CameraWindow и подключается к веб-камере.
+        Инициализирует объект CameraWindow, подключается к веб-камере и запускает поток захвата.
+
+        :param source: Источник кадров (модуль FrameSource), по умолчанию создается функцией
+            open_source (описание источника задается переменной окружения PHOTO_EDITOR_CAMERA).
+        :type source: FrameSource
         """
         super().__init__()
+        self.capture = None
+        self.preview_meter = FpsMeter()
+        self.shutter_latency = None
+        self.processor = PreviewProcessor()
+        self._shown = 0
+        self._render_pending = False
+        self._overlay_updated = 0.0
         self.initUI()
-        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-        if not self.cap.isOpened():
+        self.cap = None
+        try:
+            self.cap = source if source is not None else open_source()
+        except ValueError as error:
+            self.show_error_message("Некорректный источник кадров: {}".format(error))
+            return
+        if not self.cap.is_opened():
             self.show_error_message("Не удалось подключиться к веб-камере.")
             return
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)
+        self.frame_ready.connect(self.update_frame)
+        self.capture = CaptureThread(self.cap, FrameRing(), on_frame=self._notify_frame)
+        self.capture.start()
 
     def initUI(self):
         """
@@ -53,6 +105,22 @@ class CameraWindow(QWidget):
         self.image_label.resize(700, 500)
         self.image_label.setAlignment(Qt.AlignCenter)
 
+        self.overlay_label = QLabel(self.image_label)
+        self.overlay_label.move(8, 8)
+        self.overlay_label.setStyleSheet("background-color: rgba(0, 0, 0, 150); color: rgb(255, 255, 255);"
+                                         "font-size: 12px; padding: 4px;")
+
+        self.filter_box = QComboBox(self)
+        for name, spec in FILTER_PRESETS:
+            self.filter_box.addItem(name, spec)
+        self.filter_box.setStyleSheet("color: rgb(255, 255, 255);")
+        self.filter_edit = QLineEdit(self)
+        self.filter_edit.setPlaceholderText("negative,brighten:40")
+        self.filter_edit.setStyleSheet("color: rgb(255, 255, 255);")
+        self.filter_box.currentIndexChanged.connect(
+            lambda index: self.filter_edit.setText(self.filter_box.itemData(index)))
+        self.filter_edit.textChanged.connect(self.set_filter)
+
         self.capture_btn = QPushButton('Сделать фото', self)
         self.capture_btn.setStyleSheet("""
             QPushButton {
@@ -72,30 +140,119 @@ class CameraWindow(QWidget):
         """)
         self.capture_btn.clicked.connect(self.capture_image)
 
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.filter_box)
+        filter_layout.addWidget(self.filter_edit)
+
         layout = QVBoxLayout()
         layout.addWidget(self.smile_label)
         layout.addWidget(self.image_label)
+        layout.addLayout(filter_layout)
         layout.addWidget(self.capture_btn)
         self.setLayout(layout)
 
+    def _notify_frame(self, number):
+        # Вызывается в потоке захвата. Пока предыдущий кадр не показан, новые уведомления
+        # не отправляются: очередь событий не растет, окно показывает самый свежий кадр.
+        if not self._render_pending:
+            self._render_pending = True
+            self.frame_ready.emit()
+
+    def set_filter(self, spec):
+        """
+        Устанавливает фильтр предпросмотра и снимка.
+
+        :param spec: Цепочка операций в формате Operations.parse_chain, например ``negative,brighten:40``.
+        :type spec: str
+        :return: True, если цепочка корректна. Некорректная цепочка не применяется, поле ввода
+            подсвечивается, а текст ошибки показывается во всплывающей подсказке.
+        :rtype: bool
+        """
+        try:
+            self.processor.chain = Operations.parse_chain(spec)
+        except ValueError as error:
+            self.filter_edit.setStyleSheet("color: rgb(255, 255, 255); border: 1px solid rgb(220, 50, 50);")
+            self.filter_edit.setToolTip(str(error))
+            return False
+        self.filter_edit.setStyleSheet("color: rgb(255, 255, 255);")
+        self.filter_edit.setToolTip("")
+        return True
+
     def update_frame(self):
         """
-        Обновляет кадр с камеры и отображает его в интерфейсе.
+        Отображает самый свежий кадр из буфера, уменьшенный до размера области отображения
+        и обработанный фильтром.
 
         """
-        frame = Picture.get_frame(self.cap)
-        if frame is not None:
-            self.image_label.setPixmap(Picture.convert_cv_qt(frame))
+        self._render_pending = False
+        latest = self.capture.ring.latest(after=self._shown, copy=False)
+        if latest is None:
+            return
+        self._shown, _, frame = latest
+        try:
+            preview = self.processor.process(frame, self.preview_size())
+            self.image_label.setPixmap(Picture.convert_cv_qt(preview))
+        finally:
+            # Изображение для отображения уже скопировано из кадра
+            self.capture.ring.release()
+        finished = time.perf_counter()
+        self.preview_meter.tick()
+        if finished - self._overlay_updated >= OVERLAY_INTERVAL:
+            self._overlay_updated = finished
+            self.update_overlay()
+
+    def preview_size(self):
+        """
+        :return: Размер области отображения (ширина, высота).
+        :rtype: tuple
+        """
+        return self.image_label.width(), self.image_label.height()
+
+    def update_overlay(self):
+        """
+        Обновляет показатели поверх кадра: частоту захвата и показа, время обработки кадра
+        и количество пропущенных кадров.
+        """
+        stats = self.stats()
+        self.overlay_label.setText("Захват: {:.1f} к/с   Показ: {:.1f} к/с\n"
+                                   "Обработка: {:.1f} мс   Пропущено: {}".format(
+                                       stats['capture_fps'], stats['preview_fps'],
+                                       stats['process_ms'], stats['dropped']))
+        self.overlay_label.adjustSize()
 
     def capture_image(self):
         """
-        Захватывает изображение с камеры, сохраняет его и испускает сигнал image_captured.
+        Берет самый свежий кадр из буфера, применяет к нему фильтр в полном разрешении,
+        сохраняет его и испускает сигнал image_captured.
         """
+        pressed = time.perf_counter()
+        latest = self.capture.ring.latest() if self.capture is not None else None
+        if latest is None:
+            return
+        _, timestamp, frame = latest
+        self.shutter_latency = pressed - timestamp
         picture_instance = Picture()
-        picture_instance.capture_and_store_image(self.cap)
+        picture_instance.set_source(Chain.run(frame, self.processor.chain))
         self.image_captured.emit(picture_instance.qt_picture, picture_instance.picture)
         self.close()
 
+    def stats(self):
+        """
+        Возвращает показатели камеры.
+
+        :return: Словарь: capture_fps, preview_fps, process_ms, frames, dropped, shutter_latency_ms.
+        :rtype: dict
+        """
+        ring = self.capture.ring if self.capture is not None else None
+        return {
+            'capture_fps': self.capture.meter.fps if self.capture is not None else 0.0,
+            'preview_fps': self.preview_meter.fps,
+            'process_ms': 1000 * self.processor.process_time,
+            'frames': ring.written if ring is not None else 0,
+            'dropped': ring.dropped if ring is not None else 0,
+            'shutter_latency_ms': None if self.shutter_latency is None else 1000 * self.shutter_latency,
+        }
+
     def show_error_message(self, message):
         """
         Отображает сообщение об ошибке.
@@ -125,12 +282,16 @@ class CameraWindow(QWidget):
 
     def closeEvent(self, event):
         """
-        Обрабатывает событие закрытия окна и освобождает ресурсы камеры.
+        Обрабатывает событие закрытия окна, останавливает поток захвата и освобождает ресурсы камеры.
 
         :param event: Событие закрытия.
         :type event: QtCore.QEvent
         """
-        self.cap.release()
+        if self.capture is not None:
+            # Источник закрывается только после выхода потока захвата из чтения кадра
+            self.capture.stop(release=True)
+        elif self.cap is not None:
+            self.cap.release()
         event.accept()
 
 
@@ -0,0 +1,144 @@
+"""
+Модуль области отображения изображения с перерисовкой только измененной части.
+
+Canvas - QLabel, который сам масштабирует изображение под свою область (как QLabel
+с setScaledContents) и в paintEvent рисует только перерисовываемую часть: при изменении
+небольшой области изображения (update_region) масштабируется и выводится только она, а не
+весь кадр.
+
+patch_pixmap обновляет часть изображения для отображения: в копию QPixmap предыдущего
+состояния рисуется только измененная операцией область (Operations.modified_rect), поэтому
+преобразование цвета и перерисовка после круга стоят пропорционально площади круга.
+"""
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+def scale_rect(rect, from_size, to_size):
+    """
+    Пересчитывает прямоугольник между изображениями разного размера.
+
+    :param rect: Прямоугольник (x, y, ширина, высота) в координатах изображения from_size.
+    :type rect: tuple
+    :param from_size: Размер исходного изображения (ширина, высота).
+    :type from_size: tuple
+    :param to_size: Размер целевого изображения (ширина, высота).
+    :type to_size: tuple
+    :rtype: QtCore.QRectF
+    """
+    x, y, width, height = rect
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    return QtCore.QRectF(x * scale_x, y * scale_y, width * scale_x, height * scale_y)
+
+
+def patch_pixmap(pixmap, region, rect, size):
+    """
+    Возвращает изображение для отображения нового состояния: копию pixmap с замененной областью.
+    Исходный pixmap (например, из кэша изображений предыдущего состояния) не изменяется.
+
+    :param pixmap: Изображение предыдущего состояния.
+    :type pixmap: QtGui.QPixmap
+    :param region: Измененная область нового состояния (Picture.convert_cv_qimage).
+    :type region: QtGui.QImage
+    :param rect: Положение области (x, y, ширина, высота) в изображении OpenCV.
+    :type rect: tuple
+    :param size: Размер изображения OpenCV (ширина, высота); pixmap может быть уменьшенной копией.
+    :type size: tuple
+    :return: (новое изображение, измененная область в координатах pixmap - QtCore.QRect).
+    :rtype: tuple
+    """
+    result = QtGui.QPixmap(pixmap)
+    if not rect[2] or not rect[3]:
+        return result, QtCore.QRect()
+    target = scale_rect(rect, size, (pixmap.width(), pixmap.height()))
+    # QPixmap разделяет данные с копиями: при рисовании result получает собственный буфер
+    painter = QtGui.QPainter(result)
+    if target.size() == QtCore.QSizeF(region.size()):
+        painter.drawImage(target.topLeft(), region)
+    else:
+        # pixmap - уменьшенная копия: область масштабируется при рисовании
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        painter.drawImage(target, region)
+    painter.end()
+    return result, target.toAlignedRect()
+
+
+class Canvas(QtWidgets.QLabel):
+    """
+    Область отображения изображения, растянутого на всю область содержимого.
+
+    Атрибуты:
+        pixmap_shown (QtGui.QPixmap): Показанное изображение или None.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pixmap_shown = None
+
+    def setPixmap(self, pixmap):
+        """
+        Показывает изображение и перерисовывает всю область.
+
+        :param pixmap: Изображение.
+        :type pixmap: QtGui.QPixmap
+        """
+        resized = self.pixmap_shown is None or pixmap.size() != self.pixmap_shown.size()
+        self.pixmap_shown = pixmap
+        if resized:
+            self.updateGeometry()
+        self.update()
+
+    def update_region(self, pixmap, rect):
+        """
+        Показывает изображение, отличающееся от показанного только областью rect,
+        и перерисовывает только эту область.
+
+        :param pixmap: Изображение того же размера, что и показанное.
+        :type pixmap: QtGui.QPixmap
+        :param rect: Измененная область в координатах изображения.
+        :type rect: QtCore.QRect
+        :return: Перерисовываемая область виджета.
+        :rtype: QtCore.QRect
+        """
+        if self.pixmap_shown is None or pixmap.size() != self.pixmap_shown.size():
+            self.setPixmap(pixmap)
+            return self.rect()
+        self.pixmap_shown = pixmap
+        if rect.isEmpty():
+            return QtCore.QRect()
+        contents = self.contentsRect()
+        area = scale_rect((rect.x(), rect.y(), rect.width(), rect.height()), (pixmap.width(), pixmap.height()),
+                          (contents.width(), contents.height())).toAlignedRect()
+        # Сглаживание при масштабировании захватывает соседний пиксель
+        area = area.translated(contents.topLeft()).adjusted(-1, -1, 1, 1)
+        self.update(area)
+        return area
+
+    def clear(self):
+        self.pixmap_shown = None
+        super().clear()
+
+    def sizeHint(self):
+        # Как у QLabel с изображением: размер изображения вместе с рамкой
+        if self.pixmap_shown is None:
+            return super().sizeHint()
+        margins = self.contentsMargins()
+        return self.pixmap_shown.size() + QtCore.QSize(margins.left() + margins.right(),
+                                                       margins.top() + margins.bottom())
+
+    def paintEvent(self, event):
+        if self.pixmap_shown is None or self.pixmap_shown.isNull():
+            super().paintEvent(event)
+            return
+        QtWidgets.QFrame.paintEvent(self, event)
+        contents = self.contentsRect()
+        exposed = event.rect().intersected(contents)
+        if exposed.isEmpty():
+            return
+        pixmap = self.pixmap_shown
+        source = scale_rect((exposed.x() - contents.x(), exposed.y() - contents.y(), exposed.width(), exposed.height()),
+                            (contents.width(), contents.height()), (pixmap.width(), pixmap.height()))
+        painter = QtGui.QPainter(self)
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(QtCore.QRectF(exposed), pixmap, source)
+        painter.end()
@@ -0,0 +1,388 @@
+"""
+Модуль захвата кадров с камеры в отдельном потоке.
+
+CaptureThread читает кадры из источника (модуль FrameSource) в отдельном потоке и записывает
+их в кольцевой буфер FrameRing из заранее выделенных кадров. Буфер хранит несколько
+последних кадров, новый кадр перезаписывает самый старый, поэтому читатель всегда получает
+самый свежий кадр, а устаревшие отбрасываются, не накапливаясь. Модуль не зависит от PyQt5.
+
+PreviewProcessor уменьшает кадр до размера предпросмотра и применяет к нему цепочку операций
+в переиспользуемый буфер. FpsMeter измеряет частоту событий (захваченных или показанных кадров)
+по скользящему окну. run_capture выполняет захват и обработку предпросмотра без графического
+интерфейса - для нагрузочных тестов и настройки камер.
+"""
+from collections import deque
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from photo_editor import Chain, Proxy
+
+DEFAULT_CAPACITY = 4
+
+
+class FrameRing:
+    """
+    Потокобезопасный кольцевой буфер кадров с одним писателем.
+
+    Атрибуты:
+        capacity (int): Количество кадров в буфере.
+        written (int): Количество записанных кадров.
+        dropped (int): Количество кадров, перезаписанных до того, как их прочитали.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        :param capacity: Количество кадров в буфере, не меньше 3: писатель не трогает
+            последний записанный кадр и кадр, который читатель обрабатывает без копии.
+        :type capacity: int
+        """
+        if capacity < 3:
+            raise ValueError("Емкость буфера кадров должна быть не меньше 3: {}".format(capacity))
+        self.capacity = capacity
+        self.written = 0
+        self.dropped = 0
+        self._slots = [None] * capacity
+        self._format = None
+        self._timestamps = [0.0] * capacity
+        self._latest = -1
+        self._reading = None
+        self._read = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def slot(self, shape=None, dtype=np.uint8):
+        """
+        Возвращает буфер, в который писатель записывает следующий кадр: самый старый
+        кадр кольца, кроме закрепленного читателем (latest(copy=False)). Буферы всех слотов выделяются один раз, как только становится известна
+        форма кадра, и переиспользуются.
+
+        :param shape: Форма кадра; если известна, буферы выделяются заранее.
+        :type shape: tuple
+        :param dtype: Тип элементов кадра.
+        :return: (индекс слота, буфер или None, если форма еще неизвестна).
+        :rtype: tuple
+        """
+        with self._lock:
+            index = (self._latest + 1) % self.capacity
+            if index == self._reading:
+                index = (index + 1) % self.capacity
+            if shape is not None and (tuple(shape), np.dtype(dtype)) != self._format:
+                self._allocate(tuple(shape), np.dtype(dtype))
+            return index, self._slots[index]
+
+    def commit(self, index, frame, timestamp=None):
+        """
+        Публикует записанный кадр как самый свежий.
+
+        :param index: Индекс слота из slot().
+        :type index: int
+        :param frame: Кадр; если это не буфер слота (источник выделил новый массив),
+            он становится буфером слота.
+        :type frame: numpy.ndarray
+        :param timestamp: Время захвата по time.perf_counter(), по умолчанию - текущее.
+        :type timestamp: float
+        """
+        with self._lock:
+            self._slots[index] = frame
+            if (frame.shape, frame.dtype) != self._format:
+                # Первый кадр (или смена разрешения): остальные слоты выделяются сразу,
+                # а не по одному на первом круге
+                self._allocate(frame.shape, frame.dtype, keep=index)
+            self._timestamps[index] = time.perf_counter() if timestamp is None else timestamp
+            self._latest = index
+            if self.written > self._read:
+                self.dropped += 1
+            self.written += 1
+            self._ready.notify_all()
+
+    def _allocate(self, shape, dtype, keep=None):
+        # Выделяет буферы слотов другой формы; вызывается под блокировкой. Читатель,
+        # получивший кадр без копии, продолжает держать прежний массив
+        self._format = (shape, dtype)
+        for index, buffer in enumerate(self._slots):
+            if index != keep and (buffer is None or buffer.shape != shape or buffer.dtype != dtype):
+                self._slots[index] = np.empty(shape, dtype=dtype)
+
+    def latest(self, after=0, timeout=None, copy=True):
+        """
+        Возвращает самый свежий кадр.
+
+        :param after: Ждать кадр с номером больше этого (номер - количество кадров,
+            записанных до него включительно).
+        :type after: int
+        :param timeout: Время ожидания в секундах, None - не ждать.
+        :type timeout: float
+        :param copy: Вернуть копию. Без копии кадр закрепляется: писатель не перезаписывает
+            его до вызова release() или следующего чтения без копии.
+        :type copy: bool
+        :return: (номер кадра, время захвата, кадр) или None, если нового кадра нет.
+        :rtype: tuple
+        """
+        with self._lock:
+            if self.written <= after and timeout is not None:
+                self._ready.wait_for(lambda: self.written > after, timeout)
+            if self.written <= after:
+                return None
+            frame = self._slots[self._latest]
+            if copy:
+                frame = frame.copy()
+            else:
+                self._reading = self._latest
+            self._read = self.written
+            return self.written, self._timestamps[self._latest], frame
+
+    def release(self):
+        """
+        Снимает закрепление кадра, полученного latest(copy=False).
+        """
+        with self._lock:
+            self._reading = None
+
+
+class FpsMeter:
+    """
+    Измеряет частоту событий по скользящему окну последних отметок времени.
+    """
+
+    def __init__(self, window=30):
+        """
+        :param window: Количество последних событий, по которым считается частота.
+        :type window: int
+        """
+        self._times = deque(maxlen=window)
+
+    def tick(self, now=None):
+        """
+        Отмечает событие.
+
+        :param now: Время по time.perf_counter(), по умолчанию - текущее.
+        :type now: float
+        """
+        self._times.append(time.perf_counter() if now is None else now)
+
+    @property
+    def fps(self):
+        """
+        Частота событий в секунду, 0 при недостатке данных.
+
+        :rtype: float
+        """
+        if len(self._times) < 2 or self._times[-1] == self._times[0]:
+            return 0.0
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+
+class CaptureThread(threading.Thread):
+    """
+    Поток, читающий кадры из источника в кольцевой буфер.
+
+    Атрибуты:
+        ring (FrameRing): Буфер кадров.
+        meter (FpsMeter): Частота захвата.
+        failures (int): Количество неудачных чтений подряд к моменту остановки.
+    """
+
+    def __init__(self, source, ring=None, on_frame=None, max_failures=30):
+        """
+        :param source: Источник кадров с методом read(image) -> (успех, кадр),
+            например cv2.VideoCapture.
+        :param ring: Буфер кадров, по умолчанию создается новый.
+        :type ring: FrameRing
+        :param on_frame: Функция, вызываемая в потоке захвата после записи кадра
+            с аргументом - номером кадра.
+        :type on_frame: callable
+        :param max_failures: Количество неудачных чтений подряд, после которого поток завершается.
+        :type max_failures: int
+        """
+        super().__init__(name='photo-editor-capture', daemon=True)
+        self.source = source
+        self.ring = ring if ring is not None else FrameRing()
+        self.meter = FpsMeter()
+        self.failures = 0
+        self._on_frame = on_frame
+        self._max_failures = max_failures
+        self._stopped = threading.Event()
+        self._release = False
+        self._released = False
+        self._release_lock = threading.Lock()
+
+    def run(self):
+        try:
+            self._capture()
+        finally:
+            if self._release:
+                self._release_source()
+
+    def _capture(self):
+        while not self._stopped.is_set():
+            index, buffer = self.ring.slot()
+            ok, frame = self.source.read(buffer) if buffer is not None else self.source.read()
+            timestamp = time.perf_counter()
+            if not ok or frame is None:
+                self.failures += 1
+                if self.failures >= self._max_failures:
+                    break
+                time.sleep(0.01)
+                continue
+            self.failures = 0
+            self.ring.commit(index, frame, timestamp)
+            self.meter.tick(timestamp)
+            if self._on_frame is not None:
+                self._on_frame(self.ring.written)
+
+    def stop(self, timeout=1.0, release=False):
+        """
+        Останавливает поток и ожидает его завершения.
+
+        :param timeout: Время ожидания в секундах.
+        :type timeout: float
+        :param release: Закрыть источник. Источник закрывается только после выхода потока из
+            чтения: если поток не завершился за timeout (например, чтение с медленного устройства
+            еще не вернулось), источник закроет сам поток при выходе.
+        :type release: bool
+        """
+        self._release = self._release or release
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self._release and not self.is_alive():
+            self._release_source()
+
+    def _release_source(self):
+        with self._release_lock:
+            if not self._released:
+                self._released = True
+                self.source.release()
+
+
+class PreviewProcessor:
+    """
+    Обработка кадров предпросмотра: уменьшение до размера области отображения и фильтр.
+
+    Атрибуты:
+        chain (list): Цепочка операций фильтра в координатах кадра, кортежи (имя операции,
+            кортеж аргументов).
+        process_time (float): Среднее (скользящее) время обработки кадра, в секундах.
+    """
+
+    def __init__(self, chain=()):
+        """
+        :param chain: Цепочка операций фильтра.
+        :type chain: list
+        """
+        self.chain = list(chain)
+        self.process_time = 0.0
+        self._buffer = None
+        self._plan_key = None
+        self._plan = []
+
+    def plan(self, scale):
+        """
+        Возвращает план выполнения фильтра для кадров с данным масштабом предпросмотра.
+        План строится заново только при смене фильтра или масштаба.
+
+        :param scale: Масштаб предпросмотра относительно кадра.
+        :type scale: float
+        :rtype: list
+        """
+        key = (tuple(self.chain), scale)
+        if key != self._plan_key:
+            self._plan = Chain.optimize(Proxy.scale_operations(self.chain, scale))
+            self._plan_key = key
+        return self._plan
+
+    def process(self, frame, size):
+        """
+        Уменьшает кадр до заданного размера с сохранением пропорций и применяет фильтр.
+        Результат записывается в буфер, выделяемый только при изменении размера.
+
+        :param frame: Кадр OpenCV, не изменяется.
+        :type frame: numpy.ndarray
+        :param size: Размер области отображения (ширина, высота).
+        :type size: tuple
+        :return: Кадр предпросмотра (буфер обработчика, действителен до следующего кадра)
+            или исходный кадр, если уменьшать и фильтровать нечего.
+        :rtype: numpy.ndarray
+        """
+        started = time.perf_counter()
+        scale = Proxy.fit_scale(frame.shape, size) if size[0] > 0 and size[1] > 0 else 1.0
+        height, width = frame.shape[:2]
+        shape = (max(1, round(height * scale)), max(1, round(width * scale))) + frame.shape[2:]
+        if self._buffer is None or self._buffer.shape != shape or self._buffer.dtype != frame.dtype:
+            self._buffer = np.empty(shape, dtype=frame.dtype)
+        steps = self.plan(scale)
+        if scale < 1.0:
+            # Билинейная интерполяция на порядок быстрее INTER_AREA при дробном масштабе,
+            # а для предпросмотра ее качества достаточно
+            source = cv2.resize(frame, (shape[1], shape[0]), dst=self._buffer, interpolation=cv2.INTER_LINEAR)
+            result = Chain.execute(source, steps, dst=self._buffer)
+        elif steps:
+            result = Chain.execute(frame, steps, dst=self._buffer)
+        else:
+            result = frame
+        self.process_time += 0.1 * (time.perf_counter() - started - self.process_time)
+        return result
+
+
+def run_capture(source, seconds=5.0, chain=(), preview_size=(800, 600), capacity=DEFAULT_CAPACITY):
+    """
+    Захватывает кадры из источника в отдельном потоке и обрабатывает самый свежий кадр,
+    как окно камеры, но без графического интерфейса.
+
+    :param source: Источник кадров (модуль FrameSource). Не закрывается.
+    :param seconds: Длительность, в секундах.
+    :type seconds: float
+    :param chain: Цепочка операций фильтра предпросмотра.
+    :type chain: list
+    :param preview_size: Размер предпросмотра (ширина, высота).
+    :type preview_size: tuple
+    :param capacity: Емкость кольцевого буфера.
+    :type capacity: int
+    :return: Словарь: frames, processed, dropped, capture_fps, preview_fps, process_ms,
+        process_ms_p95, latency_ms (среднее время от захвата до окончания обработки кадра).
+    :rtype: dict
+    """
+    processor = PreviewProcessor(chain)
+    capture = CaptureThread(source, FrameRing(capacity))
+    preview_meter = FpsMeter(window=1000000)
+    process_times = []
+    latencies = []
+    shown = 0
+    capture.start()
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < seconds and (capture.is_alive() or capture.ring.written > shown):
+            latest = capture.ring.latest(after=shown, timeout=0.1, copy=False)
+            if latest is None:
+                continue
+            shown, timestamp, frame = latest
+            begin = time.perf_counter()
+            try:
+                processor.process(frame, preview_size)
+            finally:
+                capture.ring.release()
+            end = time.perf_counter()
+            process_times.append(end - begin)
+            latencies.append(end - timestamp)
+            preview_meter.tick(end)
+    finally:
+        capture.stop()
+    elapsed = time.perf_counter() - started
+    process_times.sort()
+    ring = capture.ring
+    return {
+        'frames': ring.written,
+        'processed': len(process_times),
+        'dropped': ring.dropped,
+        'capture_fps': ring.written / elapsed if elapsed > 0 else 0.0,
+        'preview_fps': preview_meter.fps,
+        'process_ms': 1000 * sum(process_times) / len(process_times) if process_times else 0.0,
+        'process_ms_p95': 1000 * process_times[int(0.95 * (len(process_times) - 1))] if process_times else 0.0,
+        'latency_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+    }
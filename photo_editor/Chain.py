@@ -0,0 +1,190 @@
+"""
+Модуль ленивой цепочки операций над изображением.
+
+Операции не выполняются сразу, а записываются в цепочку (OpChain) и вычисляются только при
+материализации - когда изображение нужно показать или сохранить. Перед вычислением цепочка
+оптимизируется:
+
+- взаимно отменяющиеся и пустые операции удаляются (два негатива подряд, яркость +0,
+  повторное выделение того же канала), подряд идущие увеличения яркости объединяются;
+- соседние поточечные операции (каналы, негатив, яркость) сворачиваются в одну таблицу
+  преобразования (модуль Lut) и выполняются за один проход по изображению; таблица вида
+  saturate(s * x + c) в каждом канале выполняется более быстрым cv2.transform (Lut.linear).
+
+Результат совпадает с последовательным применением операций из модуля Operations.
+"""
+import numpy as np
+
+from photo_editor import Lut, Operations
+
+# Операции, повторное применение которых ничего не меняет
+IDEMPOTENT = ('red', 'green', 'blue')
+
+
+def is_pointwise(name):
+    """
+    Проверяет, является ли операция поточечной (значение пикселя зависит только от него самого).
+
+    :param name: Имя операции.
+    :type name: str
+    :rtype: bool
+    """
+    return Lut.is_supported(name)
+
+
+def simplify(nodes):
+    """
+    Удаляет из цепочки пустые и взаимно отменяющиеся операции, объединяет подряд идущие
+    увеличения яркости.
+
+    :param nodes: Список кортежей (имя операции, кортеж аргументов).
+    :type nodes: list
+    :return: Упрощенный список операций.
+    :rtype: list
+    """
+    result = []
+    for name, args in nodes:
+        args = tuple(args)
+        if name == 'brighten' and args[0] == 0:
+            continue
+        if name == 'brighten' and args[0] > 0 and result and result[-1][0] == 'brighten' and result[-1][1][0] > 0:
+            # saturate(saturate(x + a) + b) = saturate(x + a + b) при a, b > 0
+            result[-1] = ('brighten', (result[-1][1][0] + args[0],))
+            continue
+        if result and result[-1] == ('negative', ()) and name == 'negative':
+            result.pop()
+            continue
+        if result and name in IDEMPOTENT and result[-1] == (name, args):
+            continue
+        result.append((name, args))
+    return result
+
+
+def optimize(nodes):
+    """
+    Строит план выполнения цепочки операций.
+
+    :param nodes: Список кортежей (имя операции, кортеж аргументов).
+    :type nodes: list
+    :return: Список шагов: ('linear', матрица Lut.linear) или ('table', таблица Lut) для слитых
+        поточечных операций и ('op', имя, аргументы) для остальных.
+    :rtype: list
+    """
+    steps = []
+    pointwise = []
+
+    def flush():
+        if pointwise:
+            table = Lut.compose(pointwise)
+            if not Lut.is_identity(table):
+                matrix = Lut.linear(table)
+                steps.append(('table', table) if matrix is None else ('linear', matrix))
+            del pointwise[:]
+
+    for name, args in simplify(nodes):
+        if is_pointwise(name):
+            pointwise.append((name, args))
+        else:
+            flush()
+            steps.append(('op', name, args))
+    flush()
+    return steps
+
+
+def execute(image, steps, dst=None):
+    """
+    Выполняет план, построенный функцией optimize.
+
+    :param image: Исходное изображение OpenCV, не изменяется (если не совпадает с dst).
+    :type image: numpy.ndarray
+    :param steps: План выполнения.
+    :type steps: list
+    :param dst: Буфер для результата той же формы, может совпадать с image. Таблицы
+        и линейные преобразования применяются прямо в буфер, без выделения памяти на каждый шаг.
+    :type dst: numpy.ndarray
+    :return: Результат: dst, если он задан. Если план пуст и dst не задан, возвращается
+        исходное изображение.
+    :rtype: numpy.ndarray
+    """
+    for step in steps:
+        if step[0] == 'table':
+            image = Lut.apply(image, step[1], dst)
+        elif step[0] == 'linear':
+            image = Lut.apply_linear(image, step[1], dst)
+        else:
+            image = Operations.apply_operation(image, step[1], step[2])
+    if dst is not None and image is not dst:
+        np.copyto(dst, image)
+        return dst
+    return image
+
+
+def run(image, nodes):
+    """
+    Оптимизирует и выполняет цепочку операций над изображением.
+
+    :param image: Исходное изображение OpenCV, не изменяется.
+    :type image: numpy.ndarray
+    :param nodes: Список кортежей (имя операции, кортеж аргументов).
+    :type nodes: list
+    :return: Результат.
+    :rtype: numpy.ndarray
+    """
+    return execute(image, optimize(nodes))
+
+
+class OpChain:
+    """
+    Ленивая цепочка операций над изображением.
+
+    Атрибуты:
+        base (numpy.ndarray): Изображение, к которому применяются накопленные операции.
+        nodes (list): Еще не выполненные операции, кортежи (имя операции, кортеж аргументов).
+    """
+
+    def __init__(self, image):
+        """
+        Создает пустую цепочку над изображением.
+
+        :param image: Исходное изображение OpenCV.
+        :type image: numpy.ndarray
+        """
+        self.base = image
+        self.nodes = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def pending(self):
+        """
+        Есть ли невыполненные операции.
+
+        :rtype: bool
+        """
+        return bool(self.nodes)
+
+    def append(self, name, args=()):
+        """
+        Добавляет операцию в цепочку без ее выполнения.
+
+        :param name: Имя операции из Operations.OPERATIONS.
+        :type name: str
+        :param args: Аргументы операции.
+        :type args: tuple
+        """
+        if name not in Operations.OPERATIONS:
+            raise ValueError("Неизвестная операция: {}".format(name))
+        self.nodes.append((name, tuple(args)))
+
+    def materialize(self):
+        """
+        Выполняет накопленные операции. Результат становится новой основой цепочки.
+
+        :return: Результирующее изображение.
+        :rtype: numpy.ndarray
+        """
+        if self.nodes:
+            self.base = run(self.base, self.nodes)
+            self.nodes = []
+        return self.base
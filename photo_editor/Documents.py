@@ -0,0 +1,400 @@
+"""
+Модуль документов: несколько открытых изображений в одном процессе с общим бюджетом памяти.
+
+Документ (Document) объединяет изображение (Picture), его историю изменений и снимки
+состояний для полноразмерного вычисления. Рабочая область (Workspace) хранит открытые
+документы и следит за общим бюджетом памяти: при его превышении неактивные документы,
+начиная с давно не использованных, освобождают память:
+
+- исходное изображение полного разрешения заменяется отложенным (Loader.DeferredImage):
+  если документ открыт из файла и файл не изменился, изображение при необходимости
+  декодируется из него заново (FileImage), иначе выгружается в каталог рабочей области (SpilledImage);
+- все состояния истории, кроме текущего, сжимаются (History.compact).
+
+В памяти неактивного документа остается только уменьшенная рабочая копия и сжатая история,
+а полное изображение возвращается прозрачно - при сохранении. Модуль не зависит от PyQt5.
+
+Бюджет задается переменной окружения PHOTO_EDITOR_MEMORY в мегабайтах.
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from photo_editor import Loader
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_MEMORY'
+DEFAULT_BUDGET = 1024 * 1024 * 1024
+
+# Имена файлов выгрузки и ключи состояний истории, уникальные в пределах процесса
+_names = itertools.count()
+_keys = itertools.count()
+
+
+class FileImage(Loader.DeferredImage):
+    """
+    Исходное изображение, которое декодируется заново из неизмененного файла.
+    """
+
+    def __init__(self, path, shape, signature):
+        """
+        :param path: Путь к файлу.
+        :type path: str
+        :param shape: Форма изображения.
+        :type shape: tuple
+        :param signature: Время изменения (нс) и размер файла при открытии.
+        :type signature: tuple
+        """
+        super().__init__(shape)
+        self.path = path
+        self.signature = signature
+
+    def wait(self, timeout=None):
+        try:
+            stat = os.stat(self.path)
+        except OSError as error:
+            raise ValueError("Исходный файл недоступен: {}".format(error))
+        if (stat.st_mtime_ns, stat.st_size) != self.signature:
+            raise ValueError("Исходный файл изменен после открытия: {}".format(self.path))
+        image = Loader.decode_image(Loader.map_file(self.path))
+        if image is None or image.shape != self.shape:
+            raise ValueError("Не удалось заново декодировать исходный файл: {}".format(self.path))
+        return image
+
+
+class SpilledImage(Loader.DeferredImage):
+    """
+    Исходное изображение, выгруженное на диск без сжатия.
+    """
+
+    def __init__(self, path, image):
+        """
+        :param path: Путь к файлу выгрузки.
+        :type path: str
+        :param image: Изображение.
+        :type image: numpy.ndarray
+        """
+        super().__init__(image.shape)
+        self.path = path
+        self.dtype = image.dtype
+        np.ascontiguousarray(image).tofile(path)
+
+    def wait(self, timeout=None):
+        return np.fromfile(self.path, dtype=self.dtype).reshape(self.shape)
+
+    def release(self):
+        """
+        Удаляет файл выгрузки.
+        """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def file_signature(path):
+    """
+    :param path: Путь к файлу.
+    :type path: str
+    :return: Время изменения (нс) и размер файла.
+    :rtype: tuple
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Document:
+    """
+    Открытое изображение с историей изменений.
+
+    Атрибуты:
+        picture (Picture): Изображение.
+        history: История изменений (модуль History).
+        states (list): Снимки Picture.state для состояний истории.
+        keys (list): Ключи состояний истории (например, для кэша изображений PixmapCache), параллельно states.
+        state_index (int): Индекс текущего состояния в states.
+        suspended (bool): Освобождена ли память документа с момента его последней активации.
+    """
+
+    def __init__(self, picture, history):
+        """
+        :param picture: Изображение.
+        :type picture: Picture
+        :param history: История изменений.
+        """
+        self.picture = picture
+        self.history = history
+        self.states = []
+        self.keys = []
+        self.state_index = -1
+        self.suspended = False
+        self._file = None
+        self._spilled = []
+
+    @property
+    def title(self):
+        """
+        Название документа для вкладки.
+
+        :rtype: str
+        """
+        if self.picture.path:
+            return os.path.basename(self.picture.path)
+        if self.picture.source is not None:
+            return "Снимок"
+        return "Без названия"
+
+    @property
+    def empty(self):
+        """
+        Нет ли в документе изображения.
+
+        :rtype: bool
+        """
+        return self.picture.source is None
+
+    @property
+    def key(self):
+        """
+        Ключ текущего состояния истории или None, если история пуста.
+        """
+        return self.keys[self.state_index] if self.state_index >= 0 else None
+
+    def push_state(self, state):
+        """
+        Добавляет снимок нового состояния после текущего (состояния впереди отбрасываются)
+        и выравнивает снимки по истории, которая могла вытеснить старые состояния.
+        Вызывается после добавления состояния в историю.
+
+        :param state: Снимок Picture.state.
+        :type state: tuple
+        :return: Ключи отброшенных состояний.
+        :rtype: list
+        """
+        dropped = self.keys[self.state_index + 1:]
+        del self.states[self.state_index + 1:]
+        del self.keys[self.state_index + 1:]
+        self.states.append(state)
+        self.keys.append(next(_keys))
+        evicted = max(0, len(self.states) - len(self.history))
+        dropped += self.keys[:evicted]
+        del self.states[:evicted]
+        del self.keys[:evicted]
+        self.state_index = len(self.states) - 1
+        return dropped
+
+    def set_file(self, path, image):
+        """
+        Запоминает файл, из которого открыто исходное изображение, чтобы при нехватке памяти
+        освобождать изображение без выгрузки на диск.
+
+        :param path: Путь к файлу.
+        :type path: str
+        :param image: Декодированное исходное изображение.
+        :type image: numpy.ndarray
+        """
+        try:
+            self._file = (path, image, file_signature(path))
+        except OSError:
+            self._file = None
+
+    def resident_sources(self):
+        """
+        :return: Исходные изображения полного разрешения в памяти, которые можно освободить:
+            словарь id -> изображение.
+        :rtype: dict
+        """
+        sources = {}
+        states = list(self.states) + [self.picture.state]
+        for source, scale, _ in states:
+            # Без рабочей копии исходное изображение - это само состояние истории
+            if isinstance(source, np.ndarray) and scale < 1.0:
+                sources[id(source)] = source
+        return sources
+
+    @property
+    def nbytes(self):
+        """
+        Память, занимаемая документом: история и исходные изображения полного разрешения.
+
+        :rtype: int
+        """
+        return self.history.nbytes + sum(source.nbytes for source in self.resident_sources().values())
+
+    def suspend(self, directory):
+        """
+        Освобождает память неактивного документа: исходные изображения полного разрешения
+        заменяются отложенными, состояния истории сжимаются.
+
+        :param directory: Каталог для выгрузки изображений, которые нельзя декодировать из файла.
+        :type directory: str
+        :return: Объем освобожденной памяти исходных изображений, в байтах.
+        :rtype: int
+        """
+        sources = self.resident_sources()
+        replacements = {}
+        for key, source in sources.items():
+            if self._file is not None and self._file[1] is source and self._file_unchanged():
+                replacements[key] = FileImage(self._file[0], source.shape, self._file[2])
+            else:
+                path = os.path.join(directory, '{:08d}.raw'.format(next(_names)))
+                replacements[key] = SpilledImage(path, source)
+                self._spilled.append(replacements[key])
+        freed = sum(source.nbytes for source in sources.values())
+        self.states = [(replacements.get(id(source), source), scale, operations)
+                       for source, scale, operations in self.states]
+        self.picture.source = replacements.get(id(self.picture.source), self.picture.source)
+        if self._file is not None:
+            self._file = (self._file[0], None, self._file[2])
+        self.history.compact()
+        self.suspended = True
+        return freed
+
+    def _file_unchanged(self):
+        try:
+            return file_signature(self._file[0]) == self._file[2]
+        except OSError:
+            return False
+
+    def close(self):
+        """
+        Освобождает историю и файлы выгрузки документа.
+        """
+        self.history.close()
+        for spilled in self._spilled:
+            spilled.release()
+        self._spilled = []
+
+
+class Workspace:
+    """
+    Открытые документы с общим бюджетом памяти.
+
+    Атрибуты:
+        budget (int): Бюджет памяти всех документов, в байтах.
+        documents (list): Открытые документы в порядке открытия.
+        active (Document): Активный документ.
+        directory (str): Каталог выгрузки изображений.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, directory=None):
+        """
+        :param budget: Бюджет памяти в байтах.
+        :type budget: int
+        :param directory: Родительский каталог для каталога выгрузки, по умолчанию - системный временный.
+        :type directory: str
+        """
+        if budget <= 0:
+            raise ValueError("Бюджет памяти должен быть положительным: {}".format(budget))
+        self.budget = budget
+        self.documents = []
+        self.active = None
+        self.directory = tempfile.mkdtemp(prefix='photo_editor_documents_', dir=directory)
+        self._recent = []
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    @property
+    def nbytes(self):
+        """
+        Память, занимаемая всеми документами, в байтах.
+
+        :rtype: int
+        """
+        return sum(document.nbytes for document in self.documents)
+
+    def add(self, document):
+        """
+        Добавляет документ и делает его активным.
+
+        :param document: Документ.
+        :type document: Document
+        """
+        self.documents.append(document)
+        self.activate(document)
+
+    def activate(self, document):
+        """
+        Делает документ активным. Освобожденная память документа возвращается по требованию.
+
+        :param document: Документ.
+        :type document: Document
+        """
+        self.active = document
+        document.suspended = False
+        if document in self._recent:
+            self._recent.remove(document)
+        self._recent.append(document)
+        self.enforce()
+
+    def remove(self, document):
+        """
+        Закрывает документ.
+
+        :param document: Документ.
+        :type document: Document
+        """
+        self.documents.remove(document)
+        self._recent.remove(document)
+        document.close()
+        if self.active is document:
+            self.active = self._recent[-1] if self._recent else None
+
+    def enforce(self):
+        """
+        Освобождает память неактивных документов, начиная с давно не использованных,
+        пока общий объем превышает бюджет.
+
+        :return: Количество документов, память которых освобождена.
+        :rtype: int
+        """
+        suspended = 0
+        for document in self._recent[:-1]:
+            if self.nbytes <= self.budget:
+                break
+            if document is not self.active and (not document.suspended or document.resident_sources()):
+                document.suspend(self.directory)
+                suspended += 1
+        return suspended
+
+    def stats(self):
+        """
+        :return: Словарь: documents, suspended, nbytes, budget.
+        :rtype: dict
+        """
+        return {
+            'documents': len(self.documents),
+            'suspended': sum(document.suspended for document in self.documents),
+            'nbytes': self.nbytes,
+            'budget': self.budget,
+        }
+
+    def close(self):
+        """
+        Закрывает все документы и удаляет каталог выгрузки.
+        """
+        for document in list(self.documents):
+            self.remove(document)
+        self._cleanup()
+
+
+def create_workspace(value=None):
+    """
+    Создает рабочую область с бюджетом из переменной окружения PHOTO_EDITOR_MEMORY.
+
+    :param value: Бюджет в мегабайтах, по умолчанию читается из окружения (1024 МБ, если не задан).
+    :type value: str
+    :rtype: Workspace
+    :raises ValueError: Если бюджет некорректен.
+    """
+    if value is None:
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    if not value.strip():
+        return Workspace()
+    try:
+        budget = int(float(value) * 1024 * 1024)
+    except ValueError:
+        raise ValueError("Бюджет памяти должен быть числом мегабайт: {}".format(value))
+    return Workspace(budget)
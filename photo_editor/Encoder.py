@@ -0,0 +1,239 @@
+"""
+Модуль кодирования и записи изображений в файл.
+
+Изображение кодируется в памяти (cv2.imencode) с параметрами кодировщика EncoderSettings
+и записывается одним проходом во временный файл в каталоге назначения, который затем
+атомарно заменяет целевой файл (os.replace). Так файл не пишется дважды (как при переносе
+временного файла с другого диска), а при сбое на месте целевого файла не остается
+недописанный файл. Модуль не зависит от PyQt5 и может вызываться из фонового потока.
+
+Параметры кодировщика задаются строкой ``jpeg_quality=90&jpeg_progressive=1&png_compression=6``
+или переменной окружения PHOTO_EDITOR_ENCODER.
+"""
+import os
+import time
+
+import cv2
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_ENCODER'
+
+# Расширения, которые кодирует save_image; файл с другим расширением сохраняется в DEFAULT_EXTENSION
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+DEFAULT_EXTENSION = '.png'
+
+# Временный файл создается с правами 0666, из которых ядро вычитает umask процесса, -
+# как при обычном создании файла (mkstemp создал бы его с правами 0600)
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+_TEMP_ATTEMPTS = 100
+
+
+class EncoderSettings:
+    """
+    Параметры кодировщиков. None - значение OpenCV по умолчанию (для PNG оно заметно быстрее
+    явно заданного уровня сжатия, так как OpenCV выбирает быструю стратегию сжатия).
+
+    Атрибуты:
+        jpeg_quality (int): Качество JPEG, 0-100.
+        jpeg_progressive (bool): Прогрессивный JPEG.
+        png_compression (int): Уровень сжатия PNG, 0-9.
+        webp_quality (int): Качество WebP, 1-100.
+    """
+
+    # Имя параметра -> (преобразование значения, минимум, максимум)
+    FIELDS = {
+        'jpeg_quality': (int, 0, 100),
+        'jpeg_progressive': (bool, None, None),
+        'png_compression': (int, 0, 9),
+        'webp_quality': (int, 1, 100),
+    }
+
+    def __init__(self, jpeg_quality=None, jpeg_progressive=None, png_compression=None, webp_quality=None):
+        """
+        :raises ValueError: Если значение вне допустимого диапазона.
+        """
+        for name, value in (('jpeg_quality', jpeg_quality), ('jpeg_progressive', jpeg_progressive),
+                            ('png_compression', png_compression), ('webp_quality', webp_quality)):
+            setattr(self, name, self._check(name, value))
+
+    @classmethod
+    def _check(cls, name, value):
+        if value is None:
+            return None
+        kind, minimum, maximum = cls.FIELDS[name]
+        value = kind(value)
+        if minimum is not None and not minimum <= value <= maximum:
+            raise ValueError("Параметр {} должен быть от {} до {}: {}".format(name, minimum, maximum, value))
+        return value
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Разбирает параметры из строки вида ``jpeg_quality=90&png_compression=6``.
+
+        :param spec: Строка параметров; пустая строка - значения по умолчанию.
+        :type spec: str
+        :rtype: EncoderSettings
+        :raises ValueError: Если параметр неизвестен или его значение недопустимо.
+        """
+        values = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split('&'))):
+            name, _, value = item.partition('=')
+            name = name.strip().lower()
+            if name not in cls.FIELDS:
+                raise ValueError("Неизвестный параметр кодировщика: {}".format(name))
+            if cls.FIELDS[name][0] is bool:
+                values[name] = value.strip().lower() in ('1', 'true', 'yes', 'on')
+            else:
+                try:
+                    values[name] = int(value)
+                except ValueError:
+                    raise ValueError("Недопустимое значение параметра {}: {}".format(name, value))
+        return cls(**values)
+
+    def params(self, extension):
+        """
+        :param extension: Расширение файла (например, ".jpg").
+        :type extension: str
+        :return: Параметры cv2.imencode для формата.
+        :rtype: list
+        """
+        extension = extension.lower()
+        params = []
+        if extension in ('.jpg', '.jpeg'):
+            if self.jpeg_quality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+            if self.jpeg_progressive is not None:
+                params += [cv2.IMWRITE_JPEG_PROGRESSIVE, int(self.jpeg_progressive)]
+        elif extension == '.png':
+            if self.png_compression is not None:
+                params += [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        elif extension == '.webp':
+            if self.webp_quality is not None:
+                params += [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality]
+        return params
+
+    def __repr__(self):
+        values = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.FIELDS
+                           if getattr(self, name) is not None)
+        return 'EncoderSettings({})'.format(values)
+
+
+def create_settings(value=None):
+    """
+    Создает параметры кодировщиков по значению переменной окружения PHOTO_EDITOR_ENCODER.
+
+    :param value: Строка параметров, по умолчанию читается из окружения.
+    :type value: str
+    :rtype: EncoderSettings
+    """
+    if value is None:
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    return EncoderSettings.parse(value)
+
+
+def target_path(file_name):
+    """
+    :param file_name: Выбранный путь к файлу.
+    :type file_name: str
+    :return: Путь с поддерживаемым расширением: без него добавляется DEFAULT_EXTENSION.
+    :rtype: str
+    """
+    if file_name.lower().endswith(EXTENSIONS):
+        return file_name
+    return file_name + DEFAULT_EXTENSION
+
+
+def encode_image(image, extension, settings=None):
+    """
+    Кодирует изображение в памяти.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param extension: Расширение, определяющее формат.
+    :type extension: str
+    :param settings: Параметры кодировщиков, по умолчанию - значения OpenCV.
+    :type settings: EncoderSettings
+    :return: Закодированные байты.
+    :rtype: numpy.ndarray
+    :raises ValueError: Если изображение не удалось закодировать.
+    """
+    params = settings.params(extension) if settings is not None else []
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError("Не удалось закодировать изображение в формат {}".format(extension))
+    return encoded
+
+
+def _create_temp(path):
+    """
+    Создает временный файл рядом с path.
+
+    :return: (дескриптор, путь к временному файлу).
+    :rtype: tuple
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    prefix = '.' + os.path.basename(path) + '.'
+    for _ in range(_TEMP_ATTEMPTS):
+        temp_name = os.path.join(directory, prefix + os.urandom(6).hex() + '.tmp')
+        try:
+            return os.open(temp_name, _TEMP_FLAGS, 0o666), temp_name
+        except FileExistsError:
+            continue
+    raise FileExistsError("Не удалось создать временный файл в каталоге {}".format(directory))
+
+
+def write_atomic(path, data):
+    """
+    Записывает данные во временный файл в каталоге назначения и атомарно заменяет им файл path.
+    Права существующего файла сохраняются.
+
+    :param path: Путь к файлу.
+    :type path: str
+    :param data: Данные (bytes или numpy.ndarray).
+    """
+    descriptor, temp_name = _create_temp(path)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(memoryview(data))
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            os.chmod(temp_name, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_name, path)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def save_image(image, file_name, settings=None):
+    """
+    Кодирует изображение в памяти и атомарно записывает его в файл. Может вызываться
+    не из главного потока.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param file_name: Путь к файлу; формат определяется расширением (target_path).
+    :type file_name: str
+    :param settings: Параметры кодировщиков, по умолчанию - значения OpenCV.
+    :type settings: EncoderSettings
+    :return: Словарь: path, bytes (размер файла), encode (с), write (с), mb_per_s (пикселей
+        изображения в секунду кодирования и записи).
+    :rtype: dict
+    """
+    path = target_path(file_name)
+    started = time.perf_counter()
+    encoded = encode_image(image, os.path.splitext(path)[1], settings)
+    encoded_at = time.perf_counter()
+    write_atomic(path, encoded)
+    finished = time.perf_counter()
+    elapsed = finished - started
+    return {
+        'path': path,
+        'bytes': encoded.nbytes,
+        'encode': encoded_at - started,
+        'write': finished - encoded_at,
+        'mb_per_s': image.nbytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,437 @@
+"""
+Модуль источников кадров для окна камеры и потока захвата.
+
+Источник кадров - объект с методами read(image=None) -> (успех, кадр), is_opened() и release().
+Реализованы источники:
+
+- DeviceSource - камера через cv2.VideoCapture (V4L2 в Linux, DirectShow в Windows);
+- VideoFileSource - видеофайл, по умолчанию воспроизводится по кругу;
+- ImageDirectorySource - каталог с изображениями, кадры читаются по порядку имен;
+- SyntheticSource - генератор движущегося тестового изображения.
+
+Для всех источников задаются разрешение, частота кадров, FOURCC и размер буфера. Камера
+получает их как параметры драйвера (фактические значения читаются обратно), остальные
+источники приводят кадры к заданному разрешению и отдают их с заданной частотой, что
+позволяет нагружать предпросмотр и захват без камеры. Модуль не зависит от PyQt5.
+
+Источник описывается строкой (см. parse_source), например ``device:0?width=1280&height=720&fourcc=MJPG``,
+``file:video.mp4``, ``dir:frames/?fps=15`` или ``synthetic?width=1920&height=1080&fps=60``.
+"""
+import abc
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from photo_editor import Batch
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_CAMERA'
+
+# Имя backend -> константа cv2 для DeviceSource
+BACKENDS = {
+    'any': cv2.CAP_ANY,
+    'v4l2': cv2.CAP_V4L2,
+    'dshow': cv2.CAP_DSHOW,
+    'msmf': cv2.CAP_MSMF,
+    'avfoundation': cv2.CAP_AVFOUNDATION,
+}
+
+# Параметры источника, которые можно задать в строке описания, и их типы
+SETTINGS = {
+    'width': int,
+    'height': int,
+    'fps': float,
+    'fourcc': str,
+    'buffer_size': int,
+    'loop': lambda value: value.lower() not in ('0', 'false', 'no'),
+    'backend': str,
+}
+
+
+def default_backend():
+    """
+    Возвращает backend камеры по умолчанию для текущей платформы.
+
+    :rtype: str
+    """
+    if sys.platform.startswith('win'):
+        return 'dshow'
+    if sys.platform.startswith('linux'):
+        return 'v4l2'
+    return 'any'
+
+
+def fourcc_code(fourcc):
+    """
+    Преобразует строку FOURCC (например, ``MJPG``) в число для cv2.
+
+    :param fourcc: Четыре символа.
+    :type fourcc: str
+    :rtype: int
+    :raises ValueError: Если строка не из четырех символов.
+    """
+    if len(fourcc) != 4:
+        raise ValueError("FOURCC должен состоять из четырех символов: {!r}".format(fourcc))
+    return cv2.VideoWriter_fourcc(*fourcc)
+
+
+def fourcc_name(code):
+    """
+    Преобразует числовой FOURCC в строку.
+
+    :param code: Значение CAP_PROP_FOURCC.
+    :type code: float
+    :return: Четыре символа или пустая строка для нулевого кода.
+    :rtype: str
+    """
+    code = int(code)
+    if code <= 0:
+        return ''
+    return ''.join(chr((code >> (8 * index)) & 0xFF) for index in range(4))
+
+
+class FrameSource(abc.ABC):
+    """
+    Базовый класс источника кадров.
+
+    Атрибуты:
+        width (int): Ширина кадра, None - как у источника.
+        height (int): Высота кадра, None - как у источника.
+        fps (float): Частота кадров, None или 0 - без ограничения (для нагрузочных тестов).
+        fourcc (str): Формат сжатия кадров камеры, например ``MJPG``.
+        buffer_size (int): Количество кадров в буфере драйвера камеры.
+        frames (int): Количество отданных кадров.
+    """
+
+    def __init__(self, width=None, height=None, fps=None, fourcc=None, buffer_size=None):
+        if (width is None) != (height is None):
+            raise ValueError("Ширина и высота кадра задаются вместе")
+        if width is not None and (width <= 0 or height <= 0):
+            raise ValueError("Размер кадра должен быть положительным: {}x{}".format(width, height))
+        if fps is not None and fps < 0:
+            raise ValueError("Частота кадров не может быть отрицательной: {}".format(fps))
+        if fourcc is not None:
+            fourcc_code(fourcc)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.frames = 0
+        self._deadline = None
+
+    def is_opened(self):
+        """
+        :return: Готов ли источник отдавать кадры.
+        :rtype: bool
+        """
+        return True
+
+    def read(self, image=None):
+        """
+        Читает следующий кадр.
+
+        :param image: Буфер для кадра; используется, если его форма совпадает с формой кадра.
+        :type image: numpy.ndarray
+        :return: (успех, кадр).
+        :rtype: tuple
+        """
+        ok, frame = self._read(image)
+        if not ok:
+            return False, None
+        frame = self._fit(frame, image)
+        self._pace()
+        self.frames += 1
+        return True, frame
+
+    def release(self):
+        """
+        Освобождает ресурсы источника.
+        """
+
+    def settings(self):
+        """
+        Возвращает фактические параметры источника.
+
+        :return: Словарь: kind, width, height, fps, fourcc, buffer_size.
+        :rtype: dict
+        """
+        return {
+            'kind': type(self).__name__,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'fourcc': self.fourcc,
+            'buffer_size': self.buffer_size,
+        }
+
+    @abc.abstractmethod
+    def _read(self, image):
+        """
+        Читает следующий кадр источника, по возможности в буфер image.
+
+        :return: (успех, кадр) без приведения к заданному разрешению.
+        :rtype: tuple
+        """
+
+    def _fit(self, frame, image):
+        # Приводит кадр к заданному разрешению, по возможности в переданный буфер
+        if self.width is None or frame.shape[:2] == (self.height, self.width):
+            return frame
+        size = (self.width, self.height)
+        if image is not None and image.shape == (self.height, self.width) + frame.shape[2:] and image.dtype == frame.dtype:
+            return cv2.resize(frame, size, dst=image, interpolation=cv2.INTER_AREA)
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def _pace(self):
+        # Отдает кадры не чаще fps: ожидание до момента следующего кадра
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self._deadline is None or now - self._deadline > 1.0:
+            self._deadline = now
+        elif self._deadline > now:
+            time.sleep(self._deadline - now)
+        self._deadline += 1.0 / self.fps
+
+
+class DeviceSource(FrameSource):
+    """
+    Камера через cv2.VideoCapture. Параметры передаются драйверу, фактические значения
+    читаются обратно после открытия. Частоту задает сама камера.
+    """
+
+    def __init__(self, device=0, backend=None, width=None, height=None, fps=None, fourcc=None, buffer_size=None):
+        """
+        :param device: Номер камеры или путь к устройству (например, ``/dev/video0``).
+        :type device: int or str
+        :param backend: Имя из BACKENDS, по умолчанию - default_backend().
+        :type backend: str
+        """
+        super().__init__(width, height, fps, fourcc, buffer_size)
+        self.backend = backend or default_backend()
+        if self.backend not in BACKENDS:
+            raise ValueError("Неизвестный backend камеры: {}".format(self.backend))
+        self.device = device
+        self.capture = cv2.VideoCapture(device, BACKENDS[self.backend])
+        if self.capture.isOpened():
+            # FOURCC задается до разрешения: от формата зависят доступные разрешения
+            if fourcc is not None:
+                self.capture.set(cv2.CAP_PROP_FOURCC, fourcc_code(fourcc))
+            if width is not None:
+                self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if fps:
+                self.capture.set(cv2.CAP_PROP_FPS, fps)
+            if buffer_size is not None:
+                self.capture.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+    def is_opened(self):
+        return self.capture.isOpened()
+
+    def read(self, image=None):
+        # Камера сама задает темп и разрешение, кадр читается прямо в буфер
+        ok, frame = self._read(image)
+        if not ok:
+            return False, None
+        self.frames += 1
+        return True, frame
+
+    def _read(self, image):
+        return self.capture.read(image) if image is not None else self.capture.read()
+
+    def release(self):
+        self.capture.release()
+
+    def settings(self):
+        result = super().settings()
+        if self.capture.isOpened():
+            result.update({
+                'width': int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'fps': self.capture.get(cv2.CAP_PROP_FPS),
+                'fourcc': fourcc_name(self.capture.get(cv2.CAP_PROP_FOURCC)),
+                'buffer_size': int(self.capture.get(cv2.CAP_PROP_BUFFERSIZE)),
+            })
+        result['backend'] = self.backend
+        return result
+
+
+class VideoFileSource(FrameSource):
+    """
+    Видеофайл как источник кадров. По умолчанию кадры отдаются с частотой видео,
+    по окончании файла воспроизведение начинается сначала.
+    """
+
+    def __init__(self, path, loop=True, width=None, height=None, fps=None, fourcc=None, buffer_size=None):
+        """
+        :param path: Путь к видеофайлу.
+        :type path: str
+        :param loop: Начинать сначала по окончании файла.
+        :type loop: bool
+        :param fps: Частота отдачи кадров, None - частота видео, 0 - без ограничения.
+        :type fps: float
+        """
+        super().__init__(width, height, fps, fourcc, buffer_size)
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if fps is None and self.capture.isOpened():
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+
+    def is_opened(self):
+        return self.capture.isOpened()
+
+    def _read(self, image):
+        ok, frame = self._read_capture(image)
+        if not ok and self.loop and self.frames:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._read_capture(image)
+        return ok, frame
+
+    def _read_capture(self, image):
+        if image is not None and self.width is None:
+            return self.capture.read(image)
+        return self.capture.read()
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    Каталог с изображениями как источник кадров: файлы читаются по порядку имен.
+    """
+
+    def __init__(self, directory, loop=True, width=None, height=None, fps=None, fourcc=None, buffer_size=None):
+        """
+        :param directory: Каталог (обходится рекурсивно) или шаблон glob.
+        :type directory: str
+        :param loop: Начинать сначала после последнего файла.
+        :type loop: bool
+        """
+        super().__init__(width, height, fps, fourcc, buffer_size)
+        self.paths = Batch.collect_images(directory)
+        self.loop = loop
+        self._index = 0
+
+    def is_opened(self):
+        return bool(self.paths)
+
+    def _read(self, image):
+        if self._index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self._index = 0
+        path = self.paths[self._index]
+        self._index += 1
+        frame = Batch.read_image(path)
+        return frame is not None, frame
+
+
+class SyntheticSource(FrameSource):
+    """
+    Генератор тестовых кадров: цветной градиент, сдвигающийся на каждом кадре.
+    Кадр формируется копированием части заранее построенного изображения, без вычислений.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0, fourcc=None, buffer_size=None, speed=8):
+        """
+        :param speed: Сдвиг градиента за кадр, в пикселях.
+        :type speed: int
+        """
+        super().__init__(width, height, fps, fourcc, buffer_size)
+        self.speed = speed
+        x = np.arange(2 * width, dtype=np.float32) / width
+        y = np.arange(height, dtype=np.float32)[:, None] / height
+        pattern = np.empty((height, 2 * width, 3), dtype=np.uint8)
+        pattern[:, :, 0] = 255 * (0.5 + 0.5 * np.sin(2 * np.pi * x))
+        pattern[:, :, 1] = 255 * y
+        pattern[:, :, 2] = 255 * (0.5 + 0.5 * np.cos(2 * np.pi * x)) * (1 - y)
+        self._pattern = pattern
+
+    def _read(self, image):
+        if image is None or image.shape != (self.height, self.width, 3) or image.dtype != np.uint8:
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        offset = (self.frames * self.speed) % self.width
+        np.copyto(image, self._pattern[:, offset:offset + self.width])
+        return True, image
+
+
+def parse_source(spec):
+    """
+    Разбирает строковое описание источника.
+
+    Формат: ``[вид:]цель[?параметр=значение&...]``. Вид - device, v4l2, dshow, file, dir
+    или synthetic; без вида число означает камеру, каталог - ImageDirectorySource, файл -
+    VideoFileSource. Параметры: width, height, fps, fourcc, buffer_size, loop, backend.
+
+    :param spec: Описание источника.
+    :type spec: str
+    :return: (вид, цель, словарь параметров).
+    :rtype: tuple
+    :raises ValueError: Если вид или параметр неизвестен.
+    """
+    spec, _, query = spec.partition('?')
+    settings = {}
+    for item in filter(None, query.split('&')):
+        key, _, value = item.partition('=')
+        key = key.strip().lower()
+        if key not in SETTINGS:
+            raise ValueError("Неизвестный параметр источника кадров: {}".format(key))
+        try:
+            settings[key] = SETTINGS[key](value.strip())
+        except ValueError:
+            raise ValueError("Некорректное значение параметра {}: {!r}".format(key, value))
+    kind, separator, target = spec.partition(':')
+    if not separator or (len(kind) == 1 and os.name == 'nt'):
+        # Без вида (или путь Windows вида C:\...): вид определяется по цели
+        kind, target = '', spec
+    kind = kind.strip().lower()
+    if kind in ('v4l2', 'dshow'):
+        settings['backend'] = kind
+        kind = 'device'
+    if not kind:
+        if target == 'synthetic':
+            kind, target = 'synthetic', ''
+        elif target.isdigit() or target.startswith('/dev/'):
+            kind = 'device'
+        elif os.path.isdir(target):
+            kind = 'dir'
+        else:
+            kind = 'file'
+    if kind not in SOURCES:
+        raise ValueError("Неизвестный вид источника кадров: {}".format(kind))
+    return kind, target, settings
+
+
+def open_source(spec=None):
+    """
+    Создает источник кадров по описанию.
+
+    :param spec: Описание (см. parse_source). По умолчанию берется из переменной окружения
+        PHOTO_EDITOR_CAMERA, а если она не задана - первая камера.
+    :type spec: str
+    :return: Источник кадров.
+    :rtype: FrameSource
+    """
+    if spec is None:
+        spec = os.environ.get(ENVIRONMENT_VARIABLE) or 'device:0'
+    kind, target, settings = parse_source(spec)
+    return SOURCES[kind](target, settings)
+
+
+def _without(settings, *names):
+    return {key: value for key, value in settings.items() if key not in names}
+
+
+# Вид источника -> функция (цель, параметры) -> FrameSource
+SOURCES = {
+    'device': lambda target, settings: DeviceSource(int(target) if target.isdigit() else target or 0,
+                                                    **_without(settings, 'loop')),
+    'file': lambda target, settings: VideoFileSource(target, **_without(settings, 'backend')),
+    'dir': lambda target, settings: ImageDirectorySource(target, **_without(settings, 'backend')),
+    'synthetic': lambda target, settings: SyntheticSource(**_without(settings, 'loop', 'backend')),
+}
@@ -0,0 +1,232 @@
+"""
+Модуль панели галереи: миниатюры изображений выбранного каталога.
+
+Миниатюры загружаются лениво: модель запрашивает миниатюру, только когда представление
+рисует ее элемент, а перед запуском задания проверяется, что элемент все еще виден.
+Последние запрошенные миниатюры строятся первыми, поэтому при быстрой прокрутке сначала
+появляются миниатюры текущего экрана. Задания выполняются в отдельном пуле потоков
+и используют дисковый кэш (модуль Thumbnails); показанные миниатюры хранятся в памяти
+с ограничением количества.
+"""
+from collections import OrderedDict
+import os
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from photo_editor import Thumbnails
+from photo_editor.Picture import Picture
+from photo_editor.Worker import TaskRunner
+
+# Количество миниатюр QPixmap в памяти
+MEMORY_CAPACITY = 1024
+
+
+def _load_thumbnail(cache, generation, row, path):
+    try:
+        thumbnail = cache.load(path)
+        image = Picture.convert_cv_qimage(thumbnail) if thumbnail is not None else None
+    except Exception:  # поврежденный или недоступный файл показывается без миниатюры
+        image = None
+    return generation, row, image
+
+
+class ThumbnailModel(QtCore.QAbstractListModel):
+    """
+    Модель списка изображений каталога с миниатюрами.
+
+    Сигналы:
+        thumbnailRequested (int): Представлению нужна миниатюра строки.
+    """
+    thumbnailRequested = QtCore.pyqtSignal(int)
+
+    def __init__(self, size, parent=None):
+        """
+        :param size: Наибольшая сторона миниатюры.
+        :type size: int
+        :param parent: Родительский объект Qt.
+        """
+        super().__init__(parent)
+        self.paths = []
+        self._pixmaps = OrderedDict()
+        self._failed = set()
+        self._placeholder = QtGui.QPixmap(size, size)
+        self._placeholder.fill(QtGui.QColor(48, 48, 48))
+
+    def set_paths(self, paths):
+        """
+        :param paths: Пути к изображениям.
+        :type paths: list
+        """
+        self.beginResetModel()
+        self.paths = list(paths)
+        self._pixmaps.clear()
+        self._failed.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == QtCore.Qt.ToolTipRole:
+            return path
+        if role == QtCore.Qt.DecorationRole:
+            pixmap = self._pixmaps.get(path)
+            if pixmap is not None:
+                self._pixmaps.move_to_end(path)
+                return pixmap
+            if path not in self._failed:
+                self.thumbnailRequested.emit(index.row())
+            return self._placeholder
+        return None
+
+    def has_thumbnail(self, row):
+        """
+        :return: Есть ли миниатюра строки в памяти или ее не удалось построить.
+        :rtype: bool
+        """
+        path = self.paths[row]
+        return path in self._pixmaps or path in self._failed
+
+    def set_thumbnail(self, row, image):
+        """
+        :param row: Строка.
+        :type row: int
+        :param image: Миниатюра или None, если изображение не удалось декодировать.
+        :type image: QtGui.QImage
+        """
+        path = self.paths[row]
+        if image is None:
+            self._failed.add(path)
+        else:
+            self._pixmaps[path] = QtGui.QPixmap.fromImage(image)
+            while len(self._pixmaps) > MEMORY_CAPACITY:
+                self._pixmaps.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+
+class GalleryPanel(QtWidgets.QDockWidget):
+    """
+    Панель галереи: выбор каталога и сетка миниатюр его изображений.
+
+    Сигналы:
+        imageActivated (str): Выбрано изображение (двойной щелчок или Enter), передается путь.
+
+    Атрибуты:
+        cache (ThumbnailCache): Дисковый кэш миниатюр.
+        directory (str): Текущий каталог.
+    """
+    imageActivated = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None, cache=None):
+        """
+        :param parent: Родительский виджет.
+        :param cache: Кэш миниатюр, по умолчанию создается функцией Thumbnails.create_cache.
+        :type cache: ThumbnailCache
+        """
+        super().__init__("Галерея", parent)
+        self.setObjectName("GalleryPanel")
+        self.cache = cache if cache is not None else Thumbnails.create_cache()
+        self.directory = None
+        self._generation = 0
+        self._wanted = OrderedDict()
+        self._in_flight = 0
+        # Строки, миниатюры которых строятся сейчас: перерисовка до их готовности не запускает
+        # повторное построение
+        self._in_flight_rows = set()
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(max(2, QtCore.QThread.idealThreadCount()))
+        self._runner = TaskRunner(self, self._pool)
+        self._runner.finished.connect(self._on_loaded)
+        self._runner.failed.connect(lambda message: self._on_loaded(None))
+
+        self.model = ThumbnailModel(self.cache.size, self)
+        self.model.thumbnailRequested.connect(self._request)
+
+        widget = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(widget)
+        header = QtWidgets.QHBoxLayout()
+        self.buttonDirectory = QtWidgets.QPushButton("Папка...", widget)
+        self.buttonDirectory.clicked.connect(self.choose_directory)
+        self.labelDirectory = QtWidgets.QLabel(widget)
+        header.addWidget(self.buttonDirectory)
+        header.addWidget(self.labelDirectory, 1)
+        layout.addLayout(header)
+
+        self.view = QtWidgets.QListView(widget)
+        self.view.setViewMode(QtWidgets.QListView.IconMode)
+        self.view.setResizeMode(QtWidgets.QListView.Adjust)
+        self.view.setMovement(QtWidgets.QListView.Static)
+        self.view.setUniformItemSizes(True)
+        # Раскладка тысяч элементов частями, чтобы открытие каталога не блокировало окно
+        self.view.setLayoutMode(QtWidgets.QListView.Batched)
+        self.view.setBatchSize(500)
+        self.view.setIconSize(QtCore.QSize(self.cache.size, self.cache.size))
+        self.view.setGridSize(QtCore.QSize(self.cache.size + 24, self.cache.size + 36))
+        self.view.setModel(self.model)
+        self.view.activated.connect(lambda index: self.imageActivated.emit(self.model.paths[index.row()]))
+        layout.addWidget(self.view)
+        self.setWidget(widget)
+        self.setStyleSheet("color: rgb(255, 255, 255);")
+
+    def choose_directory(self):
+        """
+        Открывает диалоговое окно выбора каталога и показывает его изображения.
+        """
+        directory = QtWidgets.QFileDialog.getExistingDirectory(self, "Выбрать папку", self.directory or "")
+        if directory:
+            self.set_directory(directory)
+
+    def set_directory(self, directory):
+        """
+        Показывает изображения каталога. Незавершенные задания прежнего каталога игнорируются.
+
+        :param directory: Путь к каталогу.
+        :type directory: str
+        """
+        self._generation += 1
+        self._wanted.clear()
+        self._in_flight_rows.clear()
+        self.directory = directory
+        self.labelDirectory.setText(directory)
+        self.model.set_paths(Thumbnails.list_images(directory))
+
+    def _request(self, row):
+        self._wanted[row] = None
+        self._wanted.move_to_end(row)
+        # Запуск откладывается до возврата в цикл событий: во время отрисовки
+        # запрашиваются миниатюры всех видимых элементов
+        QtCore.QTimer.singleShot(0, self._schedule)
+
+    def _visible(self, row):
+        return self.view.visualRect(self.model.index(row)).intersects(self.view.viewport().rect())
+
+    def _schedule(self):
+        while self._wanted and self._in_flight < self._pool.maxThreadCount():
+            row, _ = self._wanted.popitem(last=True)
+            if row in self._in_flight_rows or self.model.has_thumbnail(row) or not self._visible(row):
+                continue
+            self._in_flight += 1
+            self._in_flight_rows.add(row)
+            self._runner.submit(_load_thumbnail, self.cache, self._generation, row, self.model.paths[row])
+
+    def _on_loaded(self, result):
+        self._in_flight -= 1
+        if result is not None:
+            generation, row, image = result
+            if generation == self._generation:
+                self._in_flight_rows.discard(row)
+                self.model.set_thumbnail(row, image)
+        self._schedule()
+
+    def shutdown(self):
+        """
+        Отменяет ожидающие миниатюры и дожидается выполняемых заданий (перед закрытием окна).
+        """
+        self._wanted.clear()
+        self._runner.wait()
@@ -0,0 +1,754 @@
+"""
+Модуль истории изменений изображения для отмены (undo) и повтора (redo) действий.
+
+Класс History хранит состояния изображения с ограничением по занимаемой памяти:
+
+- несколько последних состояний хранятся как есть (горячее окно);
+- более старые состояния сжимаются в фоновом потоке: каждое keyframe_interval-е состояние
+  сохраняется целиком (ключевой кадр), остальные - как сжатая разность (XOR) с предыдущим
+  состоянием;
+- при превышении бюджета самые старые состояния удаляются в том же фоновом потоке; размер
+  еще не сжатых состояний оценивается по степени сжатия предыдущих, поэтому добавление
+  состояния не ждет сжатия.
+
+Разность XOR обратима, поэтому шаг назад или вперед от текущего состояния стоит одной
+распаковки и одного прохода XOR, а восстановленные пиксели в точности совпадают с исходными.
+
+Класс DiskHistory для очень длинных сессий выгружает состояния за пределами горячего окна
+в каталог сессии на диске и загружает их обратно через np.memmap только по требованию,
+поэтому потребление памяти не растет с длиной истории.
+
+Класс CommandHistory хранит вместо пикселей журнал операций с аргументами и полное
+изображение только в контрольных точках через каждые checkpoint_interval шагов. Любое
+состояние восстанавливается повтором операций от ближайшей контрольной точки, так что
+интервал задает компромисс между памятью и задержкой отмены.
+
+Режим истории выбирается функцией create_history или переменной окружения
+PHOTO_EDITOR_HISTORY: compressed (по умолчанию), disk или commands, после двоеточия
+можно указать основной параметр режима - бюджет в мегабайтах для compressed и disk
+или интервал контрольных точек для commands (например, ``commands:8``).
+"""
+from collections import deque
+import itertools
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+
+import numpy as np
+
+from photo_editor import Chain
+
+DEFAULT_BUDGET = 512 * 1024 * 1024
+DEFAULT_KEYFRAME_INTERVAL = 10
+DEFAULT_HOT_STATES = 2
+DEFAULT_CHECKPOINT_INTERVAL = 8
+
+# Задание фонового потока: удалить старые состояния, если история превышает бюджет
+_ENFORCE = object()
+
+
+def action_operations(action):
+    """
+    Возвращает список операций действия истории.
+
+    :param action: Кортеж (имя операции, аргументы) или список таких кортежей для
+        объединенного действия.
+    :return: Список кортежей (имя операции, кортеж аргументов).
+    :rtype: list
+    """
+    if isinstance(action, list):
+        return action
+    return [action]
+
+
+class _Entry:
+    """
+    Одно состояние истории.
+
+    Атрибуты:
+        raw (numpy.ndarray): Несжатое изображение или None, если состояние уже сжато.
+        base (numpy.ndarray): Предыдущее состояние, относительно которого будет построена разность,
+            или None для ключевого кадра.
+        payload: Упакованное состояние: сжатые данные (ключевой кадр или разность) либо путь к файлу.
+        size (int): Память, занимаемая упакованным состоянием, в байтах.
+        keyframe (bool): Является ли состояние ключевым кадром.
+    """
+    __slots__ = ('raw', 'base', 'payload', 'size', 'keyframe', 'shape', 'dtype', 'queued')
+
+    def __init__(self, image, base):
+        self.raw = image
+        self.base = base
+        self.payload = None
+        self.size = 0
+        self.keyframe = base is None
+        self.shape = image.shape
+        self.dtype = image.dtype
+        self.queued = False
+
+    @property
+    def nbytes(self):
+        if self.raw is not None:
+            return self.raw.nbytes
+        return self.size
+
+
+class History:
+    """
+    История состояний изображения с ограниченным бюджетом памяти.
+
+    Атрибуты:
+        budget (int): Бюджет памяти в байтах.
+        keyframe_interval (int): Через сколько состояний сохраняется полный ключевой кадр.
+        hot_states (int): Сколько последних состояний хранится несжатыми.
+        restore_times (collections.deque): Время последних восстановлений состояния (undo/redo), в секундах.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 hot_states=DEFAULT_HOT_STATES, compression_level=1):
+        """
+        Создает пустую историю и запускает фоновый поток сжатия.
+
+        :param budget: Бюджет памяти в байтах, None - без ограничения.
+        :type budget: int
+        :param keyframe_interval: Через сколько состояний сохраняется полный ключевой кадр.
+        :type keyframe_interval: int
+        :param hot_states: Сколько последних состояний хранится несжатыми (не меньше 1).
+        :type hot_states: int
+        :param compression_level: Уровень сжатия zlib (1 - быстрее, 9 - сильнее).
+        :type compression_level: int
+        """
+        self.budget = budget
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.hot_states = max(1, hot_states)
+        self.compression_level = compression_level
+        self.restore_times = deque(maxlen=256)
+        self.evicted = 0
+        # Степень сжатия последних упакованных состояний: ключевых кадров (True) и разностей (False)
+        self._ratios = {True: 1.0, False: 1.0}
+        self._entries = []
+        self._pos = -1
+        self._current = None
+        self._lock = threading.RLock()
+        self._jobs = queue.Queue()
+        self._worker = threading.Thread(target=self._compress_loop, name='history-compressor', daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        """
+        Количество состояний до текущего включительно (доступных для отмены).
+        """
+        return self._pos + 1
+
+    @property
+    def nbytes(self):
+        """
+        Память, занимаемая историей, в байтах.
+
+        :rtype: int
+        """
+        with self._lock:
+            return self._entries_nbytes(self._entries)
+
+    def can_undo(self):
+        """
+        :return: Можно ли отменить действие.
+        :rtype: bool
+        """
+        return self._pos > 0
+
+    def can_redo(self):
+        """
+        :return: Можно ли повторить отмененное действие.
+        :rtype: bool
+        """
+        return self._pos < len(self._entries) - 1
+
+    def current(self):
+        """
+        :return: Текущее состояние или None, если история пуста.
+        :rtype: numpy.ndarray
+        """
+        return self._current
+
+    def push(self, image, action=None):
+        """
+        Добавляет новое состояние. Отмененные состояния (для повтора) удаляются.
+
+        :param image: Изображение OpenCV. После добавления не должно изменяться.
+        :type image: numpy.ndarray
+        :param action: Операция, которая привела к состоянию, - кортеж (имя, аргументы),
+            None для загруженного или снятого изображения. В этом режиме не используется.
+        :type action: tuple
+        """
+        with self._lock:
+            self._discard(self._entries[self._pos + 1:])
+            del self._entries[self._pos + 1:]
+            previous = self._current
+            keyframe = (previous is None or previous.shape != image.shape or previous.dtype != image.dtype
+                        or self._keyframe_distance() + 1 >= self.keyframe_interval)
+            self._entries.append(_Entry(image, None if keyframe else previous))
+            self._pos = len(self._entries) - 1
+            self._current = image
+            for entry in self._entries[:-self.hot_states]:
+                if entry.raw is not None and not entry.queued:
+                    entry.queued = True
+                    self._jobs.put(entry)
+        if self.budget is not None and self._usage() > self.budget:
+            self._jobs.put(_ENFORCE)
+
+    def undo(self):
+        """
+        Переходит к предыдущему состоянию.
+
+        :return: Предыдущее состояние или None, если отменять нечего.
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            if not self.can_undo():
+                return None
+            started = time.perf_counter()
+            self._current = self._previous_state()
+            self._pos -= 1
+            self.restore_times.append(time.perf_counter() - started)
+            return self._current
+
+    def redo(self):
+        """
+        Переходит к следующему (отмененному) состоянию.
+
+        :return: Следующее состояние или None, если повторять нечего.
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            if not self.can_redo():
+                return None
+            started = time.perf_counter()
+            self._current = self._next_state()
+            self._pos += 1
+            self.restore_times.append(time.perf_counter() - started)
+            return self._current
+
+    def clear(self):
+        """
+        Удаляет все состояния.
+        """
+        with self._lock:
+            self._discard(self._entries)
+            self._entries = []
+            self._pos = -1
+            self._current = None
+
+    def compact(self):
+        """
+        Упаковывает все состояния, кроме текущего, не дожидаясь их выхода из горячего окна
+        (например, когда документ становится неактивным). Упаковка выполняется в фоновом потоке.
+        """
+        with self._lock:
+            for index, entry in enumerate(self._entries):
+                if index != self._pos and entry.raw is not None and not entry.queued:
+                    entry.queued = True
+                    self._jobs.put(entry)
+
+    def flush(self):
+        """
+        Ожидает завершения фонового сжатия и удаления состояний сверх бюджета.
+        """
+        self._jobs.join()
+
+    def close(self):
+        """
+        Останавливает фоновый поток и освобождает память.
+        """
+        self.clear()
+        self._jobs.put(None)
+        self._worker.join()
+
+    def stats(self):
+        """
+        Возвращает статистику истории.
+
+        :return: Словарь: states, position, nbytes, budget, keyframes, deltas, raw, evicted,
+            restore_ms_mean, restore_ms_max.
+        :rtype: dict
+        """
+        with self._lock:
+            entries = list(self._entries)
+            times = list(self.restore_times)
+        return {
+            'states': len(entries),
+            'position': self._pos,
+            'nbytes': self._entries_nbytes(entries),
+            'budget': self.budget,
+            'keyframes': sum(1 for entry in entries if entry.raw is None and entry.keyframe),
+            'deltas': sum(1 for entry in entries if entry.raw is None and not entry.keyframe),
+            'raw': sum(1 for entry in entries if entry.raw is not None),
+            'evicted': self.evicted,
+            'restore_ms_mean': 1000 * sum(times) / len(times) if times else 0.0,
+            'restore_ms_max': 1000 * max(times) if times else 0.0,
+        }
+
+    def _keyframe_distance(self):
+        """
+        Количество разностей между последним состоянием и ближайшим ключевым кадром.
+        """
+        distance = 0
+        for entry in reversed(self._entries):
+            if entry.keyframe:
+                break
+            distance += 1
+        return distance
+
+    @staticmethod
+    def _entries_nbytes(entries):
+        """
+        Память, занимаемая состояниями. Несжатое состояние удерживает предыдущее (base) до
+        своей упаковки, даже если то уже упаковано, - такое предыдущее состояние тоже учитывается.
+        """
+        live = {id(entry.raw) for entry in entries if entry.raw is not None}
+        total = 0
+        for entry in entries:
+            total += entry.nbytes
+            if entry.raw is not None and entry.base is not None and id(entry.base) not in live:
+                total += entry.base.nbytes
+        return total
+
+    def _usage(self):
+        """
+        Объем, сравниваемый с бюджетом: память, которую история займет после упаковки
+        состояний в очереди. Их размер оценивается по степени сжатия последних упакованных
+        состояний того же вида.
+        """
+        with self._lock:
+            pending = [entry for entry in self._entries if entry.raw is not None and entry.queued]
+            estimate = sum(entry.raw.nbytes * self._ratios[entry.base is None] for entry in pending)
+            packed = [entry for entry in self._entries if entry.raw is None or not entry.queued]
+            return self._entries_nbytes(packed) + int(estimate)
+
+    def _pack(self, raw, base):
+        """
+        Упаковывает состояние, вышедшее из горячего окна. Выполняется в фоновом потоке.
+
+        :param raw: Состояние.
+        :param base: Предыдущее состояние для построения разности или None для ключевого кадра.
+        :return: Кортеж (упакованные данные, занимаемая память в байтах).
+        """
+        data = raw if base is None else np.bitwise_xor(raw, base)
+        blob = zlib.compress(np.ascontiguousarray(data).data, self.compression_level)
+        return blob, len(blob)
+
+    def _unpack(self, entry):
+        """
+        Распаковывает данные состояния: полное изображение для ключевого кадра или разность.
+        Возвращаемый массив доступен только для чтения.
+        """
+        data = np.frombuffer(zlib.decompress(entry.payload), dtype=entry.dtype)
+        return data.reshape(entry.shape)
+
+    def _release(self, payload):
+        """
+        Освобождает упакованные данные, которые больше не нужны.
+        """
+
+    def _discard(self, entries):
+        """
+        Вызывается для удаляемых из истории состояний.
+        """
+        for entry in entries:
+            entry.raw = entry.base = None
+            if entry.payload is not None:
+                self._release(entry.payload)
+                entry.payload = None
+
+    def _previous_state(self):
+        """
+        Восстанавливает состояние, предшествующее текущему.
+        """
+        entry, previous = self._entries[self._pos], self._entries[self._pos - 1]
+        if previous.raw is not None:
+            return previous.raw
+        if entry.raw is not None and entry.base is not None:
+            return entry.base
+        if entry.raw is None and not entry.keyframe:
+            return np.bitwise_xor(self._current, self._unpack(entry))
+        if previous.keyframe:
+            return self._unpack(previous)
+        return self._restore(self._pos - 1)
+
+    def _next_state(self):
+        """
+        Восстанавливает состояние, следующее за текущим.
+        """
+        entry = self._entries[self._pos + 1]
+        if entry.raw is not None:
+            return entry.raw
+        if entry.keyframe:
+            return self._unpack(entry)
+        return np.bitwise_xor(self._current, self._unpack(entry))
+
+    def _restore(self, index):
+        """
+        Восстанавливает состояние по индексу от ближайшего предшествующего полного состояния.
+        """
+        start = index
+        while self._entries[start].raw is None and not self._entries[start].keyframe:
+            start -= 1
+        entry = self._entries[start]
+        image = entry.raw if entry.raw is not None else self._unpack(entry)
+        for entry in self._entries[start + 1:index + 1]:
+            if entry.raw is not None:
+                image = entry.raw
+            elif entry.keyframe:
+                image = self._unpack(entry)
+            else:
+                image = np.bitwise_xor(image, self._unpack(entry))
+        return image
+
+    def _compress_loop(self):
+        """
+        Фоновый поток: упаковывает состояния, вышедшие из горячего окна.
+        """
+        while True:
+            entry = self._jobs.get()
+            try:
+                if entry is None:
+                    return
+                if entry is _ENFORCE:
+                    self._enforce_budget()
+                    continue
+                with self._lock:
+                    raw, base = entry.raw, entry.base
+                while raw is not None:
+                    payload, size = self._pack(raw, base)
+                    with self._lock:
+                        # Пока шла упаковка, состояние могло быть удалено или предыдущее - вытеснено
+                        if entry.raw is raw and entry.base is base:
+                            entry.payload, entry.size = payload, size
+                            entry.keyframe = base is None
+                            ratio = self._ratios[entry.keyframe]
+                            self._ratios[entry.keyframe] = ratio + 0.5 * (size / raw.nbytes - ratio)
+                            entry.raw = None
+                            entry.base = None
+                        else:
+                            self._release(payload)
+                        raw, base = entry.raw, entry.base
+            finally:
+                self._jobs.task_done()
+
+    def _enforce_budget(self):
+        """
+        Удаляет самые старые состояния, пока история превышает бюджет. Выполняется в фоновом
+        потоке; блокировка снимается между удалениями, чтобы не задерживать отмену и повтор.
+        Текущее состояние не удаляется.
+        """
+        while True:
+            with self._lock:
+                if self.budget is None or self._pos <= 0 or self._usage() <= self.budget:
+                    return
+                following = self._entries[1]
+                if following.raw is None and not following.keyframe:
+                    payload, size = self._pack(self._restore(1), None)
+                    self._release(following.payload)
+                    following.payload, following.size = payload, size
+                    following.keyframe = True
+                elif following.raw is not None:
+                    following.base = None
+                    following.keyframe = True
+                self._discard(self._entries[:1])
+                del self._entries[0]
+                self._pos -= 1
+                self.evicted += 1
+
+
+class DiskHistory(History):
+    """
+    История, выгружающая старые состояния на диск в виде несжатых кадров.
+
+    В памяти остаются только hot_states последних состояний, остальные записываются в
+    каталог сессии и при отмене загружаются лениво через np.memmap. Каталог удаляется
+    методом close() (и при завершении процесса, если close() не был вызван).
+
+    Атрибуты:
+        directory (str): Каталог сессии с файлами состояний.
+        budget (int): Ограничение объема файлов на диске в байтах, None - без ограничения.
+    """
+
+    def __init__(self, budget=None, hot_states=DEFAULT_HOT_STATES, directory=None):
+        """
+        Создает пустую историю и каталог сессии.
+
+        :param budget: Ограничение объема файлов на диске в байтах, None - без ограничения.
+        :type budget: int
+        :param hot_states: Сколько последних состояний хранится в памяти (не меньше 1).
+        :type hot_states: int
+        :param directory: Родительский каталог для каталога сессии, по умолчанию - системный временный.
+        :type directory: str
+        """
+        super().__init__(budget=budget, keyframe_interval=1, hot_states=hot_states)
+        self.directory = tempfile.mkdtemp(prefix='photo_editor_history_', dir=directory)
+        self._names = itertools.count()
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def close(self):
+        """
+        Останавливает фоновый поток и удаляет каталог сессии.
+        """
+        super().close()
+        self._cleanup()
+
+    @property
+    def disk_bytes(self):
+        """
+        Объем файлов состояний на диске в байтах.
+
+        :rtype: int
+        """
+        with self._lock:
+            return sum(int(np.prod(entry.shape)) * entry.dtype.itemsize
+                       for entry in self._entries if entry.payload is not None)
+
+    def stats(self):
+        """
+        Возвращает статистику истории, дополненную объемом файлов на диске (disk_bytes).
+
+        :rtype: dict
+        """
+        stats = super().stats()
+        stats['spilled'] = stats.pop('keyframes')
+        stats['disk_bytes'] = self.disk_bytes
+        return stats
+
+    def _usage(self):
+        # Состояния в очереди на выгрузку займут на диске свой полный размер
+        with self._lock:
+            pending = sum(entry.raw.nbytes for entry in self._entries if entry.raw is not None and entry.queued)
+        return self.disk_bytes + pending
+
+    def _pack(self, raw, base):
+        path = os.path.join(self.directory, '{:08d}.raw'.format(next(self._names)))
+        np.ascontiguousarray(raw).tofile(path)
+        return path, 0
+
+    def _unpack(self, entry):
+        return np.memmap(entry.payload, dtype=entry.dtype, mode='r', shape=entry.shape)
+
+    def _release(self, payload):
+        try:
+            os.remove(payload)
+        except OSError:  # файл может быть еще отображен в память (Windows)
+            pass
+
+
+class CommandHistory:
+    """
+    История в виде журнала операций с периодическими контрольными точками.
+
+    Для каждого шага хранится операция и ее аргументы, полное изображение - только для
+    загруженных изображений и каждого checkpoint_interval-го шага. Шаг вперед применяет
+    одну операцию к текущему состоянию, шаг назад повторяет операции от ближайшей
+    контрольной точки (соседние поточечные операции выполняются за один проход, см. Chain).
+
+    Атрибуты:
+        checkpoint_interval (int): Через сколько шагов сохраняется контрольная точка.
+        restore_times (collections.deque): Время последних восстановлений состояния (undo/redo), в секундах.
+    """
+
+    def __init__(self, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Создает пустую историю.
+
+        :param checkpoint_interval: Через сколько шагов сохраняется контрольная точка (1 - каждый шаг).
+        :type checkpoint_interval: int
+        """
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.restore_times = deque(maxlen=256)
+        self._entries = []
+        self._pos = -1
+        self._current = None
+
+    def __len__(self):
+        """
+        Количество состояний до текущего включительно (доступных для отмены).
+        """
+        return self._pos + 1
+
+    @property
+    def nbytes(self):
+        """
+        Память, занимаемая контрольными точками, в байтах.
+
+        :rtype: int
+        """
+        return sum(checkpoint.nbytes for _, checkpoint in self._entries if checkpoint is not None)
+
+    def can_undo(self):
+        """
+        :return: Можно ли отменить действие.
+        :rtype: bool
+        """
+        return self._pos > 0
+
+    def can_redo(self):
+        """
+        :return: Можно ли повторить отмененное действие.
+        :rtype: bool
+        """
+        return self._pos < len(self._entries) - 1
+
+    def current(self):
+        """
+        :return: Текущее состояние или None, если история пуста.
+        :rtype: numpy.ndarray
+        """
+        return self._current
+
+    def push(self, image, action=None):
+        """
+        Добавляет новое состояние. Отмененные состояния (для повтора) удаляются.
+
+        :param image: Изображение OpenCV. После добавления не должно изменяться.
+        :type image: numpy.ndarray
+        :param action: Операция, которая привела к состоянию, - кортеж (имя, аргументы)
+            или их список для объединенного действия. None для загруженного или снятого
+            изображения: такое состояние всегда сохраняется как контрольная точка.
+        :type action: tuple
+        """
+        del self._entries[self._pos + 1:]
+        distance = 0
+        for _, checkpoint in reversed(self._entries):
+            if checkpoint is not None:
+                break
+            distance += 1
+        if action is None or distance + 1 >= self.checkpoint_interval:
+            self._entries.append((action, image))
+        else:
+            self._entries.append((action, None))
+        self._pos = len(self._entries) - 1
+        self._current = image
+
+    def undo(self):
+        """
+        Переходит к предыдущему состоянию.
+
+        :return: Предыдущее состояние или None, если отменять нечего.
+        :rtype: numpy.ndarray
+        """
+        if not self.can_undo():
+            return None
+        started = time.perf_counter()
+        self._current = self._restore(self._pos - 1)
+        self._pos -= 1
+        self.restore_times.append(time.perf_counter() - started)
+        return self._current
+
+    def redo(self):
+        """
+        Переходит к следующему (отмененному) состоянию.
+
+        :return: Следующее состояние или None, если повторять нечего.
+        :rtype: numpy.ndarray
+        """
+        if not self.can_redo():
+            return None
+        started = time.perf_counter()
+        action, checkpoint = self._entries[self._pos + 1]
+        if checkpoint is not None:
+            self._current = checkpoint
+        else:
+            self._current = Chain.run(self._current, action_operations(action))
+        self._pos += 1
+        self.restore_times.append(time.perf_counter() - started)
+        return self._current
+
+    def clear(self):
+        """
+        Удаляет все состояния.
+        """
+        self._entries = []
+        self._pos = -1
+        self._current = None
+
+    def compact(self):
+        """
+        Совместимость с History: полные изображения хранятся только в контрольных точках.
+        """
+
+    def flush(self):
+        """
+        Совместимость с History: фоновых операций нет.
+        """
+
+    def close(self):
+        """
+        Освобождает память.
+        """
+        self.clear()
+
+    def stats(self):
+        """
+        Возвращает статистику истории.
+
+        :return: Словарь: states, position, nbytes, checkpoints, checkpoint_interval,
+            restore_ms_mean, restore_ms_max.
+        :rtype: dict
+        """
+        times = list(self.restore_times)
+        return {
+            'states': len(self._entries),
+            'position': self._pos,
+            'nbytes': self.nbytes,
+            'checkpoints': sum(1 for _, checkpoint in self._entries if checkpoint is not None),
+            'checkpoint_interval': self.checkpoint_interval,
+            'restore_ms_mean': 1000 * sum(times) / len(times) if times else 0.0,
+            'restore_ms_max': 1000 * max(times) if times else 0.0,
+        }
+
+    def _restore(self, index):
+        """
+        Восстанавливает состояние повтором операций от ближайшей контрольной точки.
+        """
+        start = index
+        while self._entries[start][1] is None:
+            start -= 1
+        operations = []
+        for action, _ in self._entries[start + 1:index + 1]:
+            operations.extend(action_operations(action))
+        return Chain.run(self._entries[start][1], operations)
+
+
+# Режим -> (класс, имя основного параметра и множитель для значения после двоеточия)
+HISTORY_MODES = {
+    'compressed': (History, 'budget', 1024 * 1024),
+    'disk': (DiskHistory, 'budget', 1024 * 1024),
+    'commands': (CommandHistory, 'checkpoint_interval', 1),
+}
+
+
+def create_history(mode=None, **kwargs):
+    """
+    Создает историю заданного режима.
+
+    :param mode: Режим из HISTORY_MODES, при необходимости с основным параметром после двоеточия
+        (``compressed:256`` - бюджет 256 МБ, ``commands:8`` - контрольная точка каждые 8 шагов).
+        По умолчанию - значение переменной окружения PHOTO_EDITOR_HISTORY или compressed.
+    :type mode: str
+    :param kwargs: Параметры конструктора выбранного класса.
+    :return: Объект истории.
+    :rtype: History
+    :raises ValueError: Если режим или параметр некорректны.
+    """
+    mode = mode or os.environ.get('PHOTO_EDITOR_HISTORY', 'compressed')
+    name, _, value = mode.partition(':')
+    if name not in HISTORY_MODES:
+        raise ValueError("Неизвестный режим истории: {}".format(name))
+    cls, parameter, scale = HISTORY_MODES[name]
+    if value:
+        try:
+            kwargs.setdefault(parameter, int(value) * scale)
+        except ValueError:
+            raise ValueError("Параметр режима истории должен быть целым числом: {}".format(value))
+    return cls(**kwargs)
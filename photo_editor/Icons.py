@@ -0,0 +1,59 @@
+"""
+Модуль общего реестра иконок интерфейса.
+
+Каждый файл иконки декодируется один раз, после чего кнопки получают готовый QIcon из реестра:
+смена иконки при наведении курсора или изменении истории не читает файл с диска заново.
+Иконки, которые еще не показывались, декодируются функцией preload, когда окно уже
+отображено и цикл событий свободен.
+
+Исходные иконки в каталоге icons хранятся в размере, близком к отображаемому (с запасом
+для экранов высокой плотности): декодирование многомегапиксельного PNG занимало больше
+100 мс на иконку.
+"""
+import os
+
+from PyQt5.QtGui import QIcon, QPixmap
+
+# Каталог иконок относительно рабочего каталога приложения
+ICONS_DIRECTORY = 'icons'
+# Задержка предзагрузки после создания окна, мс: первая отрисовка окна не ждет декодирования
+PRELOAD_DELAY = 250
+
+_icons = {}
+
+
+def icon(path):
+    """
+    :param path: Путь к файлу иконки или None.
+    :type path: str
+    :return: Иконка из реестра; файл декодируется при первом обращении. Для None - пустая иконка.
+    :rtype: QIcon
+    """
+    if path is None:
+        return QIcon()
+    cached = _icons.get(path)
+    if cached is None:
+        cached = _icons[path] = QIcon(QPixmap(path))
+    return cached
+
+
+def preload(directory=ICONS_DIRECTORY):
+    """
+    Декодирует в реестр все иконки каталога, которые еще не декодированы.
+
+    :param directory: Каталог иконок.
+    :type directory: str
+    :return: Количество декодированных иконок.
+    :rtype: int
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return 0
+    loaded = 0
+    for name in names:
+        path = directory + '/' + name
+        if name.lower().endswith('.png') and path not in _icons:
+            icon(path)
+            loaded += 1
+    return loaded
@@ -0,0 +1,231 @@
+"""
+Модуль быстрой загрузки изображений.
+
+Файл не читается в память, а отображается (np.memmap) и декодируется один раз.
+Для больших JPEG сначала декодируется уменьшенная копия (IMREAD_REDUCED_COLOR_2/4/8:
+libjpeg масштабирует изображение при декодировании, это в разы быстрее полного декодирования),
+которая сразу показывается и редактируется как рабочая копия, а полное изображение
+декодируется в фоновом потоке. До его готовности исходное изображение представлено
+объектом PendingImage - одним из видов отложенных изображений (DeferredImage), которые
+получают пиксели по требованию функцией resolve. Модуль не зависит от PyQt5.
+"""
+import abc
+import threading
+
+import cv2
+import numpy as np
+
+# Коэффициент уменьшения -> флаг cv2.imdecode
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Маркеры JPEG SOF (начало кадра) с размером изображения; C4, C8 и CC - другие маркеры
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def map_file(path):
+    """
+    Отображает файл в память без чтения и копирования.
+
+    :param path: Путь к файлу.
+    :type path: str
+    :return: Байты файла (только для чтения).
+    :rtype: numpy.ndarray
+    """
+    try:
+        return np.memmap(path, dtype=np.uint8, mode='r')
+    except ValueError:  # пустой файл нельзя отобразить в память
+        return np.empty(0, dtype=np.uint8)
+
+
+def is_jpeg(data):
+    """
+    :param data: Байты файла.
+    :rtype: bool
+    """
+    return len(data) > 3 and bytes(data[:3]) == b'\xff\xd8\xff'
+
+
+def image_size(data):
+    """
+    Читает размер изображения из заголовка JPEG или PNG без декодирования.
+
+    :param data: Байты файла.
+    :type data: numpy.ndarray
+    :return: (ширина, высота) или None, если формат не распознан. Поворот по EXIF не учитывается.
+    :rtype: tuple
+    """
+    if len(data) >= 24 and bytes(data[:8]) == _PNG_SIGNATURE:
+        header = bytes(data[16:24])
+        return int.from_bytes(header[:4], 'big'), int.from_bytes(header[4:], 'big')
+    if not is_jpeg(data):
+        return None
+    position = 2
+    while position + 9 < len(data):
+        header = bytes(data[position:position + 9])
+        if header[0] != 0xFF:
+            return None
+        marker = header[1]
+        if marker == 0xFF:
+            position += 1
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+        elif marker in _JPEG_SOF:
+            return int.from_bytes(header[7:9], 'big'), int.from_bytes(header[5:7], 'big')
+        else:
+            position += 2 + int.from_bytes(header[2:4], 'big')
+    return None
+
+
+def choose_reduction(size, target):
+    """
+    Выбирает наибольший коэффициент уменьшения, при котором уменьшенная копия
+    не меньше рабочей копии заданного размера.
+
+    :param size: Размер изображения (ширина, высота).
+    :type size: tuple
+    :param target: Размер рабочей копии (ширина, высота).
+    :type target: tuple
+    :return: 1, 2, 4 или 8.
+    :rtype: int
+    """
+    width, height = size
+    scale = min(1.0, target[0] / width, target[1] / height)
+    for reduction in (8, 4, 2):
+        if reduction * scale <= 1.0:
+            return reduction
+    return 1
+
+
+def decode_image(data, reduction=1):
+    """
+    Декодирует изображение.
+
+    :param data: Байты файла.
+    :type data: numpy.ndarray
+    :param reduction: Коэффициент уменьшения при декодировании: 1, 2, 4 или 8.
+    :type reduction: int
+    :return: Изображение OpenCV или None, если декодировать не удалось.
+    :rtype: numpy.ndarray
+    """
+    if reduction not in REDUCED_FLAGS:
+        raise ValueError("Коэффициент уменьшения должен быть 1, 2, 4 или 8: {}".format(reduction))
+    if len(data) == 0:
+        return None
+    return cv2.imdecode(data, REDUCED_FLAGS[reduction])
+
+
+class DeferredImage(abc.ABC):
+    """
+    Изображение, пиксели которого получаются по требованию (например, при сохранении),
+    а в памяти хранится только форма.
+
+    Атрибуты:
+        shape (tuple): Форма изображения (высота, ширина, каналы).
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+
+    @abc.abstractmethod
+    def wait(self, timeout=None):
+        """
+        :param timeout: Время ожидания в секундах, None - без ограничения.
+        :type timeout: float
+        :return: Изображение.
+        :rtype: numpy.ndarray
+        :raises ValueError: Если изображение недоступно.
+        """
+
+
+class PendingImage(DeferredImage):
+    """
+    Исходное изображение, которое еще декодируется в фоновом потоке.
+
+    Атрибуты:
+        shape (tuple): Ожидаемая форма изображения (высота, ширина, каналы).
+        image (numpy.ndarray): Изображение, None до завершения декодирования.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: Ожидаемая форма изображения.
+        :type shape: tuple
+        """
+        super().__init__(shape)
+        self.image = None
+        self._error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        """
+        Завершено ли декодирование (успешно или с ошибкой).
+
+        :rtype: bool
+        """
+        return self._done.is_set()
+
+    def set(self, image):
+        self.image = image
+        self._done.set()
+
+    def fail(self, message):
+        self._error = message
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Ожидает завершения декодирования.
+
+        :param timeout: Время ожидания в секундах, None - без ограничения.
+        :type timeout: float
+        :return: Изображение.
+        :rtype: numpy.ndarray
+        :raises ValueError: Если декодировать не удалось или время ожидания истекло.
+        """
+        if not self._done.wait(timeout):
+            raise ValueError("Изображение еще загружается")
+        if self._error is not None:
+            raise ValueError(self._error)
+        return self.image
+
+
+def resolve(source):
+    """
+    :param source: Изображение OpenCV или DeferredImage.
+    :return: Изображение OpenCV; для DeferredImage пиксели получаются по требованию
+        (для PendingImage ожидается завершение декодирования).
+    :rtype: numpy.ndarray
+    """
+    if isinstance(source, DeferredImage):
+        return source.wait()
+    return source
+
+
+def load_full(data, pending):
+    """
+    Декодирует полное изображение и передает его ожидающим. Выполняется в фоновом потоке.
+
+    :param data: Байты файла.
+    :type data: numpy.ndarray
+    :param pending: Ожидаемое изображение.
+    :type pending: PendingImage
+    :return: pending.
+    :rtype: PendingImage
+    :raises ValueError: Если декодировать не удалось.
+    """
+    try:
+        image = decode_image(data)
+        if image is None:
+            raise ValueError("Не удалось декодировать изображение")
+    except Exception as error:  # ожидающие (сохранение) должны узнать об ошибке
+        pending.fail(str(error))
+        raise
+    pending.set(image)
+    return pending
@@ -0,0 +1,177 @@
+"""
+Модуль макросов: запись последовательности правок и ее повтор на других изображениях.
+
+Макрос - цепочка операций с аргументами в координатах исходного изображения (как в
+Picture.operations), сохраненная в переносимый файл JSON::
+
+    {"format": "photo_editor.macro", "version": 1,
+     "operations": [{"op": "negative", "args": []}, {"op": "brighten", "args": [40]}]}
+
+Запись (Recorder) сравнивает цепочку операций документа в начале и в конце записи, поэтому
+отмененные во время записи действия в макрос не попадают. Повтор на каталоге изображений
+выполняет пакетная обработка (``python -m photo_editor batch <каталог> --macro <файл>``):
+пул процессов записывает результаты на диск по мере готовности и сообщает скорость
+в изображениях в секунду. Модуль не зависит от PyQt5.
+"""
+import json
+
+from photo_editor import Encoder, Operations
+
+FORMAT = 'photo_editor.macro'
+VERSION = 1
+EXTENSION = '.json'
+
+# Длина кортежа круга в операции circles (см. модуль Annotations)
+_CIRCLE_FIELDS = 7
+
+
+def check_operation(name, args):
+    """
+    Проверяет операцию макроса.
+
+    :param name: Имя операции.
+    :type name: str
+    :param args: Аргументы операции (списки из JSON допускаются).
+    :return: Кортеж (имя операции, кортеж аргументов).
+    :rtype: tuple
+    :raises ValueError: Если операция неизвестна или аргументы некорректны.
+    """
+    if name not in Operations.OPERATIONS:
+        raise ValueError("Неизвестная операция: {}".format(name))
+    arity = Operations.OPERATIONS[name][1]
+    try:
+        if arity is None:
+            args = tuple(tuple(int(value) for value in item) for item in args)
+            if any(len(item) != _CIRCLE_FIELDS for item in args):
+                raise ValueError
+        else:
+            args = tuple(int(value) for value in args)
+            if len(args) != arity:
+                raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("Некорректные аргументы операции {}: {}".format(name, args))
+    return name, args
+
+
+class Macro:
+    """
+    Записанная последовательность операций.
+
+    Атрибуты:
+        operations (list): Операции - кортежи (имя операции, кортеж аргументов).
+    """
+
+    def __init__(self, operations=()):
+        """
+        :param operations: Операции - пары (имя операции, аргументы).
+        :raises ValueError: Если операция некорректна.
+        """
+        self.operations = [check_operation(name, args) for name, args in operations]
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __eq__(self, other):
+        return isinstance(other, Macro) and self.operations == other.operations
+
+    def __repr__(self):
+        return 'Macro({})'.format(Operations.format_chain(
+            [(name, args) for name, args in self.operations if name != 'circles']))
+
+    def to_dict(self):
+        """
+        :return: Словарь для сохранения в JSON.
+        :rtype: dict
+        """
+        return {
+            'format': FORMAT,
+            'version': VERSION,
+            'operations': [{'op': name, 'args': [list(item) if isinstance(item, tuple) else item for item in args]}
+                           for name, args in self.operations],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: Словарь из to_dict.
+        :type data: dict
+        :rtype: Macro
+        :raises ValueError: Если формат или версия не поддерживаются.
+        """
+        if not isinstance(data, dict) or data.get('format') != FORMAT:
+            raise ValueError("Файл не является макросом photo_editor")
+        if data.get('version') != VERSION:
+            raise ValueError("Неподдерживаемая версия макроса: {}".format(data.get('version')))
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not all(isinstance(item, dict) for item in operations):
+            raise ValueError("Макрос должен содержать список операций")
+        return cls((item.get('op'), item.get('args', ())) for item in operations)
+
+    def save(self, path):
+        """
+        Атомарно записывает макрос в файл JSON.
+
+        :param path: Путь к файлу.
+        :type path: str
+        """
+        Encoder.write_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=1).encode('utf-8'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: Путь к файлу макроса.
+        :type path: str
+        :rtype: Macro
+        :raises ValueError: Если файл не является корректным макросом.
+        """
+        with open(path, encoding='utf-8') as file:
+            try:
+                data = json.load(file)
+            except ValueError as error:
+                raise ValueError("Некорректный JSON макроса: {}".format(error))
+        return cls.from_dict(data)
+
+
+class Recorder:
+    """
+    Запись макроса по цепочке операций документа.
+
+    Атрибуты:
+        recording (bool): Идет ли запись.
+    """
+
+    def __init__(self):
+        self._start = None
+
+    @property
+    def recording(self):
+        return self._start is not None
+
+    def start(self, operations):
+        """
+        Начинает запись.
+
+        :param operations: Цепочка операций документа в начале записи (Picture.operations).
+        :type operations: list
+        """
+        self._start = tuple(operations)
+
+    def stop(self, operations):
+        """
+        Завершает запись.
+
+        :param operations: Цепочка операций документа в конце записи.
+        :type operations: list
+        :return: Операции, выполненные во время записи и не отмененные: все операции после
+            общего начала цепочек в начале и в конце записи.
+        :rtype: Macro
+        :raises ValueError: Если запись не начата.
+        """
+        if self._start is None:
+            raise ValueError("Запись макроса не начата")
+        start, self._start = self._start, None
+        operations = list(operations)
+        common = 0
+        while common < min(len(start), len(operations)) and start[common] == operations[common]:
+            common += 1
+        return Macro(operations[common:])
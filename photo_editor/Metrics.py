@@ -0,0 +1,312 @@
+"""
+Модуль замера времени действий пользователя по этапам.
+
+Действие (например, загрузка фото или отмена) состоит из этапов: чтение файла, декодирование,
+операция, преобразование для Qt, отрисовка, запись в историю. Время этапов замеряется
+монотонными часами (time.perf_counter) и накапливается в скользящих гистограммах;
+разбивка последнего действия передается подписчикам (строка состояния окна), а по
+завершении сессии метрики записываются в JSON.
+
+Замер включается переменной окружения PHOTO_EDITOR_METRICS - путь к JSON-файлу сессии
+или ``1`` для файла ``photo_editor_metrics_<дата>_<время>.json`` в текущем каталоге.
+Когда замер выключен, action() возвращает общий пустой объект, и накладные расходы
+сводятся к вызову пустых методов.
+"""
+from collections import deque
+import bisect
+import json
+import os
+import threading
+import time
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_METRICS'
+
+# Верхние границы корзин гистограмм, в миллисекундах (последняя корзина - все, что больше)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+DEFAULT_WINDOW = 1024
+
+
+class RollingHistogram:
+    """
+    Гистограмма длительностей: счетчики по корзинам за всю сессию и последние window
+    значений для процентилей.
+
+    Атрибуты:
+        count (int): Количество значений за сессию.
+        total (float): Сумма значений за сессию, в секундах.
+        maximum (float): Наибольшее значение, в секундах.
+        buckets (list): Счетчики по корзинам BUCKETS_MS.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        """
+        :param window: Количество последних значений для процентилей.
+        :type window: int
+        """
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self._recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        """
+        :param seconds: Длительность в секундах.
+        :type seconds: float
+        """
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, 1000 * seconds)] += 1
+        self._recent.append(seconds)
+
+    def percentile(self, fraction):
+        """
+        :param fraction: Доля от 0 до 1.
+        :type fraction: float
+        :return: Процентиль последних значений в секундах, 0 при отсутствии значений.
+        :rtype: float
+        """
+        if not self._recent:
+            return 0.0
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    def summary(self):
+        """
+        :return: Словарь: count, mean_ms, p50_ms, p95_ms, max_ms, buckets (граница в мс -> количество).
+        :rtype: dict
+        """
+        labels = ['<={:g}'.format(bound) for bound in BUCKETS_MS] + ['>{:g}'.format(BUCKETS_MS[-1])]
+        return {
+            'count': self.count,
+            'mean_ms': 1000 * self.total / self.count if self.count else 0.0,
+            'p50_ms': 1000 * self.percentile(0.5),
+            'p95_ms': 1000 * self.percentile(0.95),
+            'max_ms': 1000 * self.maximum,
+            'buckets': {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+class _Stage:
+    __slots__ = ('_action', '_name', '_started')
+
+    def __init__(self, action, name):
+        self._action = action
+        self._name = name
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._action.add(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class ActionTimer:
+    """
+    Замер одного действия. Создается методом Metrics.action и используется как менеджер контекста.
+
+    Атрибуты:
+        name (str): Имя действия.
+        stages (list): Этапы в порядке выполнения, кортежи (имя, секунды).
+    """
+
+    def __init__(self, metrics, name, started=None):
+        self.name = name
+        self.stages = []
+        self._metrics = metrics
+        self._started = started
+
+    def __enter__(self):
+        if self._started is None:
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics._finish(self, time.perf_counter() - self._started)
+        return False
+
+    def stage(self, name):
+        """
+        Замеряет этап действия.
+
+        :param name: Имя этапа.
+        :type name: str
+        :return: Менеджер контекста.
+        """
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        """
+        Добавляет этап, время которого замерено отдельно (например, в фоновом потоке).
+
+        :param name: Имя этапа.
+        :type name: str
+        :param seconds: Длительность в секундах.
+        :type seconds: float
+        """
+        self.stages.append((name, seconds))
+
+
+class _NullAction:
+    """
+    Пустой замер, когда метрики выключены: все методы ничего не делают.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def stage(self, name):
+        return self
+
+    def add(self, name, seconds):
+        pass
+
+
+_NULL_ACTION = _NullAction()
+
+
+class Metrics:
+    """
+    Метрики сессии: гистограммы времени действий и их этапов.
+
+    Атрибуты:
+        enabled (bool): Включен ли замер.
+        path (str): Путь к JSON-файлу сессии, None - не записывать.
+        last (dict): Разбивка последнего действия: action (имя), total_ms и stages (список
+            кортежей (этап, мс)). None до первого действия.
+    """
+
+    def __init__(self, enabled=False, path=None, window=DEFAULT_WINDOW):
+        """
+        :param enabled: Включить замер.
+        :type enabled: bool
+        :param path: Путь к JSON-файлу сессии для dump().
+        :type path: str
+        :param window: Количество последних значений гистограмм для процентилей.
+        :type window: int
+        """
+        self.enabled = enabled
+        self.path = path
+        self.last = None
+        self.started = time.time()
+        self._window = window
+        self._histograms = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def action(self, name, started=None):
+        """
+        Начинает замер действия.
+
+        :param name: Имя действия.
+        :type name: str
+        :param started: Время начала действия по time.perf_counter(), если оно началось раньше
+            (например, операция была поставлена в очередь фонового потока). По умолчанию -
+            момент входа в менеджер контекста.
+        :type started: float
+        :return: ActionTimer или пустой замер, если метрики выключены.
+        """
+        if not self.enabled:
+            return _NULL_ACTION
+        return ActionTimer(self, name, started)
+
+    def subscribe(self, listener):
+        """
+        Подписывает функцию на завершение действий: она вызывается с разбивкой действия
+        (в формате Metrics.last) в потоке, завершившем действие.
+
+        :param listener: Функция с одним аргументом.
+        :type listener: callable
+        """
+        self._listeners.append(listener)
+
+    def _finish(self, action, total):
+        with self._lock:
+            for stage, seconds in action.stages:
+                self._histogram(action.name, stage).add(seconds)
+            self._histogram(action.name, 'total').add(total)
+            self.last = breakdown = {
+                'action': action.name,
+                'total_ms': 1000 * total,
+                'stages': [(stage, 1000 * seconds) for stage, seconds in action.stages],
+            }
+        for listener in self._listeners:
+            listener(breakdown)
+
+    def _histogram(self, action, stage):
+        key = (action, stage)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = RollingHistogram(self._window)
+        return histogram
+
+    def to_dict(self):
+        """
+        :return: Метрики сессии: started, finished, actions (действие -> этап -> сводка гистограммы).
+        :rtype: dict
+        """
+        with self._lock:
+            actions = {}
+            for (action, stage), histogram in sorted(self._histograms.items()):
+                actions.setdefault(action, {})[stage] = histogram.summary()
+        return {'started': self.started, 'finished': time.time(), 'actions': actions}
+
+    def dump(self, path=None):
+        """
+        Записывает метрики сессии в JSON.
+
+        :param path: Путь к файлу, по умолчанию - self.path.
+        :type path: str
+        :return: Путь к записанному файлу или None, если путь не задан или метрики выключены.
+        :rtype: str
+        """
+        path = path or self.path
+        if not self.enabled or not path:
+            return None
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2, ensure_ascii=False)
+        return path
+
+
+def format_breakdown(breakdown, names=None):
+    """
+    Формирует строку с разбивкой действия, например ``undo 12.3 мс: history 5.1, convert 3.2``.
+
+    :param breakdown: Разбивка из Metrics.last.
+    :type breakdown: dict
+    :param names: Отображаемые имена действий и этапов.
+    :type names: dict
+    :rtype: str
+    """
+    names = names or {}
+    stages = ', '.join('{} {:.1f}'.format(names.get(stage, stage), ms) for stage, ms in breakdown['stages'])
+    return '{} {:.1f} мс: {}'.format(names.get(breakdown['action'], breakdown['action']), breakdown['total_ms'],
+                                      stages)
+
+
+def create_metrics(value=None):
+    """
+    Создает метрики сессии по значению переменной окружения PHOTO_EDITOR_METRICS.
+
+    :param value: Значение переменной, по умолчанию читается из окружения. Пусто или ``0`` -
+        замер выключен, ``1`` - файл с датой и временем в текущем каталоге, иначе путь к файлу.
+    :type value: str
+    :rtype: Metrics
+    """
+    if value is None:
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    value = value.strip()
+    if value.lower() in ('', '0', 'false', 'no'):
+        return Metrics(enabled=False)
+    if value.lower() in ('1', 'true', 'yes'):
+        value = time.strftime('photo_editor_metrics_%Y%m%d_%H%M%S.json')
+    return Metrics(enabled=True, path=value)
@@ -0,0 +1,287 @@
+"""
+Модуль с операциями обработки изображений без зависимости от PyQt5.
+
+Функции модуля принимают изображение OpenCV (numpy.ndarray в формате BGR) и возвращают
+новое изображение, не изменяя исходное. Они используются классом Picture в графическом
+интерфейсе и пакетной обработкой из командной строки, где PyQt5 не загружается.
+
+Цепочка операций записывается строкой вида ``negative,brighten:40,circle:100:100:50:3``:
+операции разделяются запятыми, аргументы операции - двоеточиями.
+
+Функция modified_rect сообщает, какую область изображения изменяет операция: круги меняют
+только пиксели в своих границах, поэтому отображение обновляет только эту область.
+"""
+import cv2
+
+from photo_editor import Lut
+
+
+def red(image):
+    """
+    Оставляет на изображении только красный канал.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    red_picture = image.copy()
+    red_picture[:, :, 0] = 0
+    red_picture[:, :, 1] = 0
+    return red_picture
+
+
+def green(image):
+    """
+    Оставляет на изображении только зеленый канал.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    green_picture = image.copy()
+    green_picture[:, :, 0] = 0
+    green_picture[:, :, 2] = 0
+    return green_picture
+
+
+def blue(image):
+    """
+    Оставляет на изображении только синий канал.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    blue_picture = image.copy()
+    blue_picture[:, :, 1] = 0
+    blue_picture[:, :, 2] = 0
+    return blue_picture
+
+
+def negative(image):
+    """
+    Возвращает негативное изображение.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    return Lut.apply(image, Lut.table('negative'))
+
+
+def brighten(image, amount):
+    """
+    Увеличивает яркость изображения.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param amount: Величина увеличения яркости.
+    :type amount: int
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    return Lut.apply(image, Lut.table('brighten', (amount,)))
+
+
+def circle(image, x, y, radius, line_size):
+    """
+    Рисует красный круг на копии изображения.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param x: Координата x центра круга.
+    :type x: int
+    :param y: Координата y центра круга.
+    :type y: int
+    :param radius: Радиус круга.
+    :type radius: int
+    :param line_size: Толщина линии круга.
+    :type line_size: int
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    circle_picture = image.copy()
+    cv2.circle(circle_picture, (x, y), radius, (0, 0, 255), line_size)
+    return circle_picture
+
+
+def circles(image, *items):
+    """
+    Рисует круги на одной копии изображения: изображение копируется один раз,
+    все круги растеризуются в эту копию.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param items: Круги - кортежи (x, y, радиус, толщина, b, g, r), см. модуль Annotations.
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    circles_picture = image.copy()
+    for x, y, radius, line_size, blue, green, red in items:
+        cv2.circle(circles_picture, (x, y), radius, (blue, green, red), line_size)
+    return circles_picture
+
+
+# Имя операции -> (функция, количество целочисленных аргументов); None - операция задается
+# не строкой цепочки, а файлом (список кругов circles)
+OPERATIONS = {
+    'red': (red, 0),
+    'green': (green, 0),
+    'blue': (blue, 0),
+    'negative': (negative, 0),
+    'brighten': (brighten, 1),
+    'circle': (circle, 4),
+    'circles': (circles, None),
+}
+
+
+def _circle_bounds(x, y, radius, line_size):
+    # Половина толщины линии выходит за радиус; запас в пиксель - на округление растеризации
+    reach = radius + (line_size + 1) // 2 + 1 if line_size > 0 else radius + 1
+    return x - reach, y - reach, x + reach + 1, y + reach + 1
+
+
+# Имя операции -> функция (аргументы) -> границы (x0, y0, x1, y1) изменяемой области;
+# остальные операции изменяют все изображение
+BOUNDS = {
+    'circle': _circle_bounds,
+    'circles': lambda *items: _union([_circle_bounds(*item[:4]) for item in items]),
+}
+
+
+def _union(bounds):
+    if not bounds:
+        return 0, 0, 0, 0
+    return (min(item[0] for item in bounds), min(item[1] for item in bounds),
+            max(item[2] for item in bounds), max(item[3] for item in bounds))
+
+
+def modified_rect(name, args, shape):
+    """
+    Возвращает область изображения, которую изменяет операция.
+
+    :param name: Имя операции из OPERATIONS.
+    :type name: str
+    :param args: Аргументы операции.
+    :type args: tuple
+    :param shape: Форма изображения (высота, ширина, ...).
+    :type shape: tuple
+    :return: Прямоугольник (x, y, ширина, высота) внутри изображения (пустой, если операция
+        ничего не меняет) или None, если операция изменяет все изображение.
+    :rtype: tuple
+    """
+    if name not in BOUNDS:
+        return None
+    return _clip(BOUNDS[name](*args), shape)
+
+
+def _clip(bounds, shape):
+    height, width = shape[:2]
+    x0, y0 = max(0, bounds[0]), max(0, bounds[1])
+    x1, y1 = min(width, bounds[2]), min(height, bounds[3])
+    if x1 <= x0 or y1 <= y0:
+        return 0, 0, 0, 0
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def chain_rect(chain, shape):
+    """
+    Возвращает область изображения, которую изменяет цепочка операций.
+
+    :param chain: Список кортежей (имя операции, кортеж аргументов).
+    :type chain: list
+    :param shape: Форма изображения (высота, ширина, ...).
+    :type shape: tuple
+    :return: Объединение областей операций (x, y, ширина, высота) или None, если цепочка
+        изменяет все изображение.
+    :rtype: tuple
+    """
+    bounds = []
+    for name, args in chain:
+        rect = modified_rect(name, args, shape)
+        if rect is None:
+            return None
+        if rect[2] and rect[3]:
+            bounds.append((rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3]))
+    return _clip(_union(bounds), shape)
+
+
+def parse_chain(spec):
+    """
+    Разбирает строковое описание цепочки операций.
+
+    :param spec: Строка вида ``negative,brighten:40``.
+    :type spec: str
+    :return: Список кортежей (имя операции, кортеж аргументов).
+    :rtype: list
+    :raises ValueError: Если операция неизвестна или аргументы некорректны.
+    """
+    chain = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, *raw_args = item.split(':')
+        name = name.strip().lower()
+        if name not in OPERATIONS:
+            raise ValueError("Неизвестная операция: {}".format(name))
+        arity = OPERATIONS[name][1]
+        if arity is None:
+            raise ValueError("Операция {} задается файлом, а не строкой цепочки".format(name))
+        if len(raw_args) != arity:
+            raise ValueError("Операция {} ожидает аргументов: {}, получено: {}".format(name, arity, len(raw_args)))
+        try:
+            args = tuple(int(arg) for arg in raw_args)
+        except ValueError:
+            raise ValueError("Аргументы операции {} должны быть целыми числами".format(name))
+        chain.append((name, args))
+    return chain
+
+
+def format_chain(chain):
+    """
+    Формирует строковое описание цепочки операций, обратное parse_chain.
+
+    :param chain: Список кортежей (имя операции, кортеж аргументов).
+    :type chain: list
+    :return: Строка вида ``negative,brighten:40``.
+    :rtype: str
+    """
+    return ','.join(':'.join([name] + [str(arg) for arg in args]) for name, args in chain)
+
+
+def apply_operation(image, name, args=()):
+    """
+    Применяет к изображению одну операцию по ее имени.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param name: Имя операции из OPERATIONS.
+    :type name: str
+    :param args: Аргументы операции.
+    :type args: tuple
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    function, _ = OPERATIONS[name]
+    return function(image, *args)
+
+
+def apply_chain(image, chain):
+    """
+    Последовательно применяет к изображению цепочку операций.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param chain: Список кортежей (имя операции, кортеж аргументов).
+    :type chain: list
+    :return: Новое изображение.
+    :rtype: numpy.ndarray
+    """
+    for name, args in chain:
+        image = apply_operation(image, name, args)
+    return image
@@ -4,14 +4,24 @@
 Этот модуль предоставляет класс Picture, который позволяет загружать,
 сохранять и обрабатывать изображения, а также отображать их с использованием PyQt5.
 """
-import os
-import shutil
-import tempfile
+import sys
 
 import cv2
+import numpy as np
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import QApplication, QFileDialog
-import numpy as np
+
+from photo_editor import Chain, Encoder, Loader, Proxy
+from photo_editor.Chain import OpChain
+
+# Формат QImage для отображения, который в памяти совпадает с BGRA (RGB32 на little-endian):
+# это собственный формат QPixmap, поэтому QPixmap.fromImage не преобразует и не копирует пиксели
+if sys.byteorder == 'little':
+    _DISPLAY_FORMAT = QImage.Format_RGB32
+    _DISPLAY_CODES = {1: cv2.COLOR_GRAY2BGRA, 3: cv2.COLOR_BGR2BGRA, 4: None}
+else:
+    _DISPLAY_FORMAT = QImage.Format_RGBX8888
+    _DISPLAY_CODES = {1: cv2.COLOR_GRAY2RGBA, 3: cv2.COLOR_BGR2RGBA, 4: cv2.COLOR_BGRA2RGBA}
 
 
 class Picture:
@@ -20,18 +30,216 @@ class Picture:
 
     Этот класс предоставляет методы для загрузки, сохранения и обработки изображений,
     а также для отображения изображений с использованием PyQt5.
+
+    Операции обработки не выполняются сразу, а накапливаются в ленивой цепочке (Chain.OpChain)
+    и вычисляются при первом обращении к picture или qt_picture.
+
+    Если задан proxy_size, изображение больше этого размера редактируется в режиме прокси:
+    picture - уменьшенная рабочая копия, операции записываются в координатах исходного
+    изображения (operations), а полноразмерный результат вычисляет render_full.
+
+    Большой JPEG можно показать и редактировать до окончания его декодирования (set_preview):
+    рабочая копия строится по уменьшенной при декодировании копии, а source до окончания
+    фонового декодирования - Loader.PendingImage.
+
+    Атрибуты:
+        source (numpy.ndarray): Исходное изображение (загруженное или снятое) или Loader.PendingImage.
+        scale (float): Масштаб рабочей копии относительно source, 1.0 без прокси.
+        operations (list): Операции, примененные к source, в координатах source.
     """
 
-    def __init__(self):
+    def __init__(self, proxy_size=None):
         """
         Инициализирует объект Picture с атрибутами по умолчанию.
+
+        :param proxy_size: Максимальный размер рабочей копии (ширина, высота), None - без прокси.
+        :type proxy_size: tuple
         """
-        self.qt_picture = None
+        self._chain = None
+        self._qt_picture = None
+        self.proxy_size = proxy_size
+        self.source = None
+        self.scale = 1.0
+        self.operations = []
         self.path = None
-        self.picture = None
         self.width = None
         self.height = None
 
+    @property
+    def picture(self):
+        """
+        Текущее изображение OpenCV. При обращении выполняются накопленные операции.
+
+        :rtype: numpy.ndarray
+        """
+        if self._chain is None:
+            return None
+        return self._chain.materialize()
+
+    @picture.setter
+    def picture(self, image):
+        self._chain = OpChain(image) if image is not None else None
+        self._qt_picture = None
+
+    @property
+    def qt_picture(self):
+        """
+        Текущее изображение для отображения в PyQt5, строится при первом обращении.
+
+        :rtype: QPixmap
+        """
+        if self._qt_picture is None and self._chain is not None:
+            self._qt_picture = Picture.convert_cv_qt(self.picture)
+        return self._qt_picture
+
+    @qt_picture.setter
+    def qt_picture(self, pixmap):
+        self._qt_picture = pixmap
+
+    @property
+    def proxied(self):
+        """
+        Редактируется ли уменьшенная рабочая копия.
+
+        :rtype: bool
+        """
+        return self.source is not None and self.scale < 1.0
+
+    def set_source(self, image):
+        """
+        Устанавливает новое исходное изображение (загруженное или снятое) и строит
+        рабочую копию, если изображение больше proxy_size.
+
+        :param image: Изображение OpenCV.
+        :type image: numpy.ndarray
+        """
+        self.source = image
+        self.operations = []
+        self.scale = 1.0
+        if image is not None and self.proxy_size is not None:
+            self.scale = Proxy.fit_scale(image.shape, self.proxy_size)
+        self.picture = Proxy.make_proxy(image, self.scale) if image is not None else None
+
+    def preview_reduction(self, file_bytes):
+        """
+        Выбирает коэффициент уменьшения при декодировании для быстрого показа: уменьшенная копия
+        должна быть не меньше рабочей копии. Применяется только к JPEG - другие форматы
+        OpenCV декодирует полностью и затем уменьшает, что не быстрее.
+
+        :param file_bytes: Байты файла.
+        :type file_bytes: numpy.ndarray
+        :return: 1 (декодировать полностью), 2, 4 или 8.
+        :rtype: int
+        """
+        if self.proxy_size is None or not Loader.is_jpeg(file_bytes):
+            return 1
+        size = Loader.image_size(file_bytes)
+        if size is None:
+            return 1
+        return Loader.choose_reduction(size, self.proxy_size)
+
+    def set_preview(self, preview, size):
+        """
+        Устанавливает исходное изображение, которое еще декодируется: рабочая копия строится
+        по его уменьшенной копии, а операции записываются в координатах полного изображения.
+
+        :param preview: Уменьшенная при декодировании копия (Loader.decode_image с reduction > 1).
+        :type preview: numpy.ndarray
+        :param size: Размер полного изображения из заголовка файла (ширина, высота).
+        :type size: tuple
+        :return: Ожидаемое исходное изображение, которое нужно заполнить (Loader.load_full).
+        :rtype: Loader.PendingImage
+        """
+        width, height = size
+        # Размер в заголовке не учитывает поворот по EXIF, а декодированная копия повернута
+        if (preview.shape[1] > preview.shape[0]) != (width > height):
+            width, height = height, width
+        pending = Loader.PendingImage((height, width) + preview.shape[2:])
+        self.source = pending
+        self.operations = []
+        self.scale = Proxy.fit_scale(pending.shape, self.proxy_size)
+        self.picture = Proxy.make_proxy(preview, self.scale, pending.shape)
+        return pending
+
+    def apply(self, name, *args):
+        """
+        Добавляет операцию в ленивую цепочку текущего изображения.
+
+        :param name: Имя операции из Operations.OPERATIONS.
+        :type name: str
+        :param args: Аргументы операции в координатах исходного изображения.
+        """
+        if self._chain is not None:
+            self._chain.append(*Proxy.scale_operation(name, args, self.scale))
+            self.operations.append((name, tuple(args)))
+            self._qt_picture = None
+
+    def proxy_operations(self, nodes):
+        """
+        Пересчитывает операции в координатах исходного изображения для рабочей копии.
+
+        :param nodes: Кортежи (имя операции, кортеж аргументов).
+        :type nodes: list
+        :rtype: list
+        """
+        return Proxy.scale_operations(nodes, self.scale)
+
+    def record(self, nodes):
+        """
+        Записывает операции, выполненные над рабочей копией вне объекта (в фоновом потоке).
+
+        :param nodes: Кортежи (имя операции, кортеж аргументов) в координатах исходного изображения.
+        :type nodes: list
+        """
+        self.operations.extend((name, tuple(args)) for name, args in nodes)
+
+    @property
+    def state(self):
+        """
+        Снимок состояния для полноразмерного вычисления: (source, scale, кортеж операций).
+        Не копирует изображения.
+
+        :rtype: tuple
+        """
+        return self.source, self.scale, tuple(self.operations)
+
+    def restore(self, image, state):
+        """
+        Восстанавливает состояние при отмене или повторе действия.
+
+        :param image: Рабочая копия из истории изменений.
+        :type image: numpy.ndarray
+        :param state: Снимок из свойства state.
+        :type state: tuple
+        """
+        self.source, self.scale, operations = state
+        self.operations = list(operations)
+        self.picture = image
+
+    def render_full(self):
+        """
+        Вычисляет текущее изображение в исходном разрешении. Без прокси возвращает picture.
+
+        :return: Полноразмерное изображение OpenCV или None.
+        :rtype: numpy.ndarray
+        """
+        if not self.proxied:
+            return self.picture
+        return Picture.render_state(self.state)
+
+    @staticmethod
+    def render_state(state):
+        """
+        Вычисляет полноразмерное изображение по снимку состояния. Может вызываться
+        не из главного потока.
+
+        :param state: Снимок из свойства state.
+        :type state: tuple
+        :rtype: numpy.ndarray
+        """
+        source, _, operations = state
+        return Chain.run(Loader.resolve(source), list(operations))
+
     def load_picture(self):
         """
         Открывает диалоговое окно для загрузки изображения из файловой системы.
@@ -39,6 +247,20 @@ class Picture:
         :return: Путь к файлу, если изображение выбрано, иначе None.
         :rtype: str
         """
+        file_name = Picture.ask_open_path()
+        if file_name:
+            self.load_file(file_name)
+            return file_name
+        return None
+
+    @staticmethod
+    def ask_open_path():
+        """
+        Открывает диалоговое окно выбора изображения.
+
+        :return: Путь к файлу или None, если выбор отменен.
+        :rtype: str
+        """
         options = QFileDialog.Options()
         options |= QFileDialog.ReadOnly
         file_name, _ = QFileDialog.getOpenFileName(
@@ -48,52 +270,108 @@ class Picture:
             "Images (*.png *.jpeg *.jpg);;All Files (*)",
             options=options
         )
-        if file_name:
-            with open(file_name, 'rb') as file:
-                file_bytes = np.asarray(bytearray(file.read()), dtype=np.uint8)
-                self.picture = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-                self.path = file_name
+        return file_name or None
 
-            return file_name
-        return None
+    def load_file(self, file_name):
+        """
+        Загружает изображение из файла без диалогового окна.
+
+        :param file_name: Путь к файлу.
+        :type file_name: str
+        """
+        self.set_source(Picture.decode_image(Picture.read_file(file_name)))
+        self.path = file_name
+
+    @staticmethod
+    def read_file(file_name):
+        """
+        Отображает файл изображения в память без чтения и копирования.
+
+        :param file_name: Путь к файлу.
+        :type file_name: str
+        :return: Байты файла.
+        :rtype: numpy.ndarray
+        """
+        return Loader.map_file(file_name)
+
+    @staticmethod
+    def decode_image(file_bytes, reduction=1):
+        """
+        Декодирует изображение из байтов файла.
+
+        :param file_bytes: Байты файла.
+        :type file_bytes: numpy.ndarray
+        :param reduction: Коэффициент уменьшения при декодировании: 1, 2, 4 или 8.
+        :type reduction: int
+        :return: Изображение OpenCV или None, если декодировать не удалось.
+        :rtype: numpy.ndarray
+        """
+        return Loader.decode_image(file_bytes, reduction)
 
     def save_picture_dialog(self):
         """
-        Открывает диалоговое окно для сохранения текущего изображения.
+        Открывает диалоговое окно для сохранения текущего изображения в исходном разрешении.
         """
-        if self.picture is not None:
-            options = QFileDialog.Options()
-            file_name, _ = QFileDialog.getSaveFileName(
-                None,
-                "Сохранить изображение",
-                "",
-                "PNG Files (*.png);;JPEG Files (*.jpeg);;JPG Files (*.jpg);;All Files (*)",
-                options=options
-            )
-            if file_name:
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                cv2.imwrite(temp_file.name, self.picture)
-                temp_file.close()
-
-                if file_name.lower().endswith(('.png', '.jpeg', '.jpg')):
-                    shutil.move(temp_file.name, file_name)
-                else:
-                    shutil.move(temp_file.name, file_name + '.png')
-
-                # Убедимся, что временный файл удален, если что-то пошло не так
-                if os.path.exists(temp_file.name):
-                    os.remove(temp_file.name)
+        file_name = self.ask_save_path()
+        if file_name:
+            Picture.write_picture(self.render_full(), file_name)
+
+    def ask_save_path(self):
+        """
+        Открывает диалоговое окно выбора файла для сохранения.
+
+        :return: Путь к файлу или None, если изображения нет или выбор отменен.
+        :rtype: str
+        """
+        if self._chain is None:
+            return None
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getSaveFileName(
+            None,
+            "Сохранить изображение",
+            "",
+            "PNG Files (*.png);;JPEG Files (*.jpeg);;JPG Files (*.jpg);;WebP Files (*.webp);;All Files (*)",
+            options=options
+        )
+        return file_name or None
+
+    @staticmethod
+    def write_state(state, file_name, settings=None):
+        """
+        Вычисляет полноразмерное изображение по снимку состояния и записывает его в файл.
+        Может вызываться не из главного потока.
+
+        :param state: Снимок из свойства state.
+        :type state: tuple
+        :param file_name: Путь к файлу.
+        :type file_name: str
+        :param settings: Параметры кодировщиков (Encoder.EncoderSettings).
+        :return: Статистика записи (Encoder.save_image).
+        :rtype: dict
+        """
+        return Picture.write_picture(Picture.render_state(state), file_name, settings)
+
+    @staticmethod
+    def write_picture(image, file_name, settings=None):
+        """
+        Кодирует изображение в памяти и атомарно записывает его в файл (модуль Encoder).
+        Может вызываться не из главного потока.
+
+        :param image: Изображение OpenCV.
+        :type image: numpy.ndarray
+        :param file_name: Путь к файлу; без расширения .png/.jpeg/.jpg/.webp добавляется .png.
+        :type file_name: str
+        :param settings: Параметры кодировщиков (Encoder.EncoderSettings), по умолчанию - значения OpenCV.
+        :return: Статистика записи (Encoder.save_image).
+        :rtype: dict
+        """
+        return Encoder.save_image(image, file_name, settings)
 
     def show_red(self):
         """
         Отображает изображение с выделенным красным цветом.
         """
-        if self.picture is not None:
-            red_picture = self.picture.copy()
-            red_picture[:, :, 0] = 0
-            red_picture[:, :, 1] = 0
-            self.qt_picture = Picture.convert_cv_qt(red_picture)
-            self.picture = red_picture
+        self.apply('red')
 
     @staticmethod
     def get_frame(cap):
@@ -134,8 +412,9 @@ class Picture:
         """
         qt_image, frame = Picture.capture_image(cap)
         if qt_image is not None and frame is not None:
-            self.qt_picture = qt_image
-            self.picture = frame
+            self.set_source(frame)
+            if not self.proxied:
+                self.qt_picture = qt_image
 
     def save_picture(self, path):
         """
@@ -145,54 +424,66 @@ class Picture:
         :type path: str
         """
         if self.picture is not None:
-            cv2.imwrite(path, cv2.cvtColor(self.picture, cv2.COLOR_RGB2BGR))
+            Encoder.save_image(cv2.cvtColor(self.render_full(), cv2.COLOR_RGB2BGR), path)
 
     @staticmethod
     def convert_cv_qt(cv_img):
         """
         Конвертирует изображение OpenCV в QPixmap для отображения в PyQt5.
+        QPixmap использует пиксели изображения convert_cv_qimage без копирования.
 
         :param cv_img: Изображение OpenCV.
         :type cv_img: numpy.ndarray
         :return: Изображение для отображения в PyQt5.
         :rtype: QPixmap
         """
-        rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        convert_to_Qt_format = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        return QPixmap.fromImage(convert_to_Qt_format)
+        return QPixmap.fromImage(Picture.convert_cv_qimage(cv_img))
+
+    @staticmethod
+    def convert_cv_qimage(cv_img):
+        """
+        Конвертирует изображение OpenCV в QImage. В отличие от convert_cv_qt,
+        может вызываться не из главного потока (QPixmap создается только в главном потоке).
+
+        Пиксели за один проход записываются прямо в буфер QImage в формате RGB32, поэтому
+        буфер принадлежит QImage и живет столько же, сколько изображение и созданные из него QPixmap.
+
+        :param cv_img: Изображение OpenCV (BGR, BGRA или оттенки серого).
+        :type cv_img: numpy.ndarray
+        :return: Изображение, владеющее собственными данными.
+        :rtype: QImage
+        """
+        h, w = cv_img.shape[:2]
+        channels = cv_img.shape[2] if cv_img.ndim == 3 else 1
+        image = QImage(w, h, _DISPLAY_FORMAT)
+        bits = image.bits()
+        bits.setsize(image.sizeInBytes())
+        # Строка RGB32 занимает ровно 4 * w байт, выравнивание не требуется
+        buffer = np.frombuffer(bits, dtype=np.uint8).reshape(h, w, 4)
+        code = _DISPLAY_CODES[channels]
+        if code is None:
+            np.copyto(buffer, cv_img)
+        else:
+            cv2.cvtColor(cv_img, code, dst=buffer)
+        return image
 
     def show_green(self):
         """
         Отображает изображение с выделенным зеленым цветом.
         """
-        if self.picture is not None:
-            green_picture = self.picture.copy()
-            green_picture[:, :, 0] = 0
-            green_picture[:, :, 2] = 0
-            self.qt_picture = Picture.convert_cv_qt(green_picture)
-            self.picture = green_picture
+        self.apply('green')
 
     def show_blue(self):
         """
         Отображает изображение с выделенным синим цветом.
         """
-        if self.picture is not None:
-            blue_picture = self.picture.copy()
-            blue_picture[:, :, 1] = 0
-            blue_picture[:, :, 2] = 0
-            self.qt_picture = Picture.convert_cv_qt(blue_picture)
-            self.picture = blue_picture
+        self.apply('blue')
 
     def show_negative(self):
         """
         Отображает негативное изображение.
         """
-        if self.picture is not None:
-            negative_picture = cv2.bitwise_not(self.picture)
-            self.qt_picture = Picture.convert_cv_qt(negative_picture)
-            self.picture = negative_picture
+        self.apply('negative')
 
     def brighten(self, amount):
         """
@@ -201,11 +492,7 @@ class Picture:
         :param amount: Величина увеличения яркости.
         :type amount: int
         """
-        if self.picture is not None:
-            contrast = 1.0
-            bright_picture = cv2.convertScaleAbs(self.picture, alpha=contrast, beta=amount)
-            self.qt_picture = Picture.convert_cv_qt(bright_picture)
-            self.picture = bright_picture
+        self.apply('brighten', amount)
 
     def draw_circle(self, x, y, radius, line_size):
         """
@@ -220,9 +507,13 @@ class Picture:
         :param line_size: Толщина линии круга.
         :type line_size: int
         """
-        if self.picture is not None:
-            coord = (x, y)
-            color = (0, 0, 255)
-            circle_picture = self.picture.copy()
-            self.qt_picture = Picture.convert_cv_qt(cv2.circle(circle_picture, coord, radius, color, line_size))
-            self.picture = circle_picture
+        self.apply('circle', x, y, radius, line_size)
+
+    def draw_circles(self, circles):
+        """
+        Рисует список кругов одной операцией.
+
+        :param circles: Круги - кортежи (x, y, радиус, толщина, b, g, r), см. модуль Annotations.
+        :type circles: tuple
+        """
+        self.apply('circles', *circles)
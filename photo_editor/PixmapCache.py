@@ -0,0 +1,189 @@
+"""
+Модуль кэша изображений для отображения (QPixmap) состояний истории изменений.
+
+Каждое состояние истории получает ключ (Document.keys), по которому в кэше хранится готовое
+к показу изображение размером не больше экрана. Изображение, показанное после операции
+или загрузки, кладется в кэш сразу, а для состояний без изображения оно строится при
+первой отмене или повторе. Поэтому переход между уже показанными состояниями не требует
+преобразования цвета и построения QPixmap полного кадра.
+
+Кэш общий для всех документов и ограничен по объему: при превышении удаляются изображения,
+которые дольше всего не показывались. Объем задается переменной окружения
+PHOTO_EDITOR_PIXMAP_CACHE в мегабайтах.
+"""
+from collections import OrderedDict
+import os
+
+import cv2
+
+from photo_editor.Picture import Picture
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_PIXMAP_CACHE'
+DEFAULT_MAX_MB = 256
+
+
+def pixmap_nbytes(pixmap):
+    """
+    :param pixmap: Изображение.
+    :type pixmap: QtGui.QPixmap
+    :return: Память, занимаемая изображением, в байтах.
+    :rtype: int
+    """
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
+def fit_display(image, size=None):
+    """
+    Уменьшает изображение до размера экрана. Может вызываться не из главного потока.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param size: Наибольший размер (ширина, высота), None - без уменьшения.
+    :type size: tuple
+    :return: Уменьшенная копия или исходное изображение, если оно помещается.
+    :rtype: numpy.ndarray
+    """
+    if size is not None:
+        height, width = image.shape[:2]
+        scale = min(1.0, size[0] / width, size[1] / height)
+        if scale < 1.0:
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+            factor = int(1 / scale)
+            if factor >= 2:
+                # Уменьшение в целое число раз OpenCV выполняет быстрым путем (в 2-3 раза быстрее
+                # дробного масштаба), остаток - на уже небольшом изображении
+                image = cv2.resize(image, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+            if (image.shape[1], image.shape[0]) != target:
+                image = cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def make_display_pixmap(image, size=None):
+    """
+    Строит изображение для отображения, уменьшая его до размера экрана.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param size: Наибольший размер (ширина, высота), None - без уменьшения.
+    :type size: tuple
+    :rtype: QtGui.QPixmap
+    """
+    return Picture.convert_cv_qt(fit_display(image, size))
+
+
+class PixmapCache:
+    """
+    Кэш изображений для отображения с ограничением объема и вытеснением давно не показанных.
+
+    Атрибуты:
+        max_bytes (int): Наибольший объем кэша, в байтах.
+        nbytes (int): Текущий объем кэша, в байтах.
+        hits (int): Количество изображений, взятых из кэша.
+        misses (int): Количество построенных изображений.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        """
+        :param max_bytes: Наибольший объем кэша, в байтах.
+        :type max_bytes: int
+        """
+        if max_bytes <= 0:
+            raise ValueError("Объем кэша изображений должен быть положительным: {}".format(max_bytes))
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._pixmaps = OrderedDict()
+
+    def __len__(self):
+        return len(self._pixmaps)
+
+    def __contains__(self, key):
+        return key in self._pixmaps
+
+    def get(self, key):
+        """
+        :param key: Ключ состояния истории.
+        :return: Изображение из кэша или None, если его нет.
+        :rtype: QtGui.QPixmap
+        """
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        """
+        Кладет изображение в кэш и вытесняет давно не показанные при превышении объема.
+        Изображение больше всего кэша не сохраняется.
+
+        :param key: Ключ состояния истории.
+        :param pixmap: Изображение.
+        :type pixmap: QtGui.QPixmap
+        """
+        self.discard(key)
+        size = pixmap_nbytes(pixmap)
+        if size > self.max_bytes:
+            return
+        self._pixmaps[key] = pixmap
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.nbytes -= pixmap_nbytes(evicted)
+
+    def load(self, key, image, size=None):
+        """
+        Возвращает изображение из кэша или строит его из изображения OpenCV и кладет в кэш.
+
+        :param key: Ключ состояния истории.
+        :param image: Изображение состояния.
+        :type image: numpy.ndarray
+        :param size: Наибольший размер изображения (ширина, высота), None - без уменьшения.
+        :type size: tuple
+        :rtype: QtGui.QPixmap
+        """
+        pixmap = self.get(key)
+        if pixmap is not None:
+            self.hits += 1
+            return pixmap
+        self.misses += 1
+        pixmap = make_display_pixmap(image, size)
+        self.put(key, pixmap)
+        return pixmap
+
+    def discard(self, key):
+        """
+        Удаляет изображение из кэша (например, состояния, вытесненного из истории).
+
+        :param key: Ключ состояния истории.
+        """
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is not None:
+            self.nbytes -= pixmap_nbytes(pixmap)
+
+    def clear(self):
+        """
+        Удаляет все изображения из кэша.
+        """
+        self._pixmaps.clear()
+        self.nbytes = 0
+
+
+def create_cache(value=None):
+    """
+    Создает кэш с объемом из переменной окружения PHOTO_EDITOR_PIXMAP_CACHE.
+
+    :param value: Объем в мегабайтах, по умолчанию читается из окружения (256 МБ, если не задан).
+    :type value: str
+    :rtype: PixmapCache
+    :raises ValueError: Если объем некорректен.
+    """
+    if value is None:
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    if not value.strip():
+        return PixmapCache()
+    try:
+        max_bytes = int(float(value) * 1024 * 1024)
+    except ValueError:
+        raise ValueError("Объем кэша изображений должен быть числом мегабайт: {}".format(value))
+    return PixmapCache(max_bytes)
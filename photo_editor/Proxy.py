@@ -0,0 +1,95 @@
+"""
+Модуль рабочих копий (прокси) уменьшенного разрешения.
+
+Интерактивное редактирование большого изображения выполняется над копией размером с экран:
+время отклика зависит от размера области отображения, а не от исходного разрешения.
+Операции записываются в координатах исходного изображения и пересчитываются для прокси
+функцией scale_operations; полноразмерный результат вычисляется по исходному изображению
+и записанной цепочке только при сохранении или по явному запросу.
+"""
+import cv2
+
+
+def fit_scale(shape, size):
+    """
+    Вычисляет масштаб, при котором изображение помещается в заданный размер.
+
+    :param shape: Форма изображения (высота, ширина, ...).
+    :type shape: tuple
+    :param size: Максимальный размер прокси (ширина, высота).
+    :type size: tuple
+    :return: Масштаб не больше 1.
+    :rtype: float
+    """
+    height, width = shape[:2]
+    max_width, max_height = size
+    if max_width <= 0 or max_height <= 0:
+        raise ValueError("Размер прокси должен быть положительным: {}".format(size))
+    return min(1.0, max_width / width, max_height / height)
+
+
+def make_proxy(image, scale, shape=None):
+    """
+    Строит уменьшенную копию изображения.
+
+    :param image: Изображение OpenCV.
+    :type image: numpy.ndarray
+    :param scale: Масштаб из fit_scale.
+    :type scale: float
+    :param shape: Форма исходного изображения, к которой относится масштаб, если image -
+        его уменьшенная при декодировании копия. По умолчанию - форма image.
+    :type shape: tuple
+    :return: Уменьшенная копия или исходное изображение, если масштаб равен 1.
+    :rtype: numpy.ndarray
+    """
+    if scale >= 1.0 and shape is None:
+        return image
+    height, width = (shape or image.shape)[:2]
+    size = (max(1, round(width * min(scale, 1.0))), max(1, round(height * min(scale, 1.0))))
+    if size == (image.shape[1], image.shape[0]):
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def scale_operation(name, args, scale):
+    """
+    Пересчитывает аргументы операции для прокси. Поточечные операции от масштаба не зависят,
+    у круга масштабируются координаты центра, радиус и толщина линии (отрицательная толщина -
+    заливка - сохраняется), у списка кругов circles - каждый круг.
+
+    :param name: Имя операции.
+    :type name: str
+    :param args: Аргументы операции в координатах исходного изображения.
+    :type args: tuple
+    :param scale: Масштаб прокси.
+    :type scale: float
+    :return: Кортеж (имя операции, кортеж аргументов) для прокси.
+    :rtype: tuple
+    """
+    args = tuple(args)
+    if name == 'circle' and scale != 1.0:
+        args = _scale_circle(args, scale)
+    elif name == 'circles' and scale != 1.0:
+        args = tuple(_scale_circle(item[:4], scale) + tuple(item[4:]) for item in args)
+    return name, args
+
+
+def _scale_circle(args, scale):
+    x, y, radius, line_size = args
+    if line_size > 0:
+        line_size = max(1, round(line_size * scale))
+    return round(x * scale), round(y * scale), max(0, round(radius * scale)), line_size
+
+
+def scale_operations(nodes, scale):
+    """
+    Пересчитывает цепочку операций для прокси.
+
+    :param nodes: Кортежи (имя операции, кортеж аргументов).
+    :type nodes: list
+    :param scale: Масштаб прокси.
+    :type scale: float
+    :return: Список операций для прокси.
+    :rtype: list
+    """
+    return [scale_operation(name, args, scale) for name, args in nodes]
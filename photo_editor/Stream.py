@@ -0,0 +1,249 @@
+"""
+Модуль потоковой обработки кадров через стандартные ввод и вывод.
+
+Позволяет встраивать операции редактора в конвейеры оболочки без временных файлов::
+
+    ffmpeg -i in.mp4 -f rawvideo -pix_fmt bgr24 - \\
+        | python -m photo_editor stream --size 1920x1080 --ops negative \\
+        | ffmpeg -f rawvideo -pix_fmt bgr24 -s 1920x1080 -r 60 -i - out.mp4
+
+Поддерживаются два формата:
+
+- raw - кадры BGR (bgr24) фиксированного размера подряд, без заголовков;
+- y4m - YUV4MPEG2 с цветностью 4:2:0; кадры переводятся в BGR, обрабатываются и переводятся
+  обратно, заголовок потока передается без изменений.
+
+Кадр читается в один заранее выделенный буфер, поточечные операции (каналы, негатив, яркость)
+свернуты в одну таблицу (модуль Chain) и применяются к нему на месте, результат пишется из
+того же буфера: на кадр не выделяется память. Запись блокируется, пока получатель не прочитает
+предыдущие данные, поэтому медленный получатель замедляет чтение, а не накапливает кадры.
+Модуль не зависит от PyQt5.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from photo_editor import Chain
+
+Y4M_MAGIC = b'YUV4MPEG2'
+Y4M_FRAME = b'FRAME'
+# Варианты цветности 4:2:0 отличаются только положением отсчетов цветности
+Y4M_COLORSPACES = (b'420', b'420jpeg', b'420paldv', b'420mpeg2')
+# Наибольшая длина строки заголовка YUV4MPEG2
+_MAX_HEADER = 1024
+
+
+def parse_size(spec):
+    """
+    :param spec: Размер кадра ``ШИРИНАxВЫСОТА``.
+    :type spec: str
+    :return: (ширина, высота).
+    :rtype: tuple
+    :raises ValueError: Если размер некорректен.
+    """
+    try:
+        width, height = (int(value) for value in spec.lower().split('x'))
+    except ValueError:
+        raise ValueError("Размер кадра задается как ШИРИНАxВЫСОТА: {}".format(spec))
+    if width <= 0 or height <= 0:
+        raise ValueError("Размер кадра должен быть положительным: {}".format(spec))
+    return width, height
+
+
+def read_exact(stream, view):
+    """
+    Заполняет буфер данными из потока. Канал может отдавать данные частями, поэтому
+    чтение повторяется до заполнения буфера.
+
+    :param stream: Двоичный поток с методом readinto.
+    :param view: Буфер.
+    :type view: memoryview
+    :return: True, если буфер заполнен; False, если поток закончился до начала буфера.
+    :rtype: bool
+    :raises ValueError: Если поток закончился посреди буфера.
+    """
+    filled = 0
+    total = len(view)
+    while filled < total:
+        count = stream.readinto(view[filled:])
+        if not count:
+            if filled:
+                raise ValueError("Поток закончился посреди кадра: получено {} из {} байт".format(filled, total))
+            return False
+        filled += count
+    return True
+
+
+def write_all(stream, view):
+    """
+    Записывает буфер в поток целиком; блокируется, пока получатель не примет данные.
+
+    :param stream: Двоичный поток с методом write.
+    :param view: Буфер.
+    :type view: memoryview
+    """
+    written = 0
+    total = len(view)
+    while written < total:
+        count = stream.write(view[written:])
+        written += total - written if count is None else count
+
+
+def read_line(stream, limit=_MAX_HEADER):
+    """
+    Читает строку заголовка YUV4MPEG2 (до перевода строки включительно).
+
+    :param stream: Двоичный поток.
+    :param limit: Наибольшая длина строки.
+    :type limit: int
+    :return: Строка без перевода строки или None, если поток закончился.
+    :rtype: bytes
+    :raises ValueError: Если строка длиннее limit или не завершена.
+    """
+    line = stream.readline(limit + 1)
+    if not line:
+        return None
+    if not line.endswith(b'\n'):
+        raise ValueError("Некорректная строка заголовка YUV4MPEG2: {!r}".format(line[:64]))
+    return line[:-1]
+
+
+def parse_y4m_header(line):
+    """
+    :param line: Заголовок потока YUV4MPEG2 без перевода строки.
+    :type line: bytes
+    :return: (ширина, высота).
+    :rtype: tuple
+    :raises ValueError: Если заголовок некорректен или цветность не 4:2:0.
+    """
+    fields = line.split(b' ')
+    if fields[0] != Y4M_MAGIC:
+        raise ValueError("Поток не является YUV4MPEG2")
+    params = {field[:1]: field[1:] for field in fields[1:] if field}
+    try:
+        width, height = int(params[b'W']), int(params[b'H'])
+    except (KeyError, ValueError):
+        raise ValueError("В заголовке YUV4MPEG2 нет размера кадра")
+    colorspace = params.get(b'C', b'420jpeg')
+    if colorspace not in Y4M_COLORSPACES:
+        raise ValueError("Поддерживается только цветность 4:2:0, в потоке: {}".format(colorspace.decode('ascii', 'replace')))
+    if width % 2 or height % 2:
+        raise ValueError("Размер кадра 4:2:0 должен быть четным: {}x{}".format(width, height))
+    return width, height
+
+
+class StreamProcessor:
+    """
+    Обработка потока кадров с переиспользуемыми буферами.
+
+    Атрибуты:
+        steps (list): План выполнения цепочки операций (Chain.optimize).
+        frames (int): Количество обработанных кадров.
+        read_time (float): Суммарное время чтения (ожидания входных данных), в секундах.
+        process_time (float): Суммарное время обработки, в секундах.
+        write_time (float): Суммарное время записи (ожидания получателя), в секундах.
+    """
+
+    def __init__(self, chain=()):
+        """
+        :param chain: Цепочка операций (см. Operations.parse_chain).
+        :type chain: list
+        """
+        self.steps = Chain.optimize(chain)
+        self.frames = 0
+        self.read_time = 0.0
+        self.process_time = 0.0
+        self.write_time = 0.0
+
+    def process(self, frame):
+        """
+        Применяет цепочку к кадру на месте.
+
+        :param frame: Кадр BGR, изменяется.
+        :type frame: numpy.ndarray
+        """
+        Chain.execute(frame, self.steps, dst=frame)
+
+    def run_raw(self, source, target, size):
+        """
+        Обрабатывает поток кадров bgr24 фиксированного размера до конца входного потока.
+
+        :param source: Входной двоичный поток.
+        :param target: Выходной двоичный поток.
+        :param size: Размер кадра (ширина, высота).
+        :type size: tuple
+        :raises ValueError: Если поток закончился посреди кадра.
+        """
+        frame = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        while True:
+            started = time.perf_counter()
+            if not read_exact(source, view):
+                break
+            read = time.perf_counter()
+            self.process(frame)
+            processed = time.perf_counter()
+            write_all(target, view)
+            self._count(started, read, processed)
+        target.flush()
+
+    def run_y4m(self, source, target):
+        """
+        Обрабатывает поток YUV4MPEG2 4:2:0 до конца входного потока.
+
+        :param source: Входной двоичный поток.
+        :param target: Выходной двоичный поток.
+        :raises ValueError: Если поток некорректен.
+        """
+        header = read_line(source)
+        if header is None:
+            return
+        width, height = parse_y4m_header(header)
+        write_all(target, memoryview(header + b'\n'))
+        # Плоскости I420 подряд: яркость, затем две плоскости цветности в четверть размера
+        yuv = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        view = memoryview(yuv).cast('B')
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        while True:
+            started = time.perf_counter()
+            line = read_line(source)
+            if line is None:
+                break
+            if not line.startswith(Y4M_FRAME):
+                raise ValueError("Ожидался заголовок кадра YUV4MPEG2: {!r}".format(line[:64]))
+            if not read_exact(source, view):
+                raise ValueError("Поток YUV4MPEG2 закончился после заголовка кадра")
+            read = time.perf_counter()
+            if self.steps:
+                cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420, dst=frame)
+                self.process(frame)
+                cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=yuv)
+            processed = time.perf_counter()
+            write_all(target, memoryview(line + b'\n'))
+            write_all(target, view)
+            self._count(started, read, processed)
+        target.flush()
+
+    def stats(self):
+        """
+        :return: Словарь: frames, fps (по времени обработки и обмена), read_ms, process_ms,
+            write_ms (средние на кадр).
+        :rtype: dict
+        """
+        total = self.read_time + self.process_time + self.write_time
+        frames = self.frames or 1
+        return {
+            'frames': self.frames,
+            'fps': self.frames / total if total > 0 else 0.0,
+            'read_ms': 1000 * self.read_time / frames,
+            'process_ms': 1000 * self.process_time / frames,
+            'write_ms': 1000 * self.write_time / frames,
+        }
+
+    def _count(self, started, read, processed):
+        finished = time.perf_counter()
+        self.frames += 1
+        self.read_time += read - started
+        self.process_time += processed - read
+        self.write_time += finished - processed
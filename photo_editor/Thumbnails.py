@@ -0,0 +1,263 @@
+"""
+Модуль миниатюр изображений для галереи.
+
+Миниатюра строится с уменьшением при декодировании (модуль Loader) и сохраняется в дисковый
+кэш. Ключ кэша - путь к файлу, время его изменения, размер и размер миниатюры, поэтому
+измененный файл получает новую миниатюру. Объем кэша ограничен; при превышении удаляются
+миниатюры, которые дольше всего не использовались (время изменения файла миниатюры
+обновляется при каждом чтении). Модуль не зависит от PyQt5, методы ThumbnailCache можно
+вызывать из нескольких потоков.
+
+Кэш настраивается переменной окружения PHOTO_EDITOR_THUMBNAILS: ``dir=/path/to/cache&max_mb=256``.
+"""
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from photo_editor import Encoder, Loader
+from photo_editor.Batch import IMAGE_EXTENSIONS
+
+ENVIRONMENT_VARIABLE = 'PHOTO_EDITOR_THUMBNAILS'
+DEFAULT_SIZE = 160
+DEFAULT_MAX_MB = 256
+THUMBNAIL_QUALITY = 85
+
+# При превышении объема кэш очищается до этой доли от максимума, чтобы не удалять по одному файлу
+_EVICT_TO = 0.9
+
+
+def default_directory():
+    """
+    :return: Каталог кэша миниатюр пользователя.
+    :rtype: str
+    """
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'photo_editor', 'thumbnails')
+
+
+def list_images(directory):
+    """
+    Перечисляет изображения каталога (без подкаталогов).
+
+    :param directory: Путь к каталогу.
+    :type directory: str
+    :return: Пути, отсортированные по имени файла.
+    :rtype: list
+    """
+    with os.scandir(directory) as entries:
+        paths = [entry.path for entry in entries
+                 if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()]
+    return sorted(paths, key=lambda path: os.path.basename(path).lower())
+
+
+def make_thumbnail(path, size=DEFAULT_SIZE):
+    """
+    Строит миниатюру изображения. JPEG декодируется с уменьшением в 2-8 раз.
+
+    :param path: Путь к изображению.
+    :type path: str
+    :param size: Наибольшая сторона миниатюры.
+    :type size: int
+    :return: Миниатюра OpenCV или None, если изображение не удалось декодировать.
+    :rtype: numpy.ndarray
+    """
+    data = Loader.map_file(path)
+    reduction = 1
+    if Loader.is_jpeg(data):
+        image_size = Loader.image_size(data)
+        if image_size is not None:
+            reduction = Loader.choose_reduction(image_size, (size, size))
+    image = Loader.decode_image(data, reduction)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = min(1.0, size / width, size / height)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return image
+
+
+class ThumbnailCache:
+    """
+    Дисковый кэш миниатюр с ограничением объема и вытеснением давно не использованных.
+
+    Атрибуты:
+        directory (str): Каталог кэша.
+        max_bytes (int): Наибольший объем кэша, в байтах.
+        size (int): Наибольшая сторона миниатюры.
+        total_bytes (int): Текущий объем кэша, в байтах.
+        hits (int): Количество миниатюр, прочитанных из кэша.
+        misses (int): Количество построенных миниатюр.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, size=DEFAULT_SIZE):
+        """
+        :param directory: Каталог кэша, по умолчанию - default_directory().
+        :type directory: str
+        :param max_bytes: Наибольший объем кэша, в байтах.
+        :type max_bytes: int
+        :param size: Наибольшая сторона миниатюры.
+        :type size: int
+        """
+        if max_bytes <= 0:
+            raise ValueError("Объем кэша миниатюр должен быть положительным: {}".format(max_bytes))
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(entry_size for _, _, entry_size in self._entries())
+
+    def _entries(self):
+        """
+        :return: Файлы кэша: кортежи (путь, время использования, размер).
+        :rtype: list
+        """
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.jpg') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def cache_path(self, path):
+        """
+        :param path: Путь к изображению.
+        :type path: str
+        :return: Путь к файлу миниатюры в кэше или None, если изображение недоступно.
+        :rtype: str
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = '{}\0{}\0{}\0{}'.format(os.path.abspath(path), stat.st_mtime_ns, stat.st_size, self.size)
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogatepass')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.jpg')
+
+    def get(self, path):
+        """
+        :param path: Путь к изображению.
+        :type path: str
+        :return: Миниатюра из кэша или None, если ее нет.
+        :rtype: numpy.ndarray
+        """
+        cache_path = self.cache_path(path)
+        if cache_path is None:
+            return None
+        try:
+            thumbnail = cv2.imdecode(np.fromfile(cache_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            os.utime(cache_path)
+        except OSError:
+            return None
+        if thumbnail is not None:
+            with self._lock:
+                self.hits += 1
+        return thumbnail
+
+    def put(self, path, thumbnail):
+        """
+        Записывает миниатюру в кэш и вытесняет давно не использованные при превышении объема.
+
+        :param path: Путь к изображению.
+        :type path: str
+        :param thumbnail: Миниатюра.
+        :type thumbnail: numpy.ndarray
+        """
+        cache_path = self.cache_path(path)
+        if cache_path is None:
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        encoded = Encoder.encode_image(thumbnail, '.jpg', Encoder.EncoderSettings(jpeg_quality=THUMBNAIL_QUALITY))
+        with self._lock:
+            # Размер заменяемого файла читается вместе с заменой: две одновременные записи одной
+            # миниатюры не учитываются в объеме дважды
+            try:
+                previous = os.path.getsize(cache_path)
+            except OSError:
+                previous = 0
+            Encoder.write_atomic(cache_path, encoded)
+            self.total_bytes += encoded.nbytes - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def load(self, path):
+        """
+        Возвращает миниатюру из кэша или строит ее и записывает в кэш.
+
+        :param path: Путь к изображению.
+        :type path: str
+        :return: Миниатюра или None, если изображение не удалось декодировать.
+        :rtype: numpy.ndarray
+        """
+        thumbnail = self.get(path)
+        if thumbnail is None:
+            thumbnail = make_thumbnail(path, self.size)
+            if thumbnail is not None:
+                with self._lock:
+                    self.misses += 1
+                self.put(path, thumbnail)
+        return thumbnail
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(entry_size for _, _, entry_size in entries)
+        for cache_path, _, entry_size in entries:
+            if total <= self.max_bytes * _EVICT_TO:
+                break
+            try:
+                os.remove(cache_path)
+            except OSError:
+                continue
+            total -= entry_size
+        self.total_bytes = total
+
+    def clear(self):
+        """
+        Удаляет все миниатюры из кэша.
+        """
+        with self._lock:
+            for cache_path, _, _ in self._entries():
+                try:
+                    os.remove(cache_path)
+                except OSError:
+                    pass
+            self.total_bytes = 0
+
+
+def create_cache(value=None):
+    """
+    Создает кэш миниатюр по значению переменной окружения PHOTO_EDITOR_THUMBNAILS.
+
+    :param value: Параметры ``dir=<каталог>&max_mb=<объем>&size=<сторона>``, по умолчанию
+        читаются из окружения.
+    :type value: str
+    :rtype: ThumbnailCache
+    :raises ValueError: Если параметр неизвестен или его значение недопустимо.
+    """
+    if value is None:
+        value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    options = {'dir': None, 'max_mb': DEFAULT_MAX_MB, 'size': DEFAULT_SIZE}
+    for item in filter(None, (part.strip() for part in value.split('&'))):
+        name, _, option = item.partition('=')
+        name = name.strip().lower()
+        if name not in options:
+            raise ValueError("Неизвестный параметр кэша миниатюр: {}".format(name))
+        if name == 'dir':
+            options[name] = option.strip()
+            continue
+        try:
+            options[name] = float(option) if name == 'max_mb' else int(option)
+        except ValueError:
+            raise ValueError("Недопустимое значение параметра {}: {}".format(name, option))
+    return ThumbnailCache(options['dir'], int(options['max_mb'] * 1024 * 1024), options['size'])
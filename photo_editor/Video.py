@@ -0,0 +1,361 @@
+"""
+Модуль обработки видеофайлов: цепочка операций применяется к каждому кадру.
+
+Обработка выполняется конвейером из трех этапов, соединенных очередями ограниченной длины:
+
+- декодирование - поток, читающий кадры выбранного диапазона из входного файла;
+- обработка - несколько потоков, применяющих к кадрам оптимизированную цепочку операций
+  (модуль Chain); OpenCV освобождает GIL на время вычислений, поэтому потоки загружают ядра;
+- кодирование - поток, записывающий кадры в выходной файл в исходном порядке.
+
+Очереди ограничены, поэтому быстрый этап не накапливает кадры в памяти, а ждет медленный.
+Для каждого этапа считаются время работы и ожидания, по которым видно узкое место.
+Модуль не зависит от PyQt5.
+"""
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from photo_editor import Chain, FrameSource
+
+# Расширение выходного файла -> FOURCC по умолчанию
+DEFAULT_CODECS = {
+    '.mp4': 'mp4v',
+    '.m4v': 'mp4v',
+    '.mov': 'mp4v',
+    '.avi': 'MJPG',
+    '.mkv': 'XVID',
+}
+# Длина очередей между этапами, в кадрах на поток обработки
+QUEUE_FRAMES = 2
+STAGES = ('decode', 'process', 'encode')
+
+# Признак конца потока кадров в очереди
+_END = None
+
+
+class PipelineError(Exception):
+    """
+    Ошибка этапа конвейера; прерывает обработку видео.
+    """
+
+
+def default_codec(path):
+    """
+    :param path: Путь к выходному файлу.
+    :type path: str
+    :return: FOURCC по расширению файла.
+    :rtype: str
+    :raises ValueError: Если для расширения нет кодека по умолчанию.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in DEFAULT_CODECS:
+        raise ValueError("Задайте кодек для файла {}: кодек по умолчанию известен для {}".format(
+            path, ', '.join(sorted(DEFAULT_CODECS))))
+    return DEFAULT_CODECS[extension]
+
+
+def parse_range(spec):
+    """
+    Разбирает диапазон кадров ``НАЧАЛО:КОНЕЦ`` (конец не включается, любая граница может
+    быть опущена).
+
+    :param spec: Например ``100:500``, ``100:`` или ``:500``.
+    :type spec: str
+    :return: (начало, конец или None).
+    :rtype: tuple
+    :raises ValueError: Если диапазон некорректен.
+    """
+    start, separator, end = spec.partition(':')
+    try:
+        start = int(start) if start.strip() else 0
+        end = int(end) if end.strip() else None
+    except ValueError:
+        raise ValueError("Диапазон кадров задается как НАЧАЛО:КОНЕЦ: {}".format(spec))
+    if not separator or start < 0 or (end is not None and end <= start):
+        raise ValueError("Диапазон кадров задается как НАЧАЛО:КОНЕЦ, 0 <= НАЧАЛО < КОНЕЦ: {}".format(spec))
+    return start, end
+
+
+class StageStats:
+    """
+    Статистика этапа конвейера.
+
+    Атрибуты:
+        frames (int): Количество кадров, прошедших этап.
+        busy (float): Суммарное время работы потоков этапа, в секундах.
+        wait (float): Суммарное время ожидания очередей (нет входных кадров или выходная
+            очередь заполнена), в секундах.
+        threads (int): Количество потоков этапа.
+    """
+
+    def __init__(self, threads=1):
+        self.frames = 0
+        self.busy = 0.0
+        self.wait = 0.0
+        self.threads = threads
+        self._lock = threading.Lock()
+
+    def add(self, busy, wait):
+        with self._lock:
+            self.frames += 1
+            self.busy += busy
+            self.wait += wait
+
+    def to_dict(self, seconds):
+        """
+        :param seconds: Общее время работы конвейера.
+        :type seconds: float
+        :return: Словарь: frames, threads, fps (кадров в секунду работы одного потока, умноженное
+            на количество потоков - предельная скорость этапа), busy_ms (на кадр), load
+            (доля времени, занятая работой).
+        :rtype: dict
+        """
+        return {
+            'frames': self.frames,
+            'threads': self.threads,
+            'fps': self.frames * self.threads / self.busy if self.busy > 0 else 0.0,
+            'busy_ms': 1000 * self.busy / self.frames if self.frames else 0.0,
+            'load': self.busy / (seconds * self.threads) if seconds > 0 else 0.0,
+        }
+
+
+class VideoPipeline:
+    """
+    Конвейер обработки видеофайла: декодирование, обработка и кодирование в отдельных потоках.
+
+    Атрибуты:
+        source (str): Входной видеофайл.
+        target (str): Выходной видеофайл.
+        steps (list): План выполнения цепочки операций (Chain.optimize).
+        codec (str): FOURCC выходного файла.
+        start (int): Первый обрабатываемый кадр.
+        end (int): Кадр, перед которым обработка завершается, None - до конца файла.
+        workers (int): Количество потоков обработки.
+        stats (dict): Имя этапа -> StageStats.
+    """
+
+    def __init__(self, source, target, chain=(), codec=None, start=0, end=None, workers=None, fps=None,
+                 queue_size=None):
+        """
+        :param chain: Цепочка операций (см. Operations.parse_chain).
+        :type chain: list
+        :param codec: FOURCC, по умолчанию - по расширению выходного файла (default_codec).
+        :type codec: str
+        :param workers: Количество потоков обработки, по умолчанию - число ядер.
+        :type workers: int
+        :param fps: Частота кадров выходного файла, по умолчанию - как у входного.
+        :type fps: float
+        :param queue_size: Длина каждой очереди, в кадрах, по умолчанию QUEUE_FRAMES * workers.
+        :type queue_size: int
+        :raises ValueError: Если параметры некорректны.
+        """
+        self.codec = codec or default_codec(target)
+        FrameSource.fourcc_code(self.codec)
+        if start < 0 or (end is not None and end <= start):
+            raise ValueError("Некорректный диапазон кадров: {}:{}".format(start, '' if end is None else end))
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        if fps is not None and fps <= 0:
+            raise ValueError("Частота кадров должна быть положительной: {}".format(fps))
+        self.source = source
+        self.target = target
+        self.steps = Chain.optimize(chain)
+        self.start = start
+        self.end = end
+        self.fps = fps
+        self.queue_size = queue_size or QUEUE_FRAMES * self.workers
+        self.stats = {'decode': StageStats(), 'process': StageStats(self.workers), 'encode': StageStats()}
+        self._decoded = queue.Queue(self.queue_size)
+        self._processed = queue.Queue(self.queue_size)
+        self._stopped = threading.Event()
+        self._error = None
+
+    def run(self, progress=None):
+        """
+        Обрабатывает видео.
+
+        :param progress: Функция progress(записано кадров), вызываемая потоком кодирования
+            после каждого кадра.
+        :type progress: callable
+        :return: Словарь: frames, seconds, fps, width, height, codec и статистика этапов
+            STAGES (см. StageStats.to_dict).
+        :rtype: dict
+        :raises ValueError: Если входной файл не открывается или выходной не создается.
+        :raises PipelineError: Если этап завершился с ошибкой.
+        """
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise ValueError("Не удалось открыть видеофайл: {}".format(self.source))
+        writer = None
+        try:
+            self._seek(capture)
+            started = time.perf_counter()
+            ok, first = capture.read()
+            first_busy = time.perf_counter() - started
+            if not ok:
+                raise ValueError("В видеофайле нет кадров с номером {}: {}".format(self.start, self.source))
+            height, width = first.shape[:2]
+            fps = self.fps or capture.get(cv2.CAP_PROP_FPS) or 25.0
+            writer = cv2.VideoWriter(self.target, FrameSource.fourcc_code(self.codec), fps, (width, height))
+            if not writer.isOpened():
+                raise ValueError("Не удалось создать видеофайл {} с кодеком {}".format(self.target, self.codec))
+            threads = [threading.Thread(target=self._guard, args=(self._decode, capture, first, first_busy),
+                                        name='photo-editor-video-decode', daemon=True)]
+            threads += [threading.Thread(target=self._guard, args=(self._process,),
+                                         name='photo-editor-video-process', daemon=True)
+                        for _ in range(self.workers)]
+            threads.append(threading.Thread(target=self._guard, args=(self._encode, writer, progress),
+                                            name='photo-editor-video-encode', daemon=True))
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(0.1)
+            except KeyboardInterrupt:
+                self._fail(KeyboardInterrupt())
+                for thread in threads:
+                    thread.join()
+            seconds = time.perf_counter() - started
+        finally:
+            capture.release()
+            if writer is not None:
+                writer.release()
+        if isinstance(self._error, KeyboardInterrupt):
+            raise self._error
+        if self._error is not None:
+            raise PipelineError(str(self._error))
+        frames = self.stats['encode'].frames
+        result = {
+            'frames': frames,
+            'seconds': seconds,
+            'fps': frames / seconds if seconds > 0 else 0.0,
+            'width': width,
+            'height': height,
+            'codec': self.codec,
+            'workers': self.workers,
+        }
+        result.update((name, self.stats[name].to_dict(seconds)) for name in STAGES)
+        return result
+
+    def _seek(self, capture):
+        # Переход к первому кадру диапазона; если файл не поддерживает позиционирование,
+        # кадры до него пропускаются без декодирования
+        if not self.start:
+            return
+        if capture.set(cv2.CAP_PROP_POS_FRAMES, self.start) and \
+                int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == self.start:
+            return
+        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        for _ in range(self.start):
+            if not capture.grab():
+                break
+
+    def _guard(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as error:  # ошибка этапа останавливает весь конвейер
+            self._fail(error)
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stopped.set()
+
+    def _put(self, target, item):
+        # Помещает элемент в очередь, пока конвейер не остановлен; возвращает время ожидания
+        started = time.perf_counter()
+        while not self._stopped.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        return time.perf_counter() - started
+
+    def _get(self, source):
+        # Берет элемент из очереди; при остановке конвейера возвращает признак конца
+        while not self._stopped.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _decode(self, capture, frame, busy):
+        stats = self.stats['decode']
+        index = self.start
+        try:
+            while True:
+                stats.add(busy, self._put(self._decoded, (index, frame)))
+                index += 1
+                if self._stopped.is_set() or (self.end is not None and index >= self.end):
+                    break
+                started = time.perf_counter()
+                ok, frame = capture.read()
+                busy = time.perf_counter() - started
+                if not ok:
+                    break
+        finally:
+            for _ in range(self.workers):
+                self._put(self._decoded, _END)
+
+    def _process(self):
+        stats = self.stats['process']
+        try:
+            while True:
+                started = time.perf_counter()
+                item = self._get(self._decoded)
+                received = time.perf_counter()
+                if item is _END:
+                    break
+                index, frame = item
+                frame = Chain.execute(frame, self.steps, dst=frame)
+                processed = time.perf_counter()
+                wait = self._put(self._processed, (index, frame))
+                stats.add(processed - received, received - started + wait)
+        finally:
+            self._put(self._processed, _END)
+
+    def _encode(self, writer, progress):
+        # Потоки обработки завершают кадры не по порядку: кадры, пришедшие раньше своей
+        # очереди, ждут в словаре. Их не больше, чем кадров в очередях и потоках обработки
+        stats = self.stats['encode']
+        pending = {}
+        expected = self.start
+        finished = 0
+        wait = 0.0
+        while finished < self.workers:
+            started = time.perf_counter()
+            item = self._get(self._processed)
+            wait += time.perf_counter() - started
+            if item is _END:
+                if self._stopped.is_set():
+                    return
+                finished += 1
+                continue
+            pending[item[0]] = item[1]
+            while expected in pending:
+                started = time.perf_counter()
+                writer.write(pending.pop(expected))
+                stats.add(time.perf_counter() - started, wait)
+                wait = 0.0
+                expected += 1
+                if progress is not None:
+                    progress(stats.frames)
+
+
+def process_video(source, target, chain=(), codec=None, start=0, end=None, workers=None, fps=None,
+                  queue_size=None, progress=None):
+    """
+    Применяет цепочку операций к каждому кадру видеофайла (см. VideoPipeline).
+
+    :return: Статистика (см. VideoPipeline.run).
+    :rtype: dict
+    """
+    pipeline = VideoPipeline(source, target, chain, codec, start, end, workers, fps, queue_size)
+    return pipeline.run(progress)
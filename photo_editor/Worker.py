@@ -0,0 +1,317 @@
+"""
+Модуль фонового выполнения операций над изображением.
+
+OperationRunner выполняет операции в пуле потоков Qt (QThreadPool), чтобы окно не зависало
+на больших изображениях. Одновременно выполняется не больше одного задания, поэтому
+результаты применяются к изображению и истории строго по порядку. Операции, поступившие
+во время выполнения задания, накапливаются и затем выполняются одним заданием: цепочка
+оптимизируется (модуль Chain), и, например, пять нажатий подряд на "Увеличить яркость"
+превращаются в одно вычисление итогового состояния.
+
+Изображение для отображения строится в том же фоновом потоке и не больше экрана. Если операции
+меняют только небольшую часть изображения (круги, Operations.chain_rect), преобразуется только
+эта часть: главный поток дорисовывает ее в показанное изображение (Canvas.patch_pixmap).
+
+TaskRunner выполняет в пуле потоков произвольные функции, например вычисление
+полноразмерного изображения и его запись при сохранении.
+
+StallMonitor измеряет задержки цикла обработки событий главного потока.
+"""
+import itertools
+import time
+
+from PyQt5.QtCore import QCoreApplication, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from photo_editor import Chain, Operations
+from photo_editor.Picture import Picture
+from photo_editor.PixmapCache import fit_display
+
+# Наибольшая доля площади изображения, при которой для отображения преобразуется только
+# измененная область: большая область дешевле уменьшить вместе со всем изображением
+MAX_REGION_FRACTION = 0.5
+
+
+class _JobSignals(QObject):
+    """
+    Сигналы задания: QRunnable не является QObject и не может испускать сигналы сам.
+    """
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class _Job(QRunnable):
+    """
+    Задание пула потоков: вызывает функцию и передает результат в главный поток.
+    """
+
+    def __init__(self, job_id, function, args):
+        super().__init__()
+        self.job_id = job_id
+        self.function = function
+        self.args = args
+        self.signals = _JobSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except Exception as error:  # ошибка передается в главный поток
+            self.signals.failed.emit(self.job_id, str(error))
+            return
+        self.signals.finished.emit(self.job_id, result)
+
+
+def _render(base, operations, display_size):
+    started = time.perf_counter()
+    image = Chain.run(base, operations)
+    computed = time.perf_counter()
+    rect = Operations.chain_rect(operations, image.shape)
+    if rect is not None and rect[2] * rect[3] > MAX_REGION_FRACTION * image.shape[0] * image.shape[1]:
+        rect = None
+    if rect is None:
+        qimage = Picture.convert_cv_qimage(fit_display(image, display_size))
+    else:
+        x, y, width, height = rect
+        qimage = Picture.convert_cv_qimage(image[y:y + height, x:x + width])
+    return image, qimage, rect, {'operation': computed - started, 'convert': time.perf_counter() - computed}
+
+
+class OperationRunner(QObject):
+    """
+    Выполняет операции над изображением в фоновом потоке с объединением и отменой.
+
+    Сигналы:
+        started: Начато выполнение задания.
+        committed (numpy.ndarray, QImage, object, object): Готов результат задания: изображение,
+            QImage для отображения (не больше display_size), выполненное действие (кортеж (имя, аргументы) или
+            список таких кортежей, если операции были объединены) - в том виде, в котором
+            операции были переданы в submit, до преобразования transform, - и измененная
+            область (x, y, ширина, высота). Если область задана, QImage содержит только ее
+            в разрешении изображения, а остальная часть изображения совпадает с изображением,
+            к которому применялось задание; None - изменено все изображение.
+        idle: Все задания выполнены или отменены.
+        failed (str): Ошибка при выполнении задания.
+
+    Атрибуты:
+        coalesced (int): Количество операций, объединенных с предыдущими.
+        last_timings (dict): Замеры последнего примененного задания: submitted (время по
+            time.perf_counter() первой операции задания), queue, operation и convert (в секундах).
+    """
+    started = pyqtSignal()
+    committed = pyqtSignal(object, object, object, object)
+    idle = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, get_base, parent=None, pool=None, transform=None, display_size=None):
+        """
+        :param get_base: Функция без аргументов, возвращающая текущее изображение, к которому
+            применяется следующее задание. Вызывается в главном потоке после применения
+            результата предыдущего задания.
+        :type get_base: callable
+        :param parent: Родительский объект Qt.
+        :param pool: Пул потоков, по умолчанию - глобальный.
+        :type pool: QThreadPool
+        :param transform: Функция, преобразующая список операций перед выполнением над
+            изображением get_base (например, пересчет координат для рабочей копии).
+        :type transform: callable
+        :param display_size: Функция без аргументов, возвращающая наибольший размер изображения
+            для отображения (ширина, высота), например размер экрана. None - без уменьшения.
+        :type display_size: callable
+        """
+        super().__init__(parent)
+        self._get_base = get_base
+        self._transform = transform
+        self._display_size = display_size
+        self._pool = pool or QThreadPool.globalInstance()
+        self._ids = itertools.count()
+        self._pending = []
+        self._running = None
+        self._jobs = {}
+        self._submitted = None
+        self.coalesced = 0
+        self.last_timings = None
+
+    @property
+    def busy(self):
+        """
+        Выполняется ли задание или есть ожидающие операции.
+
+        :rtype: bool
+        """
+        return self._running is not None or bool(self._pending)
+
+    def submit(self, name, args=()):
+        """
+        Ставит операцию в очередь. Если задание уже выполняется, операция будет объединена
+        с другими ожидающими операциями.
+
+        :param name: Имя операции из Operations.OPERATIONS.
+        :type name: str
+        :param args: Аргументы операции.
+        :type args: tuple
+        """
+        if not self._pending:
+            self._submitted = time.perf_counter()
+        self._pending.append((name, tuple(args)))
+        if self._running is None:
+            self._start_next()
+
+    def cancel(self):
+        """
+        Отменяет ожидающие операции и выполняющееся задание: его результат будет отброшен.
+        """
+        self._pending = []
+        if self._running is not None:
+            self._running = None
+            self.idle.emit()
+
+    def _start_next(self):
+        operations = Chain.simplify(self._pending)
+        if len(self._pending) > 1:
+            self.coalesced += len(self._pending) - 1
+        self._pending = []
+        base = self._get_base()
+        if not operations or base is None:
+            self._running = None
+            self.idle.emit()
+            return
+        self._running = next(self._ids)
+        executed = self._transform(operations) if self._transform is not None else operations
+        display_size = self._display_size() if self._display_size is not None else None
+        # Ссылка на задание хранится до его завершения, даже если оно отменено
+        job = self._jobs[self._running] = _Job(self._running, _render, (base, executed, display_size))
+        job.operations = operations
+        job.submitted = self._submitted
+        job.queued = time.perf_counter() - self._submitted
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        self.started.emit()
+        self._pool.start(job)
+
+    def _on_finished(self, job_id, result):
+        job = self._jobs.pop(job_id)
+        if job_id != self._running:
+            return
+        image, qimage, rect, timings = result
+        operations = job.operations
+        self._running = None
+        self.last_timings = dict(timings, submitted=job.submitted, queue=job.queued)
+        self.committed.emit(image, qimage, operations[0] if len(operations) == 1 else operations, rect)
+        self._start_next()
+
+    def _on_failed(self, job_id, message):
+        self._jobs.pop(job_id)
+        if job_id != self._running:
+            return
+        self._running = None
+        self._pending = []
+        self.failed.emit(message)
+        self.idle.emit()
+
+
+class TaskRunner(QObject):
+    """
+    Выполняет функции в пуле потоков, результат передается сигналом в главный поток.
+
+    Сигналы:
+        finished (object): Функция завершилась, передается ее результат.
+        failed (str): Функция завершилась с ошибкой.
+    """
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, pool=None):
+        """
+        :param parent: Родительский объект Qt.
+        :param pool: Пул потоков, по умолчанию - глобальный.
+        :type pool: QThreadPool
+        """
+        super().__init__(parent)
+        self._pool = pool or QThreadPool.globalInstance()
+        self._ids = itertools.count()
+        self._jobs = {}
+
+    @property
+    def busy(self):
+        """
+        Есть ли невыполненные функции.
+
+        :rtype: bool
+        """
+        return bool(self._jobs)
+
+    def submit(self, function, *args):
+        """
+        Запускает функцию в пуле потоков. Аргументы не должны изменяться до ее завершения.
+
+        :param function: Функция.
+        :type function: callable
+        :param args: Аргументы функции.
+        """
+        job_id = next(self._ids)
+        job = self._jobs[job_id] = _Job(job_id, function, args)
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        self._pool.start(job)
+
+    def wait(self):
+        """
+        Ожидает завершения всех функций и доставляет их результаты (например, перед закрытием окна).
+        """
+        while self._jobs:
+            self._pool.waitForDone(100)
+            QCoreApplication.processEvents()
+
+    def _on_finished(self, job_id, result):
+        self._jobs.pop(job_id)
+        self.finished.emit(result)
+
+    def _on_failed(self, job_id, message):
+        self._jobs.pop(job_id)
+        self.failed.emit(message)
+
+
+class StallMonitor(QObject):
+    """
+    Измеряет задержки цикла обработки событий главного потока.
+
+    Таймер срабатывает каждые interval_ms миллисекунд; если событие обработано позже,
+    превышение считается временем, в течение которого главный поток был занят.
+
+    Атрибуты:
+        total_stall (float): Суммарное время задержек, в секундах.
+        max_stall (float): Наибольшая задержка, в секундах.
+        stalls (int): Количество задержек длиннее threshold_ms.
+    """
+
+    def __init__(self, parent=None, interval_ms=20, threshold_ms=50):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.total_stall = 0.0
+        self.max_stall = 0.0
+        self.stalls = 0
+        self._last = time.perf_counter()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._tick)
+        self._timer.start(interval_ms)
+
+    def _tick(self):
+        now = time.perf_counter()
+        stall = now - self._last - self.interval
+        self._last = now
+        if stall > 0:
+            self.total_stall += stall
+            self.max_stall = max(self.max_stall, stall)
+            if stall > self.threshold:
+                self.stalls += 1
+
+    def stats(self):
+        """
+        :return: Словарь: total_stall_ms, max_stall_ms, stalls.
+        :rtype: dict
+        """
+        return {
+            'total_stall_ms': 1000 * self.total_stall,
+            'max_stall_ms': 1000 * self.max_stall,
+            'stalls': self.stalls,
+        }
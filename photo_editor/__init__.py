@@ -1,9 +1,36 @@
+"""
+Пакет photo_editor.
 
+Классы пакета загружаются лениво при первом обращении (``photo_editor.MainWindow``),
+поэтому консольные команды ``python -m photo_editor ...`` не загружают PyQt5.
+Класс Picture импортируется из одноименного модуля (``from photo_editor.Picture import Picture``):
+атрибут пакета photo_editor.Picture - это модуль.
+"""
+import importlib
 
-from .Buttons import *
-from .CameraWindow import *
-from .FormBrightness import *
-from .FormCircle import *
-from .mainWindow import *
-from .Picture import *
+_LAZY_NAMES = {
+    'Button': 'Buttons',
+    'GalleryButton': 'Buttons',
+    'CameraButton': 'Buttons',
+    'BrightnessButton': 'Buttons',
+    'CircleButton': 'Buttons',
+    'NegativeButton': 'Buttons',
+    'CameraWindow': 'CameraWindow',
+    'FormBrightness': 'FormBrightness',
+    'FormCircle': 'FormCircle',
+    'ZeroCoordsException': 'FormCircle',
+    'MainWindow': 'mainWindow',
+}
 
+
+def __getattr__(name):
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module('.' + module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
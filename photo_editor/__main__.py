@@ -0,0 +1,270 @@
+"""
+Запуск photo_editor из командной строки: ``python -m photo_editor <команда>``.
+
+Команды:
+    batch - пакетная обработка изображений из каталога или по шаблону glob.
+    camera - нагрузочный тест захвата и предпросмотра камеры без графического интерфейса.
+    video - покадровая обработка видеофайла.
+    stream - обработка потока кадров со стандартного ввода на стандартный вывод.
+"""
+import argparse
+import os
+import sys
+
+
+def cmd_batch(args):
+    """
+    Выполняет команду batch.
+
+    :param args: Разобранные аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Код возврата процесса.
+    :rtype: int
+    """
+    from photo_editor import Annotations, Batch, Macro, Operations
+
+    try:
+        chain = Operations.parse_chain(args.ops)
+        if args.macro is not None:
+            try:
+                chain = Macro.Macro.load(args.macro).operations + chain
+            except OSError as error:
+                raise ValueError("Не удалось прочитать макрос: {}".format(error))
+        if not chain and args.circles is None:
+            raise ValueError("Задайте цепочку операций (--ops), макрос (--macro) или файл кругов (--circles)")
+        if args.circles is not None and not os.path.exists(args.circles):
+            raise ValueError("Файл или каталог кругов не найден: {}".format(args.circles))
+        if args.circles is not None and os.path.isfile(args.circles):
+            Annotations.load_circles(args.circles)
+    except ValueError as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 2
+    paths = Batch.collect_images(args.source)
+    if not paths:
+        print("Изображения не найдены: {}".format(args.source), file=sys.stderr)
+        return 1
+    extension = None
+    if args.format:
+        extension = '.' + args.format.lstrip('.').lower()
+
+    def progress(done, total, source, error):
+        if error is not None:
+            print("Ошибка {}: {}".format(source, error), file=sys.stderr)
+        elif not args.quiet and (done % 100 == 0 or done == total):
+            print("{}/{}".format(done, total), file=sys.stderr)
+
+    stats = Batch.run_batch(paths, chain, args.output, workers=args.workers, chunksize=args.chunksize,
+                            extension=extension, progress=progress, circles=args.circles)
+    print("Обработано: {images}, ошибок: {failed}, процессов: {workers}, chunksize: {chunksize}, "
+          "время: {seconds:.2f} с, скорость: {images_per_second:.1f} изобр./с".format(
+              **dict(stats, chunksize=stats['chunksize'] or '-')))
+    return 1 if stats['failed'] else 0
+
+
+def cmd_camera(args):
+    """
+    Выполняет команду camera.
+
+    :param args: Разобранные аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Код возврата процесса.
+    :rtype: int
+    """
+    from photo_editor import Capture, FrameSource, Operations
+
+    try:
+        chain = Operations.parse_chain(args.ops)
+        width, height = (int(value) for value in args.preview.lower().split('x'))
+        source = FrameSource.open_source(args.source)
+    except ValueError as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 2
+    try:
+        if not source.is_opened():
+            print("Не удалось открыть источник кадров: {}".format(args.source), file=sys.stderr)
+            return 1
+        print("Источник: {}".format(source.settings()))
+        stats = Capture.run_capture(source, args.seconds, chain, (width, height), args.capacity)
+    finally:
+        source.release()
+    print("Кадров: {frames}, обработано: {processed}, пропущено: {dropped}, захват: {capture_fps:.1f} к/с, "
+          "показ: {preview_fps:.1f} к/с, обработка: {process_ms:.2f} мс (p95 {process_ms_p95:.2f} мс), "
+          "задержка: {latency_ms:.2f} мс".format(**stats))
+    return 0
+
+
+def cmd_video(args):
+    """
+    Выполняет команду video.
+
+    :param args: Разобранные аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Код возврата процесса.
+    :rtype: int
+    """
+    from photo_editor import Macro, Operations, Video
+
+    try:
+        chain = Operations.parse_chain(args.ops)
+        if args.macro is not None:
+            try:
+                chain = Macro.Macro.load(args.macro).operations + chain
+            except OSError as error:
+                raise ValueError("Не удалось прочитать макрос: {}".format(error))
+        start, end = Video.parse_range(args.frames) if args.frames else (0, None)
+        pipeline = Video.VideoPipeline(args.source, args.output, chain, codec=args.codec, start=start, end=end,
+                                       workers=args.workers, fps=args.fps, queue_size=args.queue)
+    except ValueError as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 2
+
+    def progress(done):
+        if not args.quiet and done % 100 == 0:
+            print("{} кадров".format(done), file=sys.stderr)
+
+    try:
+        stats = pipeline.run(progress)
+    except (ValueError, Video.PipelineError) as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 1
+    print("Кадров: {frames} ({width}x{height}, {codec}), потоков обработки: {workers}, время: {seconds:.2f} с, "
+          "скорость: {fps:.1f} к/с".format(**stats))
+    for stage in Video.STAGES:
+        print("  {:<8} {fps:>8.1f} к/с  {busy_ms:>7.2f} мс/кадр  загрузка {load:>4.0%}  потоков: {threads}".format(
+            stage, **stats[stage]))
+    return 0
+
+
+def cmd_stream(args):
+    """
+    Выполняет команду stream. Статистика выводится в stderr: stdout занят кадрами.
+
+    :param args: Разобранные аргументы командной строки.
+    :type args: argparse.Namespace
+    :return: Код возврата процесса.
+    :rtype: int
+    """
+    import cv2
+
+    from photo_editor import Macro, Operations, Stream
+
+    try:
+        chain = Operations.parse_chain(args.ops)
+        if args.macro is not None:
+            try:
+                chain = Macro.Macro.load(args.macro).operations + chain
+            except OSError as error:
+                raise ValueError("Не удалось прочитать макрос: {}".format(error))
+        if args.format == 'raw':
+            if args.size is None:
+                raise ValueError("Для формата raw задайте размер кадра (--size)")
+            size = Stream.parse_size(args.size)
+    except ValueError as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 2
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    processor = Stream.StreamProcessor(chain)
+    try:
+        if args.format == 'raw':
+            processor.run_raw(sys.stdin.buffer, sys.stdout.buffer, size)
+        else:
+            processor.run_y4m(sys.stdin.buffer, sys.stdout.buffer)
+    except ValueError as error:
+        print("Ошибка: {}".format(error), file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Получатель закрыл канал: дальнейший вывод некуда писать
+        sys.stdout = None
+        return 1
+    if not args.quiet:
+        print("Кадров: {frames}, скорость: {fps:.1f} к/с, чтение: {read_ms:.2f} мс, обработка: {process_ms:.2f} мс, "
+              "запись: {write_ms:.2f} мс".format(**processor.stats()), file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    """
+    Создает парсер аргументов командной строки.
+
+    :return: Парсер аргументов.
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog='python -m photo_editor', description="Редактор фото без графического интерфейса")
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch = subparsers.add_parser('batch', help="пакетная обработка изображений")
+    batch.add_argument('source', help="каталог с изображениями или шаблон glob (например, 'photos/**/*.jpg')")
+    batch.add_argument('--ops', default='',
+                       help="цепочка операций, например 'negative,brighten:40,red,circle:100:100:50:3'")
+    batch.add_argument('--macro', default=None,
+                       help="файл макроса, записанного в редакторе; операции --ops выполняются после него")
+    batch.add_argument('--circles', default=None,
+                       help="круги, рисуемые после цепочки: файл CSV/JSON для всех изображений или каталог "
+                            "с файлом <относительный путь изображения>.json/.csv для каждого")
+    batch.add_argument('-o', '--output', required=True, help="выходной каталог")
+    batch.add_argument('-j', '--workers', type=int, default=None, help="количество процессов (по умолчанию - число ядер)")
+    batch.add_argument('--chunksize', type=int, default=None, help="количество изображений на одно задание процесса")
+    batch.add_argument('--format', default=None, help="формат выходных файлов (png, jpg, ...), по умолчанию - как у входных")
+    batch.add_argument('-q', '--quiet', action='store_true', help="не выводить прогресс")
+    batch.set_defaults(handler=cmd_batch)
+
+    camera = subparsers.add_parser('camera', help="нагрузочный тест захвата и предпросмотра камеры")
+    camera.add_argument('--source', default=None,
+                        help="источник кадров, например 'device:0?width=1280&height=720&fourcc=MJPG&buffer_size=1', "
+                             "'file:video.mp4', 'dir:frames/' или 'synthetic?width=1920&height=1080&fps=0' "
+                             "(по умолчанию - переменная окружения PHOTO_EDITOR_CAMERA или первая камера)")
+    camera.add_argument('--ops', default='', help="цепочка операций фильтра предпросмотра")
+    camera.add_argument('--preview', default='800x600', help="размер предпросмотра, ШИРИНАxВЫСОТА")
+    camera.add_argument('--seconds', type=float, default=5.0, help="длительность теста в секундах")
+    camera.add_argument('--capacity', type=int, default=4, help="емкость кольцевого буфера кадров")
+    camera.set_defaults(handler=cmd_camera)
+
+    video = subparsers.add_parser('video', help="покадровая обработка видеофайла")
+    video.add_argument('source', help="входной видеофайл")
+    video.add_argument('-o', '--output', required=True, help="выходной видеофайл")
+    video.add_argument('--ops', default='', help="цепочка операций, применяемая к каждому кадру")
+    video.add_argument('--macro', default=None, help="файл макроса; операции --ops выполняются после него")
+    video.add_argument('--codec', default=None,
+                       help="FOURCC выходного файла, например mp4v, MJPG, XVID, avc1 (по умолчанию - по расширению)")
+    video.add_argument('--frames', default=None,
+                       help="диапазон кадров НАЧАЛО:КОНЕЦ (конец не включается), например 100:500 или 100:")
+    video.add_argument('--fps', type=float, default=None, help="частота кадров выходного файла (по умолчанию - как у входного)")
+    video.add_argument('-j', '--workers', type=int, default=None,
+                       help="количество потоков обработки (по умолчанию - число ядер)")
+    video.add_argument('--queue', type=int, default=None, help="длина очередей между этапами, в кадрах")
+    video.add_argument('-q', '--quiet', action='store_true', help="не выводить прогресс")
+    video.set_defaults(handler=cmd_video)
+
+    stream = subparsers.add_parser('stream', help="обработка потока кадров со стандартного ввода на стандартный вывод")
+    stream.add_argument('--format', choices=('raw', 'y4m'), default='raw',
+                        help="формат потока: raw - кадры bgr24 подряд, y4m - YUV4MPEG2 4:2:0")
+    stream.add_argument('--size', default=None, help="размер кадра raw, ШИРИНАxВЫСОТА")
+    stream.add_argument('--ops', default='', help="цепочка операций, применяемая к каждому кадру")
+    stream.add_argument('--macro', default=None, help="файл макроса; операции --ops выполняются после него")
+    stream.add_argument('--threads', type=int, default=1,
+                        help="количество потоков OpenCV (по умолчанию 1: ядра остаются соседним программам конвейера)")
+    stream.add_argument('-q', '--quiet', action='store_true', help="не выводить статистику в stderr")
+    stream.set_defaults(handler=cmd_stream)
+    return parser
+
+
+def main(argv=None):
+    """
+    Точка входа командной строки.
+
+    :param argv: Аргументы командной строки, по умолчанию sys.argv[1:].
+    :type argv: list
+    :return: Код возврата процесса.
+    :rtype: int
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'handler', None):
+        parser.print_help()
+        return 2
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,18 +4,39 @@ mainWindow.py
 Описание: модуль основного окна графического интерфейса
 
 """
-from collections import deque
+import os
+import sys
+import time
 
-from PyQt5.QtGui import QIcon
 
-from photo_editor import Picture
+from photo_editor import Annotations, Loader
 from photo_editor.Buttons import GalleryButton, CameraButton, BrightnessButton, CircleButton, NegativeButton
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
-from photo_editor.CameraWindow import CameraWindow
-from photo_editor.FormBrightness import FormBrightness
-from photo_editor.FormCircle import FormCircle
+from photo_editor.Canvas import Canvas, patch_pixmap
+from photo_editor.Documents import Document, create_workspace
+from photo_editor.Icons import PRELOAD_DELAY, icon, preload
+from photo_editor.Encoder import create_settings
+from photo_editor.History import action_operations, create_history
+from photo_editor.Macro import EXTENSION as MACRO_EXTENSION, Macro, Recorder
+from photo_editor.Metrics import create_metrics, format_breakdown
+from photo_editor.Picture import Picture
+from photo_editor.PixmapCache import create_cache as create_pixmap_cache, make_display_pixmap
+from photo_editor.Worker import OperationRunner, StallMonitor, TaskRunner
+# Окно камеры, формы и панель галереи загружаются при первом открытии (вместе с модулями
+# захвата кадров и кэша миниатюр), чтобы не задерживать появление окна при запуске
+
+
+# Отображаемые в строке состояния имена действий и этапов замера времени
+METRIC_NAMES = {
+    'load': 'Загрузка', 'load_full': 'Полная загрузка', 'switch': 'Переключение', 'camera': 'Снимок', 'undo': 'Отмена', 'redo': 'Повтор', 'save': 'Сохранение',
+    'red': 'Красный канал', 'green': 'Зеленый канал', 'blue': 'Синий канал', 'negative': 'Негатив',
+    'brighten': 'Яркость', 'circle': 'Круг', 'circles': 'Круги',
+    'read': 'чтение', 'decode': 'декодирование', 'proxy': 'копия', 'queue': 'очередь', 'operation': 'операция',
+    'convert': 'преобразование', 'pixmap': 'QPixmap', 'paint': 'отрисовка', 'history': 'история',
+    'render': 'вычисление', 'encode': 'кодирование', 'write': 'запись',
+}
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -34,17 +55,66 @@ class MainWindow(QtWidgets.QMainWindow):
     windowBrightness (FormBrightness):
      окно, требующее ввести насколько необходимо увеличить яркость изображения
 
-    history  (collections.deque):
-        Двусторонняя очередь, содержащая историю изменений изображения для возможности отката (undo).
+    workspace (Workspace):
+        открытые документы (вкладки) с общим бюджетом памяти (переменная окружения PHOTO_EDITOR_MEMORY):
+        при его превышении неактивные документы освобождают исходные изображения и сжимают историю
 
-    future (collections.deque):
-        Двусторонняя очередь, содержащая будущие изменения изображения для возможности повторения (redo).
+    pixmap_cache (PixmapCache):
+        изображения состояний истории для отображения, чтобы отмена и повтор не преобразовывали кадр заново
+        (объем задается переменной окружения PHOTO_EDITOR_PIXMAP_CACHE)
+
+    history (History):
+        История изменений активного документа для возможности отката (undo) и повторения (redo),
+        ограниченная по памяти: старые состояния сжимаются или выгружаются на диск.
+
+    picture_module (Picture):
+        изображение активного документа; большие изображения редактируются в виде рабочей копии
+        размером с экран
+
+    picture_states (list):
+        снимки Picture.state для состояний истории активного документа, нужны для вычисления
+        полноразмерного изображения после отмены и повтора действий
+
+    operation_runner (OperationRunner):
+        выполняет операции над изображением в фоновом потоке, объединяя операции, поступившие
+        во время выполнения
+
+    task_runner (TaskRunner):
+        вычисляет и записывает полноразмерное изображение при сохранении в фоновом потоке
+
+    gallery (GalleryPanel):
+        панель галереи с миниатюрами изображений папки (кнопка галереи, контекстное меню или Ctrl+G),
+        None до первого открытия
+
+    load_runner (TaskRunner):
+        декодирует полное изображение большого JPEG в фоновом потоке, пока показывается
+        и редактируется его уменьшенная при декодировании копия
+
+    metrics (Metrics):
+        замер времени этапов действий; включается переменной окружения PHOTO_EDITOR_METRICS,
+        разбивка последнего действия показывается в строке состояния, метрики сессии
+        записываются в JSON при закрытии окна
+
+    encoder_settings (EncoderSettings):
+        параметры кодировщиков при сохранении (качество JPEG и WebP, уровень сжатия PNG),
+        задаются переменной окружения PHOTO_EDITOR_ENCODER
+
+    stall_monitor (StallMonitor):
+        измеряет задержки цикла обработки событий (время, когда окно не отвечает)
 
 
     Методы:
 
     show_picture(): используется для связи с кнопкой "Выбрать фото из галереи", открывает изображение из галереи
 
+    open_gallery(): показывает панель галереи с миниатюрами изображений выбранной папки
+
+    open_file(path): открывает изображение из файла
+
+    new_document(history): открывает новую пустую вкладку
+
+    switch_document(index), close_document(index): переключают и закрывают вкладки
+
     red_channel(): используется для связи с кнопкой "Красный канал", показывает красный канал изображения
 
     green_channel(): используется для связи с кнопкой "Зеленый канал", показывает зеленый канал изображения
@@ -59,7 +129,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     more_brightness(): используется для связи с кнопкой "Увеличить яркость", открывает окно с прибавлением яркости
 
-    save_photo(): используется для связи с кнопкой "Сохранить фото", сохраняет изображение
+    save_photo(): используется для связи с кнопкой "Сохранить фото", сохраняет изображение в исходном разрешении
+    в фоновом потоке
 
     apply_brightness(amount): добавляет яркость на фото
 
@@ -67,9 +138,15 @@ class MainWindow(QtWidgets.QMainWindow):
 
     apply_circle(data_list): рисует круг на изображении
 
+    import_circles(): рисует на изображении круги из файла CSV или JSON
+
+    record_macro(recording): начинает и завершает запись макроса - правок активного документа
+
+    replay_macro(): применяет макрос ко всем изображениям папки в отдельном процессе
+
     updateIcons(): обновляет иконки кнопок
 
-    add_action_to_history(): добавляет действие в историю действий
+    add_action_to_history(cv2_photo, action): добавляет действие в историю действий
 
     changeIconBack(): меняет иконку кнопки "Назад"
 
@@ -78,23 +155,83 @@ class MainWindow(QtWidgets.QMainWindow):
     undo(): используется для связи с кнопкой "Назад", отменяет действие
 
     forward(): используется для связи с кнопкой "Вперед", отменяет отмену действия
+
+    commit_operation(image, qimage, action, rect): показывает результат фоновой операции и добавляет его в историю
+
+    cancel_operation(): используется для связи с кнопкой "Отмена" и клавишей Esc, отменяет выполняемые операции
+
+    show_progress(), hide_progress(): показывают и скрывают индикатор выполнения операции
+
+    show_pixmap(pixmap, action, region): показывает изображение в mainPicture
+
+    screen_pixmap(): возвращает изображение активного документа размером не больше экрана
+
+    display_pixmap(image): возвращает изображение текущего состояния истории из кэша изображений
+
+    show_metrics(breakdown): показывает разбивку времени последнего действия в строке состояния
+
+    closeEvent(event): освобождает память документов и их историй изменений при закрытии окна
     """
     BackSignal = QtCore.pyqtSignal()
     ForwardSignal = QtCore.pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, history=None, proxy=True, metrics=None):
         """
         Инициализация объекта
 
+        :param history: история изменений, по умолчанию создается функцией create_history
+            (режим задается переменной окружения PHOTO_EDITOR_HISTORY)
+        :param proxy: редактировать изображения больше экрана в виде уменьшенной рабочей копии
+        :param metrics: замер времени действий, по умолчанию создается функцией create_metrics
         """
         super().__init__()
         self.camera_window = None
         self.windowCircle = None
         self.windowBrightness = None
-        self.history = deque()
-        self.future = deque()
+        self.metrics = metrics if metrics is not None else create_metrics()
+        self.encoder_settings = create_settings()
+        self.proxy_size = self.screen_size() if proxy else None
+        self.workspace = create_workspace()
+        self.pixmap_cache = create_pixmap_cache()
+        self.workspace.add(Document(Picture(proxy_size=self.proxy_size),
+                                    history if history is not None else create_history()))
+        self.operation_runner = OperationRunner(lambda: self.picture_module.picture, self,
+                                                transform=lambda nodes: self.picture_module.proxy_operations(nodes),
+                                                display_size=self.screen_size)
+        # Загрузка и сохранение выполняются в отдельном пуле, чтобы операции над изображением
+        # не ждали их в очереди глобального пула (на одноядерной машине в нем один поток)
+        self.background_pool = QtCore.QThreadPool(self)
+        self.background_pool.setMaxThreadCount(2)
+        self.task_runner = TaskRunner(self, self.background_pool)
+        self.load_runner = TaskRunner(self, self.background_pool)
+        self.stall_monitor = StallMonitor(self)
+        self.macro_recorder = Recorder()
+        self.macro_document = None
+        self.macro_path = None
+        self.macro_process = None
         self.setupUi()
-        self.picture_module = Picture()
+        # Остальные иконки декодируются, когда окно уже показано и отрисовано
+        QtCore.QTimer.singleShot(PRELOAD_DELAY, preload)
+
+    @property
+    def history(self):
+        return self.workspace.active.history
+
+    @property
+    def picture_module(self):
+        return self.workspace.active.picture
+
+    @property
+    def picture_states(self):
+        return self.workspace.active.states
+
+    @property
+    def picture_state_index(self):
+        return self.workspace.active.state_index
+
+    @picture_state_index.setter
+    def picture_state_index(self, index):
+        self.workspace.active.state_index = index
 
     def setupUi(self):
         """
@@ -266,7 +403,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.horizontalLayout.addWidget(self.ButtonLoad)
         self.ButtonLoad.clicked.connect(self.save_photo)
         self.gridLayout_6.addLayout(self.horizontalLayout, 0, 0, 1, 1)
-        self.mainPicture = QtWidgets.QLabel(self.centralwidget)
+        self.mainPicture = Canvas(self.centralwidget)
         self.mainPicture.setMinimumSize(QtCore.QSize(800, 750))
         self.mainPicture.setMaximumSize(QtCore.QSize(10000000, 16777215))
         self.mainPicture.setStyleSheet("\n"
@@ -278,6 +415,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.mainPicture.setText("")
 
         self.gridLayout_6.addWidget(self.mainPicture, 1, 2, 1, 1)
+        self.tabDocuments = QtWidgets.QTabBar(self.centralwidget)
+        self.tabDocuments.setTabsClosable(True)
+        self.tabDocuments.setExpanding(False)
+        self.tabDocuments.setStyleSheet("color: rgb(255, 255, 255);")
+        self.tabDocuments.setObjectName("tabDocuments")
+        for document in self.workspace.documents:
+            self.tabDocuments.addTab(document.title)
+        self.tabDocuments.currentChanged.connect(self.switch_document)
+        self.tabDocuments.tabCloseRequested.connect(self.close_document)
+        self.gridLayout_6.addWidget(self.tabDocuments, 0, 2, 1, 1)
         self.verticalLayout_3 = QtWidgets.QVBoxLayout()
         self.verticalLayout_3.setObjectName("verticalLayout_3")
         spacerItem7 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
@@ -515,6 +662,61 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statusbar = QtWidgets.QStatusBar(self)
         self.statusbar.setObjectName("statusbar")
         self.setStatusBar(self.statusbar)
+        self.progressBar = QtWidgets.QProgressBar(self.statusbar)
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.setObjectName("progressBar")
+        self.progressBar.hide()
+        self.statusbar.addPermanentWidget(self.progressBar)
+        self.ButtonCancel = QtWidgets.QPushButton(self.statusbar)
+        self.ButtonCancel.setStyleSheet("color: rgb(255, 255, 255);")
+        self.ButtonCancel.setObjectName("ButtonCancel")
+        self.ButtonCancel.hide()
+        self.statusbar.addPermanentWidget(self.ButtonCancel)
+        self.ButtonCancel.clicked.connect(self.cancel_operation)
+        self.gallery = None
+        self.actionGallery = QtWidgets.QAction(self)
+        self.actionGallery.setShortcut(QtGui.QKeySequence("Ctrl+G"))
+        self.actionGallery.triggered.connect(self.open_gallery)
+        self.ButtonGallery.addAction(self.actionGallery)
+        self.addAction(self.actionGallery)
+        self.actionImportCircles = QtWidgets.QAction(self)
+        self.actionImportCircles.setShortcut(QtGui.QKeySequence("Ctrl+Shift+C"))
+        self.actionImportCircles.triggered.connect(self.import_circles)
+        self.ButtonRedCircle.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+        self.ButtonRedCircle.addAction(self.actionImportCircles)
+        self.addAction(self.actionImportCircles)
+        self.actionRecordMacro = QtWidgets.QAction(self)
+        self.actionRecordMacro.setCheckable(True)
+        self.actionRecordMacro.setShortcut(QtGui.QKeySequence("Ctrl+R"))
+        self.actionRecordMacro.toggled.connect(self.record_macro)
+        self.actionReplayMacro = QtWidgets.QAction(self)
+        self.actionReplayMacro.setShortcut(QtGui.QKeySequence("Ctrl+Shift+R"))
+        self.actionReplayMacro.triggered.connect(self.replay_macro)
+        for action in (self.actionRecordMacro, self.actionReplayMacro):
+            self.ButtonLoad.addAction(action)
+            self.addAction(action)
+        self.macroLabel = QtWidgets.QLabel(self.statusbar)
+        self.macroLabel.setStyleSheet("color: rgb(255, 80, 80);")
+        self.macroLabel.setObjectName("macroLabel")
+        self.macroLabel.hide()
+        self.statusbar.addPermanentWidget(self.macroLabel)
+        self.shortcutCancel = QtWidgets.QShortcut(QtGui.QKeySequence(QtCore.Qt.Key_Escape), self)
+        self.shortcutCancel.activated.connect(self.cancel_operation)
+        self.operation_runner.started.connect(self.show_progress)
+        self.operation_runner.idle.connect(self.hide_progress)
+        self.operation_runner.committed.connect(self.commit_operation)
+        self.operation_runner.failed.connect(self.statusbar.showMessage)
+        self.task_runner.finished.connect(self.finish_save)
+        self.task_runner.failed.connect(self.statusbar.showMessage)
+        self.load_runner.finished.connect(self.finish_load)
+        self.load_runner.failed.connect(self.statusbar.showMessage)
+        self.metricsLabel = QtWidgets.QLabel(self.statusbar)
+        self.metricsLabel.setStyleSheet("color: rgb(255, 255, 255);")
+        self.metricsLabel.setObjectName("metricsLabel")
+        self.metricsLabel.setVisible(self.metrics.enabled)
+        self.statusbar.addPermanentWidget(self.metricsLabel)
+        self.metrics.subscribe(self.show_metrics)
         self.BackSignal.connect(self.changeIconBack)
         self.ForwardSignal.connect(self.changeIconForward)
 
@@ -527,12 +729,155 @@ class MainWindow(QtWidgets.QMainWindow):
         использует модуль модуль Picture для загрузки изображения из галереи
         :return:
         """
-        path = self.picture_module.load_picture()
+        path = Picture.ask_open_path()
         if path:
-            self.mainPicture.setPixmap(QtGui.QPixmap(self.picture_module.path))
-            self.mainPicture.setScaledContents(True)
-            self.mainPicture.setObjectName("mainPicture")
-            self.add_action_to_history(self.picture_module.picture)
+            self.open_file(path)
+
+    def open_gallery(self):
+        """
+        Показывает панель галереи; если папка еще не выбрана, открывает диалог выбора папки
+        """
+        if self.gallery is None:
+            from photo_editor.GalleryPanel import GalleryPanel
+
+            self.gallery = GalleryPanel(self)
+            self.gallery.imageActivated.connect(self.open_file)
+            self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.gallery)
+        if self.gallery.directory is None:
+            self.gallery.choose_directory()
+        self.gallery.show()
+
+    def open_file(self, path):
+        """
+        Открывает изображение из файла. Файл отображается в память и декодируется один раз;
+        большой JPEG сначала декодируется в уменьшенном виде и сразу показывается, а полное
+        изображение декодируется в фоновом потоке
+        :param path: путь к файлу
+        """
+        self.operation_runner.cancel()
+        pending = None
+        with self.metrics.action('load') as action:
+            with action.stage('read'):
+                file_bytes = Picture.read_file(path)
+                reduction = self.picture_module.preview_reduction(file_bytes)
+            with action.stage('decode'):
+                image = Picture.decode_image(file_bytes, reduction)
+            if image is None:
+                self.statusbar.showMessage("Не удалось открыть изображение: {}".format(path), 5000)
+                return
+            with action.stage('proxy'):
+                self.prepare_document()
+                if reduction > 1:
+                    pending = self.picture_module.set_preview(image, Loader.image_size(file_bytes))
+                else:
+                    self.picture_module.set_source(image)
+                    self.workspace.active.set_file(path, image)
+                self.picture_module.path = path
+            with action.stage('convert'):
+                pixmap = self.screen_pixmap()
+            self.show_pixmap(pixmap, action)
+            with action.stage('history'):
+                self.add_action_to_history(self.picture_module.picture)
+        if pending is not None:
+            self.statusbar.showMessage("Загрузка полного изображения...")
+            self.load_runner.submit(MainWindow.decode_full, file_bytes, pending, time.perf_counter())
+
+    @staticmethod
+    def decode_full(file_bytes, pending, started):
+        """
+        Декодирует полное изображение. Выполняется в фоновом потоке
+        :return: ожидаемое изображение, время начала и время декодирования в секундах
+        """
+        decoded = time.perf_counter()
+        Loader.load_full(file_bytes, pending)
+        return pending, started, time.perf_counter() - decoded
+
+    def finish_load(self, result):
+        """
+        Заменяет ожидаемое исходное изображение полным после окончания фонового декодирования
+        :param result: результат decode_full
+        """
+        pending, started, seconds = result
+        with self.metrics.action('load_full', started) as action:
+            action.add('decode', seconds)
+        for document in self.workspace.documents:
+            for index, (source, scale, operations) in enumerate(document.states):
+                if source is pending:
+                    document.states[index] = (pending.image, scale, operations)
+            if document.picture.source is pending:
+                document.picture.source = pending.image
+                document.set_file(document.picture.path, pending.image)
+                if document is self.workspace.active:
+                    self.statusbar.showMessage("Изображение загружено", 3000)
+        self.workspace.enforce()
+
+    def new_document(self, history=None):
+        """
+        Открывает новую пустую вкладку и делает ее активной
+        :param history: история изменений документа, по умолчанию создается функцией create_history
+        """
+        self.operation_runner.cancel()
+        self.workspace.add(Document(Picture(proxy_size=self.proxy_size),
+                                    history if history is not None else create_history()))
+        self.tabDocuments.blockSignals(True)
+        self.tabDocuments.setCurrentIndex(self.tabDocuments.addTab(self.workspace.active.title))
+        self.tabDocuments.blockSignals(False)
+        with self.metrics.action('switch') as action:
+            self.show_document(action)
+
+    def prepare_document(self):
+        """
+        Открывает новую вкладку для загружаемого изображения, если в активной уже есть изображение
+        """
+        if not self.workspace.active.empty:
+            self.new_document()
+
+    def switch_document(self, index):
+        """
+        Делает активным документ вкладки. Освобожденная память документа возвращается по требованию
+        :param index: индекс вкладки
+        """
+        if index < 0 or self.workspace.documents[index] is self.workspace.active:
+            return
+        self.operation_runner.cancel()
+        with self.metrics.action('switch') as action:
+            self.workspace.activate(self.workspace.documents[index])
+            self.show_document(action)
+
+    def close_document(self, index):
+        """
+        Закрывает вкладку; последняя вкладка не закрывается, а очищается
+        :param index: индекс вкладки
+        """
+        self.operation_runner.cancel()
+        document = self.workspace.documents[index]
+        if len(self.workspace.documents) == 1:
+            self.new_document()
+        for key in document.keys:
+            self.pixmap_cache.discard(key)
+        self.workspace.remove(document)
+        self.tabDocuments.blockSignals(True)
+        self.tabDocuments.removeTab(index)
+        self.tabDocuments.setCurrentIndex(self.workspace.documents.index(self.workspace.active))
+        self.tabDocuments.blockSignals(False)
+        with self.metrics.action('switch') as action:
+            self.workspace.activate(self.workspace.active)
+            self.show_document(action)
+
+    def show_document(self, action):
+        """
+        Показывает изображение активного документа и обновляет название его вкладки
+        :param action: замер текущего действия (Metrics.action)
+        """
+        if self.picture_module.source is None:
+            self.mainPicture.clear()
+        else:
+            with action.stage('convert'):
+                pixmap = self.screen_pixmap()
+            self.show_pixmap(pixmap, action)
+        self.tabDocuments.setTabText(self.workspace.documents.index(self.workspace.active),
+                                     self.workspace.active.title)
+        self.updateIcons()
 
     def red_channel(self):
         """
@@ -541,12 +886,7 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         if self.picture_module.picture is not None:
-            self.picture_module.show_red()
-            pixmap = self.picture_module.qt_picture
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
-            self.mainPicture.setObjectName("mainPicture")
-            self.add_action_to_history(self.picture_module.picture)
+            self.operation_runner.submit('red')
 
     def green_channel(self):
         """
@@ -555,12 +895,7 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         if self.picture_module.picture is not None:
-            self.picture_module.show_green()
-            pixmap = self.picture_module.qt_picture
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
-            self.mainPicture.setObjectName("mainPicture")
-            self.add_action_to_history(self.picture_module.picture)
+            self.operation_runner.submit('green')
 
     def negative(self):
         """
@@ -568,15 +903,10 @@ class MainWindow(QtWidgets.QMainWindow):
         использует модуль Picture для показа негативного изображения
         :return:
         """
-        self.ButtonNegative.setIcon(QIcon("icons/pressed_znacok.negativ_.png"))
+        self.ButtonNegative.setIcon(icon("icons/pressed_znacok.negativ_.png"))
         self.setIconSize(QtCore.QSize(180, 90))
         if self.picture_module.picture is not None:
-            self.picture_module.show_negative()
-            pixmap = self.picture_module.qt_picture
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
-            self.mainPicture.setObjectName("mainPicture")
-            self.add_action_to_history(self.picture_module.picture)
+            self.operation_runner.submit('negative')
 
     def blue_channel(self):
         """
@@ -586,12 +916,7 @@ class MainWindow(QtWidgets.QMainWindow):
        """
 
         if self.picture_module.picture is not None:
-            self.picture_module.show_blue()
-            pixmap = self.picture_module.qt_picture
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
-            self.mainPicture.setObjectName("mainPicture")
-            self.add_action_to_history(self.picture_module.picture)
+            self.operation_runner.submit('blue')
 
     def open_camera_window(self):
         """
@@ -599,6 +924,8 @@ class MainWindow(QtWidgets.QMainWindow):
        использует модуль CameraWindow, открывает окно с камерой
        :return:
        """
+        from photo_editor.CameraWindow import CameraWindow
+
         self.camera_window = CameraWindow()
         self.camera_window.image_captured.connect(self.display_image)
         self.camera_window.show()
@@ -608,12 +935,18 @@ class MainWindow(QtWidgets.QMainWindow):
         Метод, отображающий фото с камеры на главном окне, при нажатии кнопки "Сделать фото"
         на окне с камерой
         """
-        self.mainPicture.setPixmap(image)
-        self.mainPicture.setScaledContents(True)
-        self.mainPicture.setObjectName("mainPicture")
-        self.picture_module.picture = image_cv2
-        self.picture_module.qt_picture = image
-        self.add_action_to_history(self.picture_module.picture)
+        self.operation_runner.cancel()
+        with self.metrics.action('camera') as action:
+            with action.stage('proxy'):
+                self.prepare_document()
+                self.picture_module.set_source(image_cv2)
+            with action.stage('convert'):
+                if not self.picture_module.proxied:
+                    self.picture_module.qt_picture = image
+                pixmap = self.picture_module.qt_picture
+            self.show_pixmap(pixmap, action)
+            with action.stage('history'):
+                self.add_action_to_history(self.picture_module.picture)
 
     def more_brightness(self):
         """
@@ -623,19 +956,64 @@ class MainWindow(QtWidgets.QMainWindow):
                :return:
                """
 
-        self.ButtonBrightness.setIcon(QIcon("icons/pressed_free-icon-brightness-12411189.png"))
+        self.ButtonBrightness.setIcon(icon("icons/pressed_free-icon-brightness-12411189.png"))
         self.ButtonBrightness.setIconSize(QtCore.QSize(64, 64))
         if self.picture_module.picture is not None:
+            from photo_editor.FormBrightness import FormBrightness
+
             self.windowBrightness = FormBrightness()
             self.windowBrightness.show()
             self.windowBrightness.BrightnessSignal.connect(self.apply_brightness)
 
     def save_photo(self):
         """
-        Метод сохраняет фото, используяя модуль Picture
+        Метод сохраняет фото в исходном разрешении, используяя модуль Picture.
+        Вычисление полноразмерного изображения и запись выполняются в фоновом потоке
         :return:
         """
-        self.picture_module.save_picture_dialog()
+        path = self.picture_module.ask_save_path()
+        if path:
+            self.statusbar.showMessage("Сохранение...")
+            state = self.picture_module.state if self.picture_module.proxied else None
+            image = self.picture_module.picture if state is None else None
+            self.task_runner.submit(MainWindow.write_photo, state, image, path, self.encoder_settings,
+                                    time.perf_counter())
+
+    @staticmethod
+    def write_photo(state, image, path, settings, started):
+        """
+        Вычисляет полноразмерное изображение (если оно задано снимком Picture.state), кодирует
+        его в памяти и атомарно записывает в файл. Выполняется в фоновом потоке
+        :return: время начала сохранения и статистика записи (Encoder.save_image) с временем render
+        """
+        rendered = time.perf_counter()
+        if state is not None:
+            image = Picture.render_state(state)
+        render = time.perf_counter() - rendered
+        stats = Picture.write_picture(image, path, settings)
+        stats['render'] = render
+        return started, stats
+
+    def finish_save(self, result):
+        """
+        Сообщает о завершении сохранения (размер файла и скорость записи) и записывает замеры его этапов
+        :param result: результат write_photo
+        """
+        started, stats = result
+        with self.metrics.action('save', started) as action:
+            for stage in ('render', 'encode', 'write'):
+                action.add(stage, stats[stage])
+        self.statusbar.showMessage("Изображение сохранено: {}, {:.1f} МБ, {:.0f} МБ/с".format(
+            stats['path'], stats['bytes'] / 1024 / 1024, stats['mb_per_s']), 5000)
+
+    def screen_size(self):
+        """
+        Возвращает размер экрана в физических пикселях - размер рабочей копии больших изображений
+        :return: (ширина, высота)
+        """
+        screen = QtWidgets.QApplication.primaryScreen()
+        size = screen.size() * screen.devicePixelRatio()
+        return size.width(), size.height()
 
     def apply_brightness(self, amount: int):
         """
@@ -643,12 +1021,7 @@ class MainWindow(QtWidgets.QMainWindow):
         :param amount: число, на сколько необходимо увеличить яркость
         :return:
         """
-        self.picture_module.brighten(amount)
-        pixmap = self.picture_module.qt_picture
-        self.mainPicture.setPixmap(pixmap)
-        self.mainPicture.setScaledContents(True)
-        self.mainPicture.setObjectName("mainPicture")
-        self.add_action_to_history(self.picture_module.picture)
+        self.operation_runner.submit('brighten', (amount,))
 
     def red_circle(self):
         """
@@ -656,6 +1029,8 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         if self.picture_module.picture is not None:
+            from photo_editor.FormCircle import FormCircle
+
             self.windowCircle = FormCircle()
             self.windowCircle.show()
             self.windowCircle.CircleSignal.connect(self.apply_circle)
@@ -667,12 +1042,128 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         x, y, radius, line_size = data_list
-        self.picture_module.draw_circle(x, y, radius, line_size)
-        pixmap = self.picture_module.qt_picture
-        self.mainPicture.setPixmap(pixmap)
-        self.mainPicture.setScaledContents(True)
-        self.mainPicture.setObjectName("mainPicture")
-        self.add_action_to_history(self.picture_module.picture)
+        self.operation_runner.submit('circle', (x, y, radius, line_size))
+
+    def import_circles(self):
+        """
+        Метод, связанный с контекстным меню кнопки ButtonRedCircle и сочетанием Ctrl+Shift+C,
+        рисует на изображении круги из файла CSV или JSON одной операцией (одним действием в истории)
+        :return:
+        """
+        if self.picture_module.picture is None:
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Открыть файл кругов", "",
+                                                        "Круги (*.csv *.json);;Все файлы (*)")
+        if not path:
+            return
+        try:
+            circles = Annotations.load_circles(path)
+        except (OSError, ValueError) as error:
+            self.statusbar.showMessage("Не удалось прочитать круги: {}".format(error), 5000)
+            return
+        if circles:
+            self.operation_runner.submit('circles', circles)
+
+    def record_macro(self, recording):
+        """
+        Метод, связанный с пунктом "Записывать макрос" контекстного меню кнопки ButtonLoad и сочетанием Ctrl+R:
+        начинает запись правок активного документа или завершает ее и сохраняет макрос в файл
+        :param recording: начать (True) или завершить (False) запись
+        """
+        if recording:
+            if self.picture_module.picture is None:
+                self.statusbar.showMessage("Откройте изображение, чтобы записать макрос", 3000)
+                self.actionRecordMacro.setChecked(False)
+                return
+            self.macro_document = self.workspace.active
+            self.macro_recorder.start(self.macro_document.picture.operations)
+            self.macroLabel.show()
+            return
+        if not self.macro_recorder.recording:
+            return
+        self.macroLabel.hide()
+        document, self.macro_document = self.macro_document, None
+        operations = document.picture.operations if document in self.workspace.documents else []
+        macro = self.macro_recorder.stop(operations)
+        if not len(macro):
+            self.statusbar.showMessage("Макрос пуст: во время записи не было правок", 3000)
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Сохранить макрос", self.macro_path or "",
+                                                        "Макрос (*{})".format(MACRO_EXTENSION))
+        if not path:
+            self.statusbar.showMessage("Макрос не сохранен", 3000)
+            return
+        if not path.lower().endswith(MACRO_EXTENSION):
+            path += MACRO_EXTENSION
+        try:
+            macro.save(path)
+        except OSError as error:
+            self.statusbar.showMessage("Не удалось сохранить макрос: {}".format(error), 5000)
+            return
+        self.macro_path = path
+        self.statusbar.showMessage("Макрос сохранен: {}, операций: {}".format(path, len(macro)), 5000)
+
+    def replay_macro(self):
+        """
+        Метод, связанный с пунктом "Применить макрос к папке" контекстного меню кнопки ButtonLoad
+        и сочетанием Ctrl+Shift+R: применяет макрос ко всем изображениям папки пакетной обработкой
+        (python -m photo_editor batch) в отдельном процессе с пулом процессов, ход и скорость
+        показываются в строке состояния
+        """
+        if self.macro_process is not None:
+            self.statusbar.showMessage("Макрос уже применяется", 3000)
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Открыть макрос", self.macro_path or "",
+                                                        "Макрос (*{})".format(MACRO_EXTENSION))
+        if not path:
+            return
+        try:
+            Macro.load(path)
+        except (OSError, ValueError) as error:
+            self.statusbar.showMessage("Не удалось прочитать макрос: {}".format(error), 5000)
+            return
+        source = QtWidgets.QFileDialog.getExistingDirectory(self, "Папка с изображениями")
+        if not source:
+            return
+        output = QtWidgets.QFileDialog.getExistingDirectory(self, "Папка для результатов")
+        if not output:
+            return
+        self.macro_path = path
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment = QtCore.QProcessEnvironment.systemEnvironment()
+        environment.insert('PYTHONPATH', os.pathsep.join(filter(None, [package_root, environment.value('PYTHONPATH')])))
+        # Вывод процесса читается как UTF-8; без этого Python в Windows пишет в канал в кодовой странице системы
+        environment.insert('PYTHONIOENCODING', 'utf-8')
+        self.macro_process = QtCore.QProcess(self)
+        self.macro_process.setProcessEnvironment(environment)
+        self.macro_process.readyReadStandardError.connect(self.show_macro_progress)
+        self.macro_process.finished.connect(self.finish_macro)
+        self.macro_process.start(sys.executable, ['-m', 'photo_editor', 'batch', source, '--macro', path,
+                                                  '-o', output])
+        self.statusbar.showMessage("Применение макроса...")
+
+    def show_macro_progress(self):
+        """
+        Показывает ход применения макроса (строки "готово/всего" пакетной обработки)
+        """
+        lines = bytes(self.macro_process.readAllStandardError()).decode('utf-8', 'replace').splitlines()
+        progress = [line for line in lines if line.partition('/')[0].isdigit()]
+        if progress:
+            self.statusbar.showMessage("Применение макроса: {}".format(progress[-1]))
+
+    def finish_macro(self, exit_code, exit_status):
+        """
+        Показывает итог применения макроса: количество изображений, ошибок и скорость
+        """
+        process, self.macro_process = self.macro_process, None
+        output = bytes(process.readAllStandardOutput()).decode('utf-8', 'replace').strip().splitlines()
+        errors = bytes(process.readAllStandardError()).decode('utf-8', 'replace').strip().splitlines()
+        if exit_status == QtCore.QProcess.NormalExit and output:
+            self.statusbar.showMessage("Макрос применен. {}".format(output[-1]), 10000)
+        else:
+            self.statusbar.showMessage("Не удалось применить макрос: {}".format(
+                errors[-1] if errors else process.errorString()), 10000)
+        process.deleteLater()
 
     def updateIcons(self):
         """
@@ -682,56 +1173,190 @@ class MainWindow(QtWidgets.QMainWindow):
         self.BackSignal.emit()
         self.ForwardSignal.emit()
 
-    def add_action_to_history(self, cv2_photo):
+    def add_action_to_history(self, cv2_photo, action=None):
         """
         Метод, добавляющий изображение в cv2 формате в очередь прошлых действий
         :param cv2_photo: фото в формате cv2(многомерный список)
+        :param action: операция, которая привела к изображению, - кортеж (имя, аргументы),
+            None для загруженного или снятого фото
         :return:
         """
-        self.history.append(cv2_photo)
-        self.future.clear()
+        self.history.push(cv2_photo, action)
+        for key in self.workspace.active.push_state(self.picture_module.state):
+            self.pixmap_cache.discard(key)
+        # Показанное изображение нового состояния сразу попадает в кэш для отмены и повтора
+        self.pixmap_cache.put(self.workspace.active.key, self.picture_module.qt_picture)
+        self.tabDocuments.setTabText(self.workspace.documents.index(self.workspace.active),
+                                     self.workspace.active.title)
+        self.workspace.enforce()
         self.updateIcons()
 
     def changeIconBack(self):
         """Меняет иконку кнопки "Отменить действие" """
-        if len(self.history) > 1:
-            self.ButtonBack.setIcon(QIcon("icons/icons8-up-left-32.png"))
+        if self.history.can_undo():
+            self.ButtonBack.setIcon(icon("icons/icons8-up-left-32.png"))
             self.ButtonBack.setIconSize(QtCore.QSize(32, 16))
         else:
-            self.ButtonBack.setIcon(QIcon("icons/pressed_icons8-up-left-32.png"))
+            self.ButtonBack.setIcon(icon("icons/pressed_icons8-up-left-32.png"))
             self.ButtonBack.setIconSize(QtCore.QSize(32, 16))
 
     def changeIconForward(self):
         """"Меняет иконку кнопки "Отменить отмену действия" """
-        if self.future:
-            self.ButtonForward.setIcon(QIcon("icons/icon_forward.png"))
+        if self.history.can_redo():
+            self.ButtonForward.setIcon(icon("icons/icon_forward.png"))
             self.ButtonForward.setIconSize(QtCore.QSize(32, 16))
         else:
-            self.ButtonForward.setIcon(QIcon("icons/pressed_icon_forward.png"))
+            self.ButtonForward.setIcon(icon("icons/pressed_icon_forward.png"))
             self.ButtonForward.setIconSize(QtCore.QSize(32, 16))
 
+    def commit_operation(self, image, qimage, action, rect=None):
+        """
+        Показывает результат операции, выполненной в фоновом потоке, и добавляет его в историю.
+        Если операция изменила только часть изображения, эта часть дорисовывается в копию
+        показанного изображения и перерисовывается только она
+
+        :param image: результат в формате cv2
+        :param qimage: результат, подготовленный для отображения, или только измененная область
+        :type qimage: QtGui.QImage
+        :param action: выполненная операция или список объединенных операций
+        :param rect: измененная область (x, y, ширина, высота), None - изменено все изображение
+        """
+        operations = action_operations(action)
+        timings = self.operation_runner.last_timings
+        name = '+'.join(operation for operation, _ in operations)
+        with self.metrics.action(name, timings['submitted']) as metric:
+            for stage in ('queue', 'operation', 'convert'):
+                metric.add(stage, timings[stage])
+            # Изображение предыдущего состояния - то, к которому применялась операция
+            previous = self.picture_module.qt_picture if rect is not None else None
+            self.picture_module.picture = image
+            self.picture_module.record(operations)
+            region = None
+            with metric.stage('pixmap'):
+                if previous is None:
+                    self.picture_module.qt_picture = QtGui.QPixmap.fromImage(qimage)
+                else:
+                    self.picture_module.qt_picture, region = patch_pixmap(previous, qimage, rect,
+                                                                          (image.shape[1], image.shape[0]))
+            self.show_pixmap(self.picture_module.qt_picture, metric, region)
+            with metric.stage('history'):
+                proxy_operations = self.picture_module.proxy_operations(operations)
+                self.add_action_to_history(image, proxy_operations if isinstance(action, list) else proxy_operations[0])
+
+    def cancel_operation(self):
+        """Метод, связанный с кнопкой ButtonCancel("Отмена") и клавишей Esc, отменяет выполняемые операции"""
+        if self.operation_runner.busy:
+            self.operation_runner.cancel()
+            self.statusbar.showMessage("Операция отменена", 2000)
+
+    def show_progress(self):
+        """Показывает индикатор выполнения операции и кнопку отмены"""
+        self.progressBar.show()
+        self.ButtonCancel.show()
+
+    def hide_progress(self):
+        """Скрывает индикатор выполнения операции и кнопку отмены"""
+        self.progressBar.hide()
+        self.ButtonCancel.hide()
+
+    def show_pixmap(self, pixmap, action, region=None):
+        """
+        Показывает изображение в mainPicture. При включенном замере времени виджет
+        перерисовывается сразу, чтобы учесть масштабирование изображения в Qt
+        :param pixmap: изображение
+        :type pixmap: QtGui.QPixmap
+        :param action: замер текущего действия (Metrics.action)
+        :param region: область, которой изображение отличается от показанного (QtCore.QRect);
+            None - перерисовывается все изображение
+        """
+        with action.stage('paint'):
+            if region is None:
+                self.mainPicture.setPixmap(pixmap)
+                area = self.mainPicture.rect()
+            else:
+                area = self.mainPicture.update_region(pixmap, region)
+            if self.metrics.enabled:
+                self.mainPicture.repaint(area)
+
+    def show_metrics(self, breakdown):
+        """
+        Показывает разбивку времени последнего действия в строке состояния
+        :param breakdown: разбивка действия (Metrics.last)
+        """
+        self.metricsLabel.setText(format_breakdown(breakdown, METRIC_NAMES))
+
     def undo(self):
         """Метод, связанный с кнопкой ButtonBack("Отменить действие"), отменяет действие:)"""
-        if len(self.history) > 1:
-            self.future.append(self.history.pop())
-            previous_action = self.history[-1]
-            self.picture_module.picture = previous_action
-            pixmap = Picture.convert_cv_qt(previous_action)
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
+        self.operation_runner.cancel()
+        if self.history.can_undo():
+            with self.metrics.action('undo') as action:
+                with action.stage('history'):
+                    previous_action = self.history.undo()
+                    self.picture_state_index -= 1
+                    self.picture_module.restore(previous_action, self.picture_states[self.picture_state_index])
+                with action.stage('convert'):
+                    pixmap = self.display_pixmap(previous_action)
+                self.show_pixmap(pixmap, action)
             self.updateIcons()
 
     def forward(self):
         """Метод, связанный с кнопкой ButtonForward("Отменить отмену действия"), отменяет отмену действия:)"""
-        if self.future:
-            next_action = self.future.pop()
-            self.history.append(next_action)
-            self.picture_module.picture = next_action
-            pixmap = Picture.convert_cv_qt(next_action)
-            self.mainPicture.setPixmap(pixmap)
-            self.mainPicture.setScaledContents(True)
+        self.operation_runner.cancel()
+        if self.history.can_redo():
+            with self.metrics.action('redo') as action:
+                with action.stage('history'):
+                    next_action = self.history.redo()
+                    self.picture_state_index += 1
+                    self.picture_module.restore(next_action, self.picture_states[self.picture_state_index])
+                with action.stage('convert'):
+                    pixmap = self.display_pixmap(next_action)
+                self.show_pixmap(pixmap, action)
             self.updateIcons()
 
+    def screen_pixmap(self):
+        """
+        Возвращает изображение активного документа для отображения. Без рабочей копии оно
+        уменьшается до размера экрана, чтобы обновление области после операции (patch_pixmap)
+        копировало изображение размером не больше экрана
+        :rtype: QtGui.QPixmap
+        """
+        if not self.picture_module.proxied:
+            self.picture_module.qt_picture = make_display_pixmap(self.picture_module.picture, self.screen_size())
+        return self.picture_module.qt_picture
+
+    def display_pixmap(self, image):
+        """
+        Возвращает изображение текущего состояния истории для отображения: из кэша или,
+        если его там нет, строит изображение размером не больше экрана и кладет его в кэш
+        :param image: изображение текущего состояния в формате cv2
+        :return: изображение для отображения
+        :rtype: QtGui.QPixmap
+        """
+        pixmap = self.pixmap_cache.load(self.workspace.active.key, image, self.screen_size())
+        self.picture_module.qt_picture = pixmap
+        return pixmap
+
+    def closeEvent(self, event):
+        """
+        Обрабатывает событие закрытия окна, освобождает память и временные файлы истории изменений,
+        записывает метрики сессии.
+
+        :param event: Событие закрытия.
+        :type event: QtCore.QEvent
+        """
+        self.operation_runner.cancel()
+        if self.macro_process is not None:
+            self.macro_process.kill()
+            self.macro_process.waitForFinished()
+        if self.gallery is not None:
+            self.gallery.shutdown()
+        self.load_runner.wait()
+        self.task_runner.wait()
+        self.workspace.close()
+        self.pixmap_cache.clear()
+        self.metrics.dump()
+        event.accept()
+
     def retranslateUi(self):
         """
         Устанавливает текст для элементов интерфейса.
@@ -745,3 +1370,9 @@ class MainWindow(QtWidgets.QMainWindow):
                                                               "круг"))
         self.TextAShowNegative.setText(_translate("MainWindow", "Показать негативное\n"
                                                                 "изображение"))
+        self.ButtonCancel.setText(_translate("MainWindow", "Отмена"))
+        self.actionGallery.setText(_translate("MainWindow", "Открыть папку в галерее"))
+        self.actionImportCircles.setText(_translate("MainWindow", "Нарисовать круги из файла..."))
+        self.actionRecordMacro.setText(_translate("MainWindow", "Записывать макрос"))
+        self.actionReplayMacro.setText(_translate("MainWindow", "Применить макрос к папке..."))
+        self.macroLabel.setText(_translate("MainWindow", "● Запись макроса"))